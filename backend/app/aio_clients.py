@@ -0,0 +1,404 @@
+"""
+Variante assíncrona dos clientes AR/AV (grpc.aio / asyncio).
+
+Os endpoints FastAPI usam estes clientes para não ocuparem uma thread do pool do Starlette
+durante a ida-e-volta ao serviço remoto. Cada chamada tem deadline próprio (deadline_for)
+e pode ser cancelada (ex.: quando o cliente HTTP desliga).
+"""
+import asyncio
+import json
+import shutil
+import time
+from typing import Any, Dict, List
+
+from .balancer import routed, targets_for
+from .grpc_clients import (
+    BASE_DIR,
+    GRPC_POOL_SIZE,
+    GRPCURL_BIN,
+    GRPC_TRANSPORT,
+    VOTER_PROTO_NAME,
+    VOTING_PROTO_NAME,
+    GrpcurlError,
+    _ChannelPool,
+    _grpcurl_cmd,
+    _dict_to_message,
+    _grpcurl_not_found,
+    _message_to_dict,
+    _method_table,
+    _parse_grpcurl_output,
+    deadline_for,
+    use_protoset,
+)
+from .metrics import method_name, track_upstream
+from .resilience import (
+    HEDGE_READS,
+    HEDGEABLE_METHODS,
+    breaker_for,
+    hedged,
+    latency_for,
+    limiter_for,
+    priority_for,
+)
+from .tracing import span
+
+
+class AsyncGrpcurlTransport:
+    """
+    grpcurl sem bloquear o event loop (asyncio.create_subprocess_exec).
+    Em caso de cancelamento ou deadline, o processo é terminado.
+    """
+
+    name = "grpcurl"
+
+    async def call(self, proto_name: str, full_method: str, payload: Dict[str, Any],
+                   timeout: float | None = None) -> Dict[str, Any]:
+        with routed(full_method) as endpoint:
+            return await self._run(proto_name, full_method, payload, timeout, endpoint.target, endpoint.authority)
+
+    async def _run(self, proto_name: str, full_method: str, payload: Dict[str, Any] | List[Dict[str, Any]],
+                   timeout: float | None, target: str, authority: str) -> Dict[str, Any]:
+        try:
+            with span("spawn"):
+                p = await asyncio.create_subprocess_exec(
+                    *_grpcurl_cmd(proto_name, full_method, timeout, target, authority),
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=str(BASE_DIR),
+                )
+        except FileNotFoundError as e:
+            raise _grpcurl_not_found(e) from e
+
+        try:
+            with span("grpcurl"):
+                # Client-streaming: uma mensagem JSON por linha no stdin (o grpcurl envia cada uma no stream).
+                stdin = "\n".join(map(json.dumps, payload)) if isinstance(payload, list) else json.dumps(payload)
+                stdout, stderr = await asyncio.wait_for(p.communicate(stdin.encode()), timeout)
+        except asyncio.TimeoutError as e:
+            raise GrpcurlError(f"Deadline excedido ({timeout:g}s) em {full_method}") from e
+        finally:
+            if p.returncode is None:
+                p.kill()
+                await p.wait()
+
+        return _parse_grpcurl_output(p.returncode, stdout.decode(), stderr.decode())
+
+    async def call_raw(self, proto_name: str, full_method: str, payload: Dict[str, Any],
+                       timeout: float | None = None) -> bytes:
+        data = await self.call(proto_name, full_method, payload, timeout)
+        return _dict_to_message(full_method, data).SerializeToString(deterministic=True)
+
+    async def call_stream_raw(self, proto_name: str, full_method: str, payloads: List[Dict[str, Any]],
+                              timeout: float | None = None) -> bytes:
+        """
+        Client-streaming: envia 'payloads' no mesmo stream e devolve os bytes da resposta única.
+        """
+        return await self.call_raw(proto_name, full_method, payloads, timeout)
+
+    async def stream_raw(self, proto_name: str, full_method: str, payload: Dict[str, Any]):
+        """
+        Server-streaming: o processo grpcurl fica aberto (sem -max-time) e cada mensagem JSON que
+        escreve no stdout é devolvida em bytes protobuf assim que fica completa.
+        """
+        with routed(full_method) as endpoint:
+            try:
+                p = await asyncio.create_subprocess_exec(
+                    *_grpcurl_cmd(proto_name, full_method, None, endpoint.target, endpoint.authority),
+                    stdin=asyncio.subprocess.PIPE,
+                    stdout=asyncio.subprocess.PIPE,
+                    stderr=asyncio.subprocess.PIPE,
+                    cwd=str(BASE_DIR),
+                )
+            except FileNotFoundError as e:
+                raise _grpcurl_not_found(e) from e
+
+            try:
+                p.stdin.write(json.dumps(payload).encode())
+                await p.stdin.drain()
+                p.stdin.close()
+                lines = []
+                async for line in p.stdout:
+                    lines.append(line)
+                    # Cada mensagem termina numa linha sem indentação acabada em "}" (JSON formatado).
+                    if line[:1] not in (b" ", b"\t") and line.rstrip().endswith(b"}"):
+                        data = _parse_grpcurl_output(0, b"".join(lines).decode(), "")
+                        lines = []
+                        yield _dict_to_message(full_method, data).SerializeToString(deterministic=True)
+                stderr = await p.stderr.read()
+                await p.wait()
+                _parse_grpcurl_output(p.returncode, b"".join(lines).decode(), stderr.decode())
+            finally:
+                if p.returncode is None:
+                    p.kill()
+                    await p.wait()
+
+    async def warm_up(self, full_methods: List[str], timeout: float) -> None:
+        """
+        Aquecimento do arranque: confirma que o grpcurl existe e gera o protoset (ver use_protoset).
+        """
+        if shutil.which(GRPCURL_BIN) is None:
+            raise _grpcurl_not_found(FileNotFoundError(GRPCURL_BIN))
+        use_protoset()
+
+    async def close(self) -> None:
+        pass
+
+
+class AsyncGrpcTransport:
+    """
+    Canais grpc.aio persistentes: um pool round-robin por destino, escolhido pelo balanceador.
+    Os canais são criados dentro do event loop, na primeira chamada a cada destino.
+    """
+
+    name = "grpc"
+
+    def __init__(self, pool_size: int = GRPC_POOL_SIZE):
+        import grpc
+        import grpc.aio
+
+        self._grpc = grpc
+        self.pool_size = pool_size
+        self._methods = _method_table()
+        self._pools: Dict[str, _ChannelPool] = {}
+
+    def _pool(self, endpoint) -> _ChannelPool:
+        pool = self._pools.get(endpoint.target)
+        if pool is None:
+            pool = self._pools[endpoint.target] = _ChannelPool(self._grpc.aio, endpoint, self.pool_size)
+        return pool
+
+    def _method(self, full_method: str) -> tuple:
+        try:
+            return self._methods[full_method]
+        except KeyError as e:
+            raise GrpcurlError(f"Método gRPC desconhecido: {full_method}") from e
+
+    async def call(self, proto_name: str, full_method: str, payload: Dict[str, Any],
+                   timeout: float | None = None) -> Dict[str, Any]:
+        stub_cls, method_name, request_cls, _ = self._method(full_method)
+        with routed(full_method) as endpoint:
+            rpc = getattr(self._pool(endpoint).stub(stub_cls), method_name)
+            try:
+                with span("rpc"):
+                    response = await rpc(request_cls(**payload), timeout=timeout)
+            except self._grpc.aio.AioRpcError as e:
+                raise GrpcurlError(
+                    f"Falha gRPC (code={e.code().name}). Detalhe: {e.details()}"
+                ) from e
+        return _message_to_dict(response)
+
+    async def call_raw(self, proto_name: str, full_method: str, payload: Dict[str, Any],
+                       timeout: float | None = None) -> bytes:
+        _, _, request_cls, _ = self._method(full_method)
+        with routed(full_method) as endpoint:
+            rpc = self._pool(endpoint).raw_rpc(full_method, request_cls)
+            try:
+                with span("rpc"):
+                    return await rpc(request_cls(**payload), timeout=timeout)
+            except self._grpc.aio.AioRpcError as e:
+                raise GrpcurlError(
+                    f"Falha gRPC (code={e.code().name}). Detalhe: {e.details()}"
+                ) from e
+
+    async def call_stream_raw(self, proto_name: str, full_method: str, payloads: List[Dict[str, Any]],
+                              timeout: float | None = None) -> bytes:
+        """
+        Client-streaming: envia 'payloads' no mesmo stream e devolve os bytes da resposta única.
+        """
+        _, _, request_cls, _ = self._method(full_method)
+        with routed(full_method) as endpoint:
+            rpc = self._pool(endpoint).raw_client_stream(full_method, request_cls)
+            try:
+                with span("rpc"):
+                    return await rpc(iter([request_cls(**p) for p in payloads]), timeout=timeout)
+            except self._grpc.aio.AioRpcError as e:
+                raise GrpcurlError(
+                    f"Falha gRPC (code={e.code().name}). Detalhe: {e.details()}"
+                ) from e
+
+    async def stream_raw(self, proto_name: str, full_method: str, payload: Dict[str, Any]):
+        """
+        Server-streaming sem deadline (a ligação é vigiada pelo keepalive); devolve os bytes de cada mensagem.
+        """
+        _, _, request_cls, _ = self._method(full_method)
+        with routed(full_method) as endpoint:
+            call = self._pool(endpoint).raw_stream(full_method, request_cls)(request_cls(**payload))
+            try:
+                async for raw in call:
+                    yield raw
+            except self._grpc.aio.AioRpcError as e:
+                raise GrpcurlError(
+                    f"Falha gRPC (code={e.code().name}). Detalhe: {e.details()}"
+                ) from e
+            finally:
+                call.cancel()
+
+    async def warm_up(self, full_methods: List[str], timeout: float) -> None:
+        """
+        Aquecimento do arranque: abre os canais de todos os destinos dos serviços de 'full_methods'
+        e espera pela ligação (TCP, TLS, HTTP/2). Falha se algum serviço não tiver nenhum destino ligado.
+        """
+        for full_method in full_methods:
+            endpoints = targets_for(full_method).endpoints
+            results = await asyncio.gather(*(self._connect(e, timeout) for e in endpoints), return_exceptions=True)
+            if all(isinstance(r, BaseException) for r in results):
+                targets = ", ".join(e.target for e in endpoints)
+                raise GrpcurlError(f"Sem ligação a {full_method.rsplit('/', 1)[0]} ({targets})")
+
+    async def _connect(self, endpoint, timeout: float) -> None:
+        pool = self._pool(endpoint)
+        pool.open()
+        await asyncio.wait_for(asyncio.gather(*(channel.channel_ready() for channel in pool.channels)), timeout)
+
+    async def close(self) -> None:
+        pools, self._pools = self._pools, {}
+        for pool in pools.values():
+            for channel in pool.channels:
+                await channel.close()
+
+
+_transport = None
+
+
+def get_async_transport():
+    """
+    Devolve o transporte assíncrono partilhado, escolhido por GRPC_TRANSPORT.
+    """
+    global _transport
+    if _transport is None:
+        if GRPC_TRANSPORT == "grpc":
+            _transport = AsyncGrpcTransport()
+        elif GRPC_TRANSPORT == "grpcurl":
+            _transport = AsyncGrpcurlTransport()
+        else:
+            raise GrpcurlError(f"GRPC_TRANSPORT inválido: {GRPC_TRANSPORT!r} (usar 'grpc' ou 'grpcurl')")
+    return _transport
+
+
+async def close_async_transport() -> None:
+    global _transport
+    if _transport is not None:
+        await _transport.close()
+        _transport = None
+
+
+class _AsyncClient:
+    def __init__(self, transport=None):
+        self._transport = transport
+
+    @property
+    def transport(self):
+        return self._transport or get_async_transport()
+
+    async def _call(self, proto_name: str, full_method: str, payload: Dict[str, Any] | List[Dict[str, Any]],
+                    raw: bool = False):
+        """
+        Devolve o dicionário da resposta ou, com raw=True, os bytes protobuf da resposta.
+        Com uma lista de payloads, a chamada é client-streaming (um pedido por elemento; sempre raw).
+        """
+        breaker = breaker_for(full_method)
+        limiter = limiter_for(full_method)
+        latency = latency_for(full_method)
+        timeout = deadline_for(full_method)
+
+        async def attempt():
+            t0 = time.perf_counter()
+            with track_upstream(full_method):
+                if isinstance(payload, list):
+                    call = self.transport.call_stream_raw
+                else:
+                    call = self.transport.call_raw if raw else self.transport.call
+                result = await call(proto_name, full_method, payload, timeout=timeout)
+            latency.record(time.perf_counter() - t0)
+            return result
+
+        # Pode recusar de imediato (OverloadedError) sem chegar a contactar o serviço.
+        with span("queue"):
+            await limiter.acquire(priority_for(full_method))
+        rtt, dropped = None, False
+        try:
+            breaker.before_call()
+            t0 = time.perf_counter()
+            try:
+                if HEDGE_READS and method_name(full_method) in HEDGEABLE_METHODS:
+                    result = await hedged(full_method, attempt)
+                else:
+                    result = await attempt()
+            except GrpcurlError:
+                breaker.on_failure()
+                dropped = True
+                raise
+            except asyncio.CancelledError:
+                breaker.on_cancel()
+                raise
+            except Exception:
+                # Ex.: grpcurl que não arranca ou resposta que não descodifica. Conta como falha
+                # (sem reduzir o limite) e liberta a sonda do HALF_OPEN.
+                breaker.on_failure()
+                raise
+            breaker.on_success()
+            rtt = time.perf_counter() - t0
+            return result
+        finally:
+            limiter.release(rtt, dropped)
+
+
+class AsyncRegistrationClient(_AsyncClient):
+    async def issue_credential(self, citizen_card_number: str, raw: bool = False):
+        return await self._call(
+            VOTER_PROTO_NAME,
+            "voting.VoterRegistrationService/IssueVotingCredential",
+            {"citizen_card_number": citizen_card_number},
+            raw=raw,
+        )
+
+
+class AsyncVotingClient(_AsyncClient):
+    async def get_candidates(self, raw: bool = False):
+        # raw=True: bytes protobuf da resposta, tal como recebidos do AV.
+        data = await self._call(
+            VOTING_PROTO_NAME,
+            "voting.VotingService/GetCandidates",
+            {},
+            raw=raw,
+        )
+        return data if raw else data.get("candidates", [])
+
+    async def vote(self, voting_credential: str, candidate_id: int, raw: bool = False):
+        return await self._call(
+            VOTING_PROTO_NAME,
+            "voting.VotingService/Vote",
+            {"voting_credential": voting_credential, "candidate_id": candidate_id},
+            raw=raw,
+        )
+
+    async def get_results(self, raw: bool = False):
+        # raw=True: bytes protobuf da resposta, tal como recebidos do AV.
+        data = await self._call(
+            VOTING_PROTO_NAME,
+            "voting.VotingService/GetResults",
+            {},
+            raw=raw,
+        )
+        return data if raw else data.get("results", [])
+
+    async def batch_vote(self, votes: List[tuple]) -> bytes:
+        """
+        Vários votos (credencial, candidate_id) numa única chamada BatchVote (client-streaming).
+        Devolve os bytes do BatchVoteResponse: um VoteResponse por voto, pela mesma ordem.
+        """
+        return await self._call(
+            VOTING_PROTO_NAME,
+            "voting.VotingService/BatchVote",
+            [{"voting_credential": credential, "candidate_id": candidate_id} for credential, candidate_id in votes],
+            raw=True,
+        )
+
+    def watch_results(self):
+        """
+        Stream WatchResults: bytes de cada GetResultsResponse enviado pelo AV. É uma ligação de longa
+        duração, por isso fica fora do limitador e do circuit breaker; as falhas são tratadas por quem
+        consome o stream (live.ResultsBroadcaster).
+        """
+        return self.transport.stream_raw(VOTING_PROTO_NAME, "voting.VotingService/WatchResults", {})
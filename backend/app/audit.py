@@ -0,0 +1,125 @@
+"""
+Registo de auditoria dos votos submetidos ao AV (AUDIT_LOG_PATH; vazio desativa).
+
+Ficheiro binário só de acrescento: um cabeçalho de 32 bytes seguido de registos de 32 bytes,
+
+    offset  tamanho  campo
+    0       8        instante (µs desde a época, uint64 LE)
+    8       16       digest da credencial (BLAKE2b-128, como em credentials.py)
+    24      4        candidate_id (int32 LE, como no .proto)
+    28      1        estado: 0 recusado pelo AV, 1 aceite, 2 sem resposta (erro de transporte ou cliente desligado)
+    29      3        reservado (zeros)
+
+append() só copia o registo para um buffer em memória; uma thread escreve o buffer e faz fsync
+a cada AUDIT_FLUSH_MS (group commit), pelo que /vote não espera pelo disco. Num crash perdem-se
+no máximo os registos dos últimos AUDIT_FLUSH_MS. Recontagem: python -m tools.recount.
+"""
+import os
+import struct
+import threading
+import time
+
+from .credentials import _lock_file, _unlock_file, credential_digest
+from .metrics import Counter, Gauge, Histogram
+
+AUDIT_LOG_PATH = os.getenv("AUDIT_LOG_PATH", "")
+AUDIT_FLUSH_MS = float(os.getenv("AUDIT_FLUSH_MS", "10"))
+
+MAGIC = b"VSAUDIT1"
+VERSION = 1
+HEADER = struct.Struct("<8sII16x")
+RECORD = struct.Struct("<Q16siB3x")
+
+REJECTED, ACCEPTED, ERROR = 0, 1, 2
+_STATUS_NAMES = {REJECTED: "rejected", ACCEPTED: "accepted", ERROR: "error"}
+
+AUDIT_RECORDS = Counter("audit_records_total", "Registos escritos no registo de auditoria.", ("status",))
+AUDIT_PENDING = Gauge("audit_pending_records", "Registos em memória à espera de escrita/fsync.")
+AUDIT_FAILURES = Counter("audit_failures_total", "Votos que não foi possível acrescentar ao registo de auditoria.")
+AUDIT_FLUSH = Histogram("audit_flush_duration_seconds", "Duração de cada escrita + fsync do registo de auditoria.")
+
+
+class AuditLog:
+    def __init__(self, path: str = AUDIT_LOG_PATH, flush_s: float = AUDIT_FLUSH_MS / 1000):
+        self.path = path
+        self.flush_s = flush_s
+        flags = os.O_RDWR | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0)
+        self._file = open(os.open(path, flags, 0o640), "r+b", buffering=0)
+        self._fd = self._file.fileno()
+        # Com vários workers no mesmo ficheiro, a verificação (e o corte de um registo incompleto)
+        # e cada escrita são feitas com o lock do ficheiro: nunca se corta a escrita de outro worker.
+        _lock_file(self._file)
+        try:
+            compatible = self._prepare()
+        finally:
+            _unlock_file(self._file)
+        if not compatible:
+            self._file.close()
+            raise ValueError(f"{path} não é um registo de auditoria compatível")
+
+        self._buf = bytearray()
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="audit-log", daemon=True)
+        self._thread.start()
+
+    def _prepare(self) -> bool:
+        header = HEADER.pack(MAGIC, VERSION, RECORD.size)
+        size = self._file.seek(0, os.SEEK_END)
+        if size < HEADER.size:
+            # Ficheiro novo (ou crash a meio da escrita do cabeçalho).
+            self._file.seek(0)
+            if not header.startswith(self._file.read(size)):
+                return False
+            self._file.truncate(0)
+            os.write(self._fd, header)
+            os.fsync(self._fd)
+            return True
+        self._file.seek(0)
+        magic, version, record_size = HEADER.unpack(self._file.read(HEADER.size))
+        if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+            return False
+        # Um registo incompleto no fim (crash a meio de uma escrita) é descartado.
+        whole = HEADER.size + (size - HEADER.size) // RECORD.size * RECORD.size
+        if whole != size:
+            self._file.truncate(whole)
+        return True
+
+    def append(self, credential: str, candidate_id: int, status: int) -> None:
+        record = RECORD.pack(time.time_ns() // 1000, credential_digest(credential), candidate_id, status)
+        with self._cond:
+            self._buf += record
+        AUDIT_RECORDS.labels(_STATUS_NAMES[status]).inc()
+
+    def _flush(self, data: bytes) -> None:
+        t0 = time.perf_counter()
+        view = memoryview(data)
+        _lock_file(self._file)
+        try:
+            while view:
+                view = view[os.write(self._fd, view):]
+        finally:
+            _unlock_file(self._file)
+        os.fsync(self._fd)
+        AUDIT_FLUSH.labels().observe(time.perf_counter() - t0)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._closed:
+                    self._cond.wait(self.flush_s)
+                data, self._buf = self._buf, bytearray()
+                closed = self._closed
+            AUDIT_PENDING.set(len(data) // RECORD.size)
+            if data:
+                self._flush(data)
+            AUDIT_PENDING.set(len(self._buf) // RECORD.size)
+            if closed:
+                return
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        self._file.close()
@@ -0,0 +1,270 @@
+"""
+Balanceamento do lado do cliente entre várias instâncias de cada serviço remoto (AR, AV).
+
+Cada serviço tem o seu conjunto de destinos:
+    GRPC_TARGETS_VOTER  -> voting.VoterRegistrationService
+    GRPC_TARGETS_VOTING -> voting.VotingService
+Lista separada por vírgulas de "host:porto" ou "dns:///host:porto" (todos os endereços do nome,
+resolvidos de novo a cada GRPC_DNS_REFRESH_S). Sem configuração, ambos usam GRPC_TARGET.
+
+- Escolha do destino (GRPC_LB_POLICY): round_robin ou least_outstanding (menos pedidos em curso).
+- Verificação ativa: ligação TCP a cada destino a cada GRPC_HEALTH_INTERVAL_S; destinos sem
+  resposta deixam de receber pedidos até voltarem a responder.
+- Ejeção passiva: após GRPC_EJECT_FAILURES falhas seguidas de transporte, o destino é afastado
+  durante GRPC_EJECT_S (multiplicado pelo número de ejeções seguidas, até 8x).
+Se nenhum destino estiver disponível, os pedidos são distribuídos por todos (em vez de falharem aqui).
+"""
+import asyncio
+import itertools
+import os
+import random
+import re
+import socket
+import threading
+import time
+from contextlib import contextmanager
+from typing import Dict, List
+
+from .metrics import Counter, GaugeFunc, Histogram, error_class
+
+GRPC_TARGETS_VOTER = os.getenv("GRPC_TARGETS_VOTER", "")
+GRPC_TARGETS_VOTING = os.getenv("GRPC_TARGETS_VOTING", "")
+GRPC_LB_POLICY = os.getenv("GRPC_LB_POLICY", "round_robin").strip().lower()
+GRPC_DNS_REFRESH_S = float(os.getenv("GRPC_DNS_REFRESH_S", "30"))
+GRPC_HEALTH_INTERVAL_S = float(os.getenv("GRPC_HEALTH_INTERVAL_S", "5"))
+GRPC_HEALTH_TIMEOUT_S = float(os.getenv("GRPC_HEALTH_TIMEOUT_S", "1"))
+GRPC_EJECT_FAILURES = int(os.getenv("GRPC_EJECT_FAILURES", "3"))
+GRPC_EJECT_S = float(os.getenv("GRPC_EJECT_S", "30"))
+
+_SERVICE_TARGETS = {
+    "voting.VoterRegistrationService": GRPC_TARGETS_VOTER,
+    "voting.VotingService": GRPC_TARGETS_VOTING,
+}
+
+# Códigos gRPC que são respostas do serviço (o destino está a funcionar) e não contam para a ejeção.
+_APPLICATION_CODES = {
+    "INVALID_ARGUMENT", "NOT_FOUND", "ALREADY_EXISTS", "PERMISSION_DENIED", "FAILED_PRECONDITION",
+    "OUT_OF_RANGE", "UNAUTHENTICATED", "UNIMPLEMENTED",
+}
+
+TARGET_LATENCY = Histogram(
+    "upstream_target_request_duration_seconds", "Latência das chamadas por destino AR/AV.", ("service", "target"))
+TARGET_EJECTIONS = Counter(
+    "upstream_target_ejections_total", "Destinos afastados após falhas seguidas.", ("service", "target"))
+TARGET_HEALTH_FAILURES = Counter(
+    "upstream_target_health_failures_total", "Verificações ativas falhadas por destino.", ("service", "target"))
+
+
+class Endpoint:
+    def __init__(self, target: str, authority: str = ""):
+        self.target = target
+        # Nome a usar no TLS/:authority quando o destino é um endereço resolvido por DNS.
+        self.authority = authority
+        self.outstanding = 0
+        self.healthy = True
+        self.failures = 0
+        self.ejections = 0
+        self.ejected_until = 0.0
+
+    def available(self, now: float) -> bool:
+        return self.healthy and now >= self.ejected_until
+
+
+def _split_host_port(hostport: str):
+    host, _, port = hostport.rpartition(":")
+    return host.strip("[]"), int(port)
+
+
+def _resolve(spec: str) -> List[Endpoint]:
+    endpoints: List[Endpoint] = []
+    for item in (s.strip() for s in spec.split(",")):
+        if not item:
+            continue
+        if not item.startswith("dns:"):
+            endpoints.append(Endpoint(item))
+            continue
+        hostport = item[4:].lstrip("/")
+        host, port = _split_host_port(hostport)
+        try:
+            infos = socket.getaddrinfo(host, port, type=socket.SOCK_STREAM)
+        except OSError:
+            continue
+        for addr in dict.fromkeys(info[4][0] for info in infos):
+            target = f"[{addr}]:{port}" if ":" in addr else f"{addr}:{port}"
+            endpoints.append(Endpoint(target, authority=host))
+    return endpoints
+
+
+class TargetSet:
+    """
+    Destinos de um serviço, com a política de escolha, o estado de saúde e a ejeção passiva.
+    Seguro para threads (clientes síncronos) e para o event loop.
+    """
+
+    def __init__(self, service: str, spec: str, policy: str = GRPC_LB_POLICY):
+        if policy not in ("round_robin", "least_outstanding"):
+            raise ValueError(f"GRPC_LB_POLICY inválido: {policy!r} (usar 'round_robin' ou 'least_outstanding')")
+        self.service = service
+        self.spec = spec
+        self.policy = policy
+        self.dynamic = "dns:" in spec
+        self._lock = threading.Lock()
+        self._rr = itertools.count()
+        self.endpoints = _resolve(spec)
+        self._resolved_at = time.monotonic()
+        if not self.endpoints:
+            raise ValueError(f"Sem destinos para {service}: {spec!r}")
+
+    def refresh(self, endpoints: List[Endpoint]) -> None:
+        """
+        Substitui a lista de destinos (nova resolução DNS), mantendo o estado dos que continuam.
+        """
+        if not endpoints:
+            return
+        with self._lock:
+            current = {e.target: e for e in self.endpoints}
+            self.endpoints = [current.get(e.target, e) for e in endpoints]
+            self._resolved_at = time.monotonic()
+
+    def acquire(self) -> Endpoint:
+        now = time.monotonic()
+        with self._lock:
+            endpoints = self.endpoints
+            candidates = [e for e in endpoints if e.available(now)] or endpoints
+            if self.policy == "least_outstanding":
+                endpoint = min(candidates, key=lambda e: (e.outstanding, random.random()))
+            else:
+                endpoint = candidates[next(self._rr) % len(candidates)]
+            endpoint.outstanding += 1
+        return endpoint
+
+    def release(self, endpoint: Endpoint, ok: bool | None, elapsed: float) -> None:
+        """
+        ok=True: resposta do serviço; ok=False: falha de transporte; None: chamada cancelada.
+        """
+        with self._lock:
+            endpoint.outstanding -= 1
+            if ok:
+                endpoint.failures = 0
+                endpoint.ejections = 0
+            elif ok is False:
+                endpoint.failures += 1
+                if endpoint.failures >= GRPC_EJECT_FAILURES and time.monotonic() >= endpoint.ejected_until:
+                    endpoint.ejections += 1
+                    endpoint.failures = 0
+                    endpoint.ejected_until = time.monotonic() + GRPC_EJECT_S * min(endpoint.ejections, 8)
+                    TARGET_EJECTIONS.labels(self.service, endpoint.target).inc()
+        if ok is not None:
+            TARGET_LATENCY.labels(self.service, endpoint.target).observe(elapsed)
+
+    async def check_health(self) -> None:
+        loop = asyncio.get_running_loop()
+        if self.dynamic and time.monotonic() - self._resolved_at >= GRPC_DNS_REFRESH_S:
+            self.refresh(await loop.run_in_executor(None, _resolve, self.spec))
+
+        async def probe(endpoint: Endpoint) -> None:
+            host, port = _split_host_port(endpoint.target)
+            try:
+                _, writer = await asyncio.wait_for(asyncio.open_connection(host, port), GRPC_HEALTH_TIMEOUT_S)
+            except (OSError, asyncio.TimeoutError):
+                endpoint.healthy = False
+                TARGET_HEALTH_FAILURES.labels(self.service, endpoint.target).inc()
+                return
+            writer.close()
+            endpoint.healthy = True
+
+        await asyncio.gather(*(probe(e) for e in list(self.endpoints)))
+
+
+_target_sets: Dict[str, TargetSet] = {}
+_target_sets_lock = threading.Lock()
+
+
+def targets_for(full_method: str) -> TargetSet:
+    service = full_method.rsplit("/", 1)[0]
+    targets = _target_sets.get(service)
+    if targets is None:
+        # Import tardio: grpc_clients importa este módulo.
+        from .grpc_clients import GRPC_TARGET
+
+        with _target_sets_lock:
+            targets = _target_sets.get(service)
+            if targets is None:
+                spec = _SERVICE_TARGETS.get(service) or GRPC_TARGET
+                targets = _target_sets[service] = TargetSet(service, spec)
+    return targets
+
+
+# O grpcurl indica o código no stderr em CamelCase (ex.: "Code: InvalidArgument").
+_GRPCURL_CODE = re.compile(r"Code: (\w+)")
+
+
+def _is_target_failure(exc: BaseException) -> bool:
+    code = error_class(exc)
+    match = _GRPCURL_CODE.search(str(exc))
+    if match:
+        code = re.sub(r"(?<!^)(?=[A-Z])", "_", match.group(1)).upper()
+    return code not in _APPLICATION_CODES
+
+
+@contextmanager
+def routed(full_method: str):
+    """
+    Escolhe o destino para uma chamada e regista o resultado (latência, falhas, pedidos em curso).
+    """
+    targets = targets_for(full_method)
+    endpoint = targets.acquire()
+    t0 = time.perf_counter()
+    ok = None
+    try:
+        yield endpoint
+        ok = True
+    except Exception as e:
+        ok = not _is_target_failure(e)
+        raise
+    finally:
+        targets.release(endpoint, ok, time.perf_counter() - t0)
+
+
+_health_task: asyncio.Task | None = None
+
+
+async def _health_loop() -> None:
+    while True:
+        for service in _SERVICE_TARGETS:
+            await targets_for(service + "/").check_health()
+        await asyncio.sleep(GRPC_HEALTH_INTERVAL_S)
+
+
+def start_health_checks() -> None:
+    global _health_task
+    if GRPC_HEALTH_INTERVAL_S > 0 and _health_task is None:
+        _health_task = asyncio.ensure_future(_health_loop())
+
+
+async def stop_health_checks() -> None:
+    global _health_task
+    if _health_task is not None:
+        _health_task.cancel()
+        try:
+            await _health_task
+        except asyncio.CancelledError:
+            pass
+        _health_task = None
+
+
+def _target_gauge(attr) -> Dict[tuple, float]:
+    now = time.monotonic()
+    return {
+        (service, e.target): float(attr(e, now))
+        for service, targets in list(_target_sets.items())
+        for e in list(targets.endpoints)
+    }
+
+
+TARGET_OUTSTANDING = GaugeFunc(
+    "upstream_target_requests_in_flight", "Chamadas em curso por destino AR/AV.", ("service", "target"),
+    lambda: _target_gauge(lambda e, now: e.outstanding))
+TARGET_UP = GaugeFunc(
+    "upstream_target_up", "Destino disponível (1) ou afastado/sem resposta (0).", ("service", "target"),
+    lambda: _target_gauge(lambda e, now: e.available(now)))
@@ -0,0 +1,122 @@
+"""
+Micro-lotes de votos para o AV (VOTE_BATCH_MAX > 1).
+
+Os /vote concorrentes juntam-se num lote, enviado numa única chamada BatchVote (client-streaming)
+quando atinge VOTE_BATCH_MAX votos ou quando passa VOTE_BATCH_WINDOW_US desde o primeiro voto
+do lote (0 = no fim da iteração atual do event loop). Cada VoteResponse volta ao pedido HTTP que
+o originou. O custo por chamada (cabeçalhos HTTP/2, deadline, limitador, despacho no servidor)
+passa a ser pago uma vez por lote em vez de uma vez por voto.
+
+Se o AV não implementar BatchVote (UNIMPLEMENTED), os votos passam a ser enviados um a um.
+"""
+import asyncio
+import os
+from typing import Awaitable, Callable, List, Set
+
+from .grpc_clients import GrpcurlError, is_unimplemented
+from .metrics import Counter, Histogram
+from .voting_pb2 import BatchVoteResponse
+
+# Tamanho máximo do lote (0 ou 1 desativa: um Vote por pedido) e janela de espera em microssegundos.
+VOTE_BATCH_MAX = int(os.getenv("VOTE_BATCH_MAX", "0"))
+VOTE_BATCH_WINDOW_US = float(os.getenv("VOTE_BATCH_WINDOW_US", "500"))
+
+BATCH_SIZE = Histogram(
+    "vote_batch_size", "Votos por chamada BatchVote.", buckets=(1, 2, 4, 8, 16, 32, 64, 128, 256, 512))
+BATCH_FLUSHES = Counter(
+    "vote_batch_flushes_total", "Lotes enviados, por motivo (size: lote cheio; timer: fim da janela).", ("reason",))
+
+
+class VoteBatcher:
+    """
+    'send_batch' envia [(credencial, candidate_id), ...] e devolve os bytes do BatchVoteResponse;
+    'send_one' envia um voto e devolve os bytes do VoteResponse (usado se o AV não tiver BatchVote).
+    """
+
+    def __init__(self, send_batch: Callable[[List[tuple]], Awaitable[bytes]],
+                 send_one: Callable[[str, int], Awaitable[bytes]],
+                 max_size: int = VOTE_BATCH_MAX, window_s: float = VOTE_BATCH_WINDOW_US / 1e6):
+        self._send_batch = send_batch
+        self._send_one = send_one
+        self.max_size = max_size
+        self.window_s = window_s
+        self.batching = True
+        self._pending: List[tuple] = []
+        self._timer: asyncio.TimerHandle | None = None
+        self._tasks: Set[asyncio.Task] = set()
+
+    async def vote(self, credential: str, candidate_id: int) -> bytes:
+        """
+        Bytes do VoteResponse deste voto, obtido num lote.
+        """
+        if not self.batching:
+            return await self._send_one(credential, candidate_id)
+        loop = asyncio.get_running_loop()
+        future = loop.create_future()
+        self._pending.append((credential, candidate_id, future))
+        if len(self._pending) >= self.max_size:
+            self._flush("size")
+        elif self._timer is None:
+            if self.window_s > 0:
+                self._timer = loop.call_later(self.window_s, self._flush, "timer")
+            else:
+                self._timer = loop.call_soon(self._flush, "timer")
+        # Se o pedido for cancelado antes do envio, o voto sai do lote (ver _flush).
+        return await future
+
+    def _flush(self, reason: str) -> None:
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+        batch = [item for item in self._pending if not item[2].done()]
+        self._pending = []
+        if not batch:
+            return
+        BATCH_FLUSHES.labels(reason).inc()
+        BATCH_SIZE.labels().observe(len(batch))
+        task = asyncio.ensure_future(self._send(batch))
+        self._tasks.add(task)
+        task.add_done_callback(self._tasks.discard)
+
+    async def _send(self, batch: List[tuple]) -> None:
+        try:
+            try:
+                raw = await self._send_batch([(credential, candidate_id) for credential, candidate_id, _ in batch])
+            except GrpcurlError as e:
+                if not is_unimplemented(e):
+                    raise
+                self.batching = False
+                await asyncio.gather(*(self._send_single(item) for item in batch))
+                return
+            results = BatchVoteResponse.FromString(raw).results
+            if len(results) != len(batch):
+                raise GrpcurlError(f"BatchVote devolveu {len(results)} respostas para {len(batch)} votos")
+        except asyncio.CancelledError:
+            for _, _, future in batch:
+                future.cancel()
+            raise
+        except Exception as e:
+            for _, _, future in batch:
+                if not future.done():
+                    future.set_exception(e)
+            return
+        for (_, _, future), result in zip(batch, results):
+            if not future.done():
+                future.set_result(result.SerializeToString())
+
+    async def _send_single(self, item: tuple) -> None:
+        credential, candidate_id, future = item
+        try:
+            result = await self._send_one(credential, candidate_id)
+        except Exception as e:
+            if not future.done():
+                future.set_exception(e)
+            return
+        if not future.done():
+            future.set_result(result)
+
+    async def close(self) -> None:
+        if self._pending:
+            self._flush("timer")
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
@@ -0,0 +1,356 @@
+"""
+Cache em processo para respostas do serviço AV que mudam raramente (ex.: lista de candidatos).
+
+- TTL: dentro do TTL o snapshot é servido sem contactar o AV.
+- stale-while-revalidate: depois do TTL (e dentro da janela 'stale') o snapshot antigo continua
+  a ser servido enquanto uma atualização corre em segundo plano.
+- single-flight: pedidos concorrentes sem snapshot válido partilham uma única chamada ao AV.
+
+Cada snapshot guarda também as respostas HTTP já codificadas (Snapshot.body): os pedidos seguintes
+escrevem esses bytes sem voltar a codificar (PRECOMPUTED_RESPONSES=0 desativa, para comparação).
+
+IdempotencyCache guarda respostas por chave (ex.: /register por cartão de cidadão), em LRU + TTL.
+"""
+import asyncio
+import hashlib
+import json
+import operator
+import os
+import time
+from collections import OrderedDict
+from dataclasses import dataclass, field, replace
+from typing import Any, Awaitable, Callable, Dict, FrozenSet, List
+
+from .metrics import CACHE_ENTRIES, CACHE_REQUESTS
+from .ranking import NameIndex, rank, rerank
+from .voting_pb2 import GetCandidatesResponse, GetResultsResponse
+
+PRECOMPUTED_RESPONSES = os.getenv("PRECOMPUTED_RESPONSES", "1") == "1"
+# Páginas codificadas guardadas por snapshot (LRU): as combinações de ?offset=/?limit= não têm limite.
+PAGE_BODIES_MAX = int(os.getenv("PAGE_BODIES_MAX", "64"))
+
+
+def make_etag(data: Any) -> str:
+    """
+    ETag forte a partir dos bytes da resposta (ou do JSON canónico, para outros dados).
+    """
+    if not isinstance(data, bytes):
+        data = json.dumps(data, sort_keys=True, separators=(",", ":"), ensure_ascii=False).encode("utf-8")
+    return '"' + hashlib.sha1(data).hexdigest()[:20] + '"'
+
+
+def etag_matches(if_none_match: str | None, etag: str) -> bool:
+    """
+    Compara o cabeçalho If-None-Match (lista separada por vírgulas, aceita W/ e '*') com o ETag.
+    """
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*" or tag.removeprefix("W/") == etag:
+            return True
+    return False
+
+
+@dataclass
+class Snapshot:
+    data: Any
+    etag: str
+    fetched_at: float = field(default_factory=time.monotonic)
+    # Bytes protobuf recebidos do AV (servidos tal como estão com Accept: application/x-protobuf).
+    raw: bytes = b""
+    # Respostas codificadas a partir deste snapshot (representação -> codec.Body).
+    bodies: Dict[Any, Any] = field(default_factory=dict)
+    # Páginas codificadas (chave -> codec.Body), as últimas PAGE_BODIES_MAX usadas.
+    pages: "OrderedDict[Any, Any]" = field(default_factory=OrderedDict)
+
+    def body(self, key: Any, encode: Callable[[], Any]):
+        """
+        Resposta 'key' codificada uma única vez por snapshot (encode() só corre no primeiro pedido).
+        """
+        if not PRECOMPUTED_RESPONSES:
+            return encode()
+        body = self.bodies.get(key)
+        if body is None:
+            body = self.bodies[key] = encode()
+        return body
+
+    def page_body(self, key: Any, encode: Callable[[], Any]):
+        """
+        Como body(), para chaves escolhidas pelo cliente (páginas): só as PAGE_BODIES_MAX usadas mais
+        recentemente ficam guardadas.
+        """
+        if not PRECOMPUTED_RESPONSES:
+            return encode()
+        body = self.pages.get(key)
+        if body is None:
+            body = self.pages[key] = encode()
+            if len(self.pages) > PAGE_BODIES_MAX:
+                self.pages.popitem(last=False)
+        else:
+            self.pages.move_to_end(key)
+        return body
+
+    def renewed(self):
+        """
+        Cópia com fetched_at atual, para quando o AV devolve o mesmo conteúdo: reutiliza as respostas
+        já codificadas, mas em dicionários próprios (não partilhados com o snapshot anterior).
+        """
+        return replace(self, fetched_at=time.monotonic(), bodies=dict(self.bodies), pages=OrderedDict(self.pages))
+
+
+class SnapshotCache:
+    def __init__(self, name: str, fetch: Callable[[], Awaitable[Any]], ttl: float, stale: float = 0.0):
+        self.name = name
+        self._fetch = fetch
+        self.ttl = ttl
+        self.stale = stale
+        self._snapshot: Snapshot | None = None
+        self._inflight: asyncio.Future | None = None
+        self._hit = CACHE_REQUESTS.labels(name, "hit")
+        self._stale = CACHE_REQUESTS.labels(name, "stale")
+        self._miss = CACHE_REQUESTS.labels(name, "miss")
+
+    def _make_snapshot(self, data: Any) -> Snapshot:
+        return Snapshot(data=data, etag=make_etag(data))
+
+    def peek(self) -> Snapshot | None:
+        """
+        Snapshot atual, sem contactar o AV (pode estar expirado ou ser None).
+        """
+        return self._snapshot
+
+    def invalidate(self) -> None:
+        self._snapshot = None
+
+    async def _load(self) -> Snapshot:
+        try:
+            snapshot = self._make_snapshot(await self._fetch())
+            self._snapshot = snapshot
+            return snapshot
+        finally:
+            self._inflight = None
+
+    def _refresh(self) -> asyncio.Future:
+        if self._inflight is None:
+            self._inflight = asyncio.ensure_future(self._load())
+            # Evita o aviso "exception was never retrieved" nas atualizações em segundo plano.
+            self._inflight.add_done_callback(lambda f: f.cancelled() or f.exception())
+        return self._inflight
+
+    async def get(self) -> Snapshot:
+        snapshot = self._snapshot
+        if snapshot is not None:
+            age = time.monotonic() - snapshot.fetched_at
+            if age < self.ttl:
+                self._hit.inc()
+                return snapshot
+            if age < self.ttl + self.stale:
+                self._stale.inc()
+                self._refresh()
+                return snapshot
+
+        self._miss.inc()
+        # shield: se este pedido for cancelado (cliente desligou), a chamada partilhada continua
+        # para os restantes pedidos em espera.
+        return await asyncio.shield(self._refresh())
+
+
+@dataclass
+class CandidateSnapshot(Snapshot):
+    ids: FrozenSet[int] = frozenset()
+    names: NameIndex | None = None
+
+    def name_index(self) -> NameIndex:
+        """
+        Índice de pesquisa por prefixo do nome, construído no primeiro pedido ?q= a este snapshot.
+        """
+        if self.names is None:
+            self.names = NameIndex(c.name for c in self.data)
+        return self.names
+
+
+class CandidateCache(SnapshotCache):
+    """
+    Cache da lista de candidatos, com o conjunto de ids para validar candidate_id localmente.
+    'fetch' devolve os bytes de GetCandidatesResponse; data é a lista de Candidate.
+    Se a lista não mudou, o snapshot anterior é mantido (com as respostas e o índice de nomes).
+    """
+
+    def _make_snapshot(self, raw: bytes) -> CandidateSnapshot:
+        previous = self._snapshot
+        if previous is not None and raw is previous.raw:
+            # Os mesmos bytes (memória partilhada sem versão nova): nem é preciso o hash.
+            return previous.renewed()
+        etag = make_etag(raw)
+        if previous is not None and previous.etag == etag:
+            return previous.renewed()
+        candidates = GetCandidatesResponse.FromString(raw).candidates
+        ids = frozenset(c.id for c in candidates)
+        return CandidateSnapshot(data=candidates, etag=etag, raw=raw, ids=ids)
+
+
+@dataclass
+class ResultsSnapshot(Snapshot):
+    version: int = 0
+    votes: Dict[int, int] = field(default_factory=dict)
+    # Votos por posição na lista do AV e ranking (chaves de ranking.rank), para ?order=votes e ?top=.
+    counts: List[int] = field(default_factory=list)
+    ranking: List[int] = field(default_factory=list)
+
+
+class ResultsCache(SnapshotCache):
+    """
+    Snapshots versionados dos resultados: no máximo uma chamada GetResults por intervalo (ttl),
+    independentemente do número de clientes. A versão só avança quando os resultados mudam;
+    as últimas 'history' versões são guardadas (id -> votos) para responder a pedidos delta.
+    Os snapshots também podem chegar por push (publish), a partir do stream WatchResults.
+    'fetch' devolve os bytes de GetResultsResponse; data é a lista de CandidateResult.
+    """
+
+    def __init__(self, name: str, fetch: Callable[[], Awaitable[Any]], ttl: float, stale: float = 0.0,
+                 history: int = 64):
+        super().__init__(name, fetch, ttl, stale)
+        self.history = history
+        self._versions: "OrderedDict[int, Dict[int, int]]" = OrderedDict()
+        # Base temporal (ms): as versões continuam crescentes após um reinício do processo.
+        self._next_version = int(time.time() * 1000)
+        # True enquanto os snapshots chegam por push (WatchResults): get() não volta a chamar GetResults.
+        self.live = False
+
+    def _make_snapshot(self, raw: bytes) -> ResultsSnapshot:
+        previous = self._snapshot
+        if previous is not None and raw is previous.raw:
+            return previous.renewed()
+        etag = make_etag(raw)
+        if previous is not None and previous.etag == etag:
+            return previous.renewed()
+
+        version = self._next_version
+        self._next_version += 1
+        data = GetResultsResponse.FromString(raw).results
+        votes = {r.id: r.votes for r in data}
+        self._versions[version] = votes
+        while len(self._versions) > self.history:
+            self._versions.popitem(last=False)
+        counts, ranking = self._rank(previous, data, votes)
+        return ResultsSnapshot(
+            data=data, etag=etag, raw=raw, version=version, votes=votes, counts=counts, ranking=ranking)
+
+    @staticmethod
+    def _rank(previous: ResultsSnapshot | None, data, votes: Dict[int, int]) -> tuple:
+        """
+        (votos por posição, ranking), atualizado a partir do snapshot anterior se os candidatos
+        forem os mesmos e pela mesma ordem.
+        """
+        if len(votes) != len(data):
+            # ids repetidos: o dicionário não acompanha as posições.
+            counts = [r.votes for r in data]
+            return counts, rank(counts)
+        counts = list(votes.values())
+        if (previous is not None and len(previous.counts) == len(counts)
+                and all(map(operator.eq, previous.votes, votes))):
+            return counts, rerank(previous.ranking, previous.counts, counts)
+        return counts, rank(counts)
+
+    def follow(self, version: int) -> None:
+        """
+        O próximo snapshot novo fica com a versão 'version' (a do worker líder, em app/shared.py):
+        ?since= e Last-Event-ID valem em qualquer worker. Uma versão já usada por este processo
+        (o mesmo snapshot publicado de novo) não é reutilizada.
+        """
+        previous = self._snapshot
+        self._next_version = max(version, previous.version + 1) if previous is not None else version
+
+    def publish(self, raw: bytes) -> ResultsSnapshot:
+        """
+        Instala um snapshot recebido por push (bytes de GetResultsResponse), sem chamar o AV.
+        """
+        snapshot = self._snapshot = self._make_snapshot(raw)
+        return snapshot
+
+    async def get(self) -> ResultsSnapshot:
+        snapshot = self._snapshot
+        if self.live and snapshot is not None:
+            self._hit.inc()
+            return snapshot
+        return await super().get()
+
+    def has_version(self, version: int) -> bool:
+        return version in self._versions
+
+    def delta(self, snapshot: ResultsSnapshot, since: int) -> List[Any] | None:
+        """
+        Linhas de 'snapshot' cujos votos mudaram desde a versão 'since'.
+        Devolve None se 'since' já não estiver no histórico (o cliente deve receber tudo).
+        """
+        old = self._versions.get(since)
+        if old is None or not old.keys() <= snapshot.votes.keys():
+            return None
+        return [r for r in snapshot.data if old.get(r.id) != r.votes]
+
+
+class IdempotencyCache:
+    """
+    Respostas já obtidas por chave, com limite de entradas (LRU) e validade (TTL).
+
+    As chaves nunca são guardadas em claro: só um hash BLAKE2b com sal aleatório do processo.
+    Pedidos concorrentes com a mesma chave partilham uma única chamada; os erros não ficam em cache.
+    Com size=0 a cache fica desativada (cada pedido faz a sua chamada).
+    """
+
+    def __init__(self, name: str, size: int, ttl: float, salt: bytes | None = None):
+        self.name = name
+        self.size = size
+        self.ttl = ttl
+        self._salt = salt or os.urandom(16)
+        self._entries: "OrderedDict[bytes, tuple]" = OrderedDict()
+        self._inflight: Dict[bytes, asyncio.Future] = {}
+        self._hit = CACHE_REQUESTS.labels(name, "hit")
+        self._coalesced = CACHE_REQUESTS.labels(name, "coalesced")
+        self._miss = CACHE_REQUESTS.labels(name, "miss")
+        self._gauge = CACHE_ENTRIES.labels(name)
+
+    def _key(self, value: str) -> bytes:
+        return hashlib.blake2b(value.encode("utf-8"), key=self._salt, digest_size=16).digest()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _store(self, key: bytes, result: Any) -> None:
+        self._entries[key] = (time.monotonic() + self.ttl, result)
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.size:
+            self._entries.popitem(last=False)
+        self._gauge.set(len(self._entries))
+
+    async def _load(self, key: bytes, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        try:
+            result = await fetch()
+            self._store(key, result)
+            return result
+        finally:
+            del self._inflight[key]
+
+    async def get(self, value: str, fetch: Callable[[], Awaitable[Any]]) -> Any:
+        if self.size <= 0:
+            return await fetch()
+
+        key = self._key(value)
+        entry = self._entries.get(key)
+        if entry is not None:
+            if entry[0] > time.monotonic():
+                self._entries.move_to_end(key)
+                self._hit.inc()
+                return entry[1]
+            del self._entries[key]
+
+        future = self._inflight.get(key)
+        if future is not None:
+            self._coalesced.inc()
+        else:
+            self._miss.inc()
+            future = self._inflight[key] = asyncio.ensure_future(self._load(key, fetch))
+            future.add_done_callback(lambda f: f.cancelled() or f.exception())
+        # shield: se o cliente desligar, a chamada continua e o resultado fica em cache para a repetição.
+        return await asyncio.shield(future)
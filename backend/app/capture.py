@@ -0,0 +1,257 @@
+"""
+Captura do tráfego REST para reprodução posterior (CAPTURE_PATH; vazio desativa). Ver bench/replay.py.
+
+Ficheiro binário só de acrescento: um cabeçalho de 32 bytes seguido de um registo por pedido,
+com 48 bytes fixos e a query string (até 255 bytes):
+
+    offset  tamanho  campo
+    0       8        início do pedido (µs desde a época, uint64 LE)
+    8       4        duração até ao último byte da resposta (µs, uint32 LE)
+    12      2        estado HTTP
+    14      1        método (índice em METHODS; 255 = outro)
+    15      1        rota (índice em ROUTES; 0 = outra)
+    16      4        bytes do corpo do pedido
+    20      4        bytes do corpo da resposta
+    24      8        sujeito: hash da credencial (/vote) ou do número do cartão (/register); 0 se não houver
+    32      4        candidate_id (/vote)
+    36      4        votos no lote (/votes/batch)
+    40      1        flags (FLAG_*)
+    41      1        tamanho da query string
+    42      6        reservado (zeros)
+
+Dados pessoais: o número do cartão e a credencial nunca são escritos; o sujeito é um BLAKE2b de 8 bytes
+com uma chave aleatória do processo que não é guardada. Identifica repetições na mesma captura (o
+mesmo cartão registado duas vezes, a mesma credencial usada duas vezes) sem permitir recuperar o
+valor, nem sequer por força bruta sobre os 10^9 números de cartão possíveis.
+
+O pedido só acrescenta um tuplo a uma lista em memória; a thread de escrita extrai os campos do
+corpo (JSON), calcula os hashes e escreve a cada CAPTURE_FLUSH_MS. Com CAPTURE_QUEUE_MAX pedidos por
+escrever, os seguintes são descartados (capture_dropped_total); um pedido cujo registo não se consegue
+codificar é descartado sozinho (capture_failures_total). Com vários workers, "{pid}" no caminho dá um
+ficheiro por worker (o bench/replay.py junta-os).
+"""
+import hashlib
+import json
+import logging
+import os
+import struct
+import threading
+import time
+
+from .metrics import Counter, Gauge
+
+CAPTURE_PATH = os.getenv("CAPTURE_PATH", "")
+CAPTURE_FLUSH_MS = float(os.getenv("CAPTURE_FLUSH_MS", "200"))
+CAPTURE_QUEUE_MAX = int(os.getenv("CAPTURE_QUEUE_MAX", "100000"))
+# Corpos maiores não são guardados até à escrita (o registo fica sem sujeito nem contagem do lote).
+CAPTURE_BODY_MAX = int(os.getenv("CAPTURE_BODY_MAX", str(1024 * 1024)))
+
+MAGIC = b"VSCAPT01"
+VERSION = 1
+HEADER = struct.Struct("<8sII16x")
+RECORD = struct.Struct("<QIHBBIIQIIBB6x")
+
+METHODS = ("GET", "POST", "HEAD", "OPTIONS", "PUT", "DELETE", "PATCH")
+ROUTES = (
+    "", "/health", "/ready", "/metrics", "/register", "/candidates", "/vote", "/vote/{ticket}",
+    "/votes/batch", "/results", "/results/stream", "/admin/profile",
+)
+_METHOD_INDEX = {m: i for i, m in enumerate(METHODS)}
+_ROUTE_INDEX = {r: i for i, r in enumerate(ROUTES) if r}
+
+FLAG_PROTOBUF = 1
+FLAG_GZIP = 2
+FLAG_IF_NONE_MATCH = 4
+FLAG_LAST_EVENT_ID = 8
+
+# Rotas cujo corpo é lido pela thread de escrita (sujeito, candidato, tamanho do lote).
+_BODY_PATHS = frozenset({"/register", "/vote", "/votes/batch"})
+
+CAPTURE_RECORDS = Counter("capture_records_total", "Pedidos escritos no ficheiro de captura.")
+CAPTURE_DROPPED = Counter("capture_dropped_total", "Pedidos não capturados por a escrita estar atrasada.")
+CAPTURE_PENDING = Gauge("capture_pending_records", "Pedidos em memória à espera de escrita.")
+CAPTURE_FAILURES = Counter("capture_failures_total", "Pedidos não capturados por erro ao codificar o registo.")
+
+_log = logging.getLogger(__name__)
+
+
+def read_records(path: str):
+    """
+    Itera os registos de um ficheiro de captura: (campos de RECORD..., query string em bytes).
+    """
+    with open(path, "rb") as f:
+        data = f.read()
+    magic, version, record_size = HEADER.unpack_from(data, 0)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise ValueError(f"{path} não é um ficheiro de captura compatível")
+    pos = HEADER.size
+    while pos + RECORD.size <= len(data):
+        fields = RECORD.unpack_from(data, pos)
+        end = pos + RECORD.size + fields[11]
+        if end > len(data):
+            break
+        yield fields + (data[pos + RECORD.size:end],)
+        pos = end
+
+
+class CaptureLog:
+    def __init__(self, path: str = CAPTURE_PATH, flush_s: float = CAPTURE_FLUSH_MS / 1000):
+        self.path = path.replace("{pid}", str(os.getpid()))
+        self.flush_s = flush_s
+        self._key = os.urandom(16)
+        self._fd = os.open(self.path, os.O_RDWR | os.O_CREAT | os.O_APPEND | getattr(os, "O_BINARY", 0), 0o640)
+        if os.fstat(self._fd).st_size == 0:
+            os.write(self._fd, HEADER.pack(MAGIC, VERSION, RECORD.size))
+        else:
+            # lseek + read em vez de os.pread (inexistente no Windows); O_APPEND escreve sempre no fim.
+            os.lseek(self._fd, 0, os.SEEK_SET)
+            header = os.read(self._fd, HEADER.size)
+            magic, version, record_size = HEADER.unpack(header) if len(header) == HEADER.size else (b"", 0, 0)
+            if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+                os.close(self._fd)
+                raise ValueError(f"{self.path} não é um ficheiro de captura compatível")
+
+        self._pending = []
+        self._cond = threading.Condition()
+        self._closed = False
+        self._thread = threading.Thread(target=self._run, name="capture-log", daemon=True)
+        self._thread.start()
+
+    def append(self, entry: tuple) -> None:
+        """
+        entry = (início µs, duração µs, estado, método, rota, path, query, flags, bytes do pedido,
+        bytes da resposta, partes do corpo ou None).
+        """
+        with self._cond:
+            if len(self._pending) >= CAPTURE_QUEUE_MAX:
+                CAPTURE_DROPPED.inc()
+                return
+            self._pending.append(entry)
+
+    def _subject(self, value) -> int:
+        if not isinstance(value, str) or not value:
+            return 0
+        digest = hashlib.blake2b(value.encode("utf-8"), key=self._key, digest_size=8).digest()
+        return int.from_bytes(digest, "little") or 1
+
+    def _encode(self, entry: tuple) -> bytes:
+        start_us, dur_us, status, method, route, path, query, flags, req_bytes, resp_bytes, body = entry
+        subject = candidate_id = items = 0
+        if body is not None:
+            raw = b"".join(body)
+            if path == "/votes/batch":
+                items = raw.count(b'"voting_credential"')
+            else:
+                try:
+                    data = json.loads(raw)
+                except ValueError:
+                    data = None
+                if isinstance(data, dict):
+                    subject = self._subject(data.get("voting_credential") or data.get("citizen_card_number"))
+                    candidate = data.get("candidate_id")
+                    if isinstance(candidate, int) and 0 <= candidate < 1 << 32:
+                        candidate_id = candidate
+        query = query[:255]
+        return RECORD.pack(
+            start_us, min(dur_us, 0xFFFFFFFF), status, _METHOD_INDEX.get(method, 255), _ROUTE_INDEX.get(route, 0),
+            min(req_bytes, 0xFFFFFFFF), min(resp_bytes, 0xFFFFFFFF), subject, candidate_id, items, flags, len(query),
+        ) + query
+
+    def _encode_all(self, pending: list) -> tuple:
+        """
+        (bytes, registos) dos pedidos que foi possível codificar; os restantes são descartados e contados.
+        """
+        parts = []
+        failed = 0
+        for entry in pending:
+            try:
+                parts.append(self._encode(entry))
+            except Exception:
+                if not failed:
+                    _log.exception("Pedido não capturado: erro ao codificar o registo")
+                failed += 1
+        if failed:
+            CAPTURE_FAILURES.inc(failed)
+        return b"".join(parts), len(parts)
+
+    def _run(self) -> None:
+        while True:
+            with self._cond:
+                if not self._closed:
+                    self._cond.wait(self.flush_s)
+                pending, self._pending = self._pending, []
+                closed = self._closed
+            CAPTURE_PENDING.set(len(pending))
+            if pending:
+                data, written = self._encode_all(pending)
+                view = memoryview(data)
+                while view:
+                    view = view[os.write(self._fd, view):]
+                CAPTURE_RECORDS.inc(written)
+            CAPTURE_PENDING.set(0)
+            if closed:
+                return
+
+    def close(self) -> None:
+        with self._cond:
+            self._closed = True
+            self._cond.notify()
+        self._thread.join()
+        os.close(self._fd)
+
+
+class CaptureMiddleware:
+    """
+    Middleware ASGI: mede cada pedido HTTP e entrega-o ao CaptureLog (sem esperar pela escrita).
+    """
+
+    def __init__(self, app, log: CaptureLog):
+        self.app = app
+        self.log = log
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        start_us = time.time_ns() // 1000
+        t0 = time.perf_counter()
+        keep_body = scope["method"] == "POST" and scope["path"] in _BODY_PATHS
+        body = [] if keep_body else None
+        sizes = [0, 0]
+        status = [500]
+
+        async def receive_wrapper():
+            message = await receive()
+            if message["type"] == "http.request":
+                chunk = message.get("body", b"")
+                sizes[0] += len(chunk)
+                if body is not None:
+                    body.append(chunk)
+            return message
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            elif message["type"] == "http.response.body":
+                sizes[1] += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, receive_wrapper, send_wrapper)
+        finally:
+            flags = 0
+            for name, value in scope["headers"]:
+                if name == b"accept" and b"application/x-protobuf" in value:
+                    flags |= FLAG_PROTOBUF
+                elif name == b"accept-encoding" and b"gzip" in value:
+                    flags |= FLAG_GZIP
+                elif name == b"if-none-match":
+                    flags |= FLAG_IF_NONE_MATCH
+                elif name == b"last-event-id":
+                    flags |= FLAG_LAST_EVENT_ID
+            route = scope.get("route")
+            self.log.append((
+                start_us, int((time.perf_counter() - t0) * 1e6), status[0], scope["method"],
+                getattr(route, "path", ""), scope["path"], scope.get("query_string", b""), flags,
+                sizes[0], sizes[1], body if body is not None and sizes[0] <= CAPTURE_BODY_MAX else None,
+            ))
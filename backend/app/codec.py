@@ -0,0 +1,178 @@
+"""
+Negociação de conteúdo das respostas REST.
+
+- Accept: application/x-protobuf -> devolve os bytes da resposta do AR/AV tal como foram recebidos
+  (VoterResponse, GetCandidatesResponse, VoteResponse, GetResultsResponse).
+- JSON (por omissão) -> codificado diretamente a partir da mensagem protobuf, sem dicionários
+  intermédios. O resultado é igual, byte a byte, ao que o JSONResponse do Starlette produzia.
+
+Body guarda um corpo já codificado (com ETag e variante gzip) para ser reutilizado por vários pedidos.
+"""
+import gzip
+import json
+import os
+from typing import Iterable
+
+from fastapi.responses import Response
+
+from .cache import etag_matches
+
+PROTOBUF = "application/x-protobuf"
+JSON = "application/json"
+
+# Corpos a partir deste tamanho (bytes) ganham uma variante gzip, calculada uma vez; 0 desativa.
+RESPONSE_GZIP_MIN_BYTES = int(os.getenv("RESPONSE_GZIP_MIN_BYTES", "1024"))
+RESPONSE_GZIP_LEVEL = int(os.getenv("RESPONSE_GZIP_LEVEL", "6"))
+
+_PROTOBUF_TYPES = {PROTOBUF, "application/protobuf", "application/vnd.google.protobuf"}
+
+# Igual ao json.dumps(ensure_ascii=False): só escapa aspas, barras e caracteres de controlo.
+_str = json.encoder.encode_basestring
+
+
+def _q(params: str) -> float:
+    for param in params.split(";"):
+        key, _, value = param.partition("=")
+        if key.strip().lower() == "q":
+            try:
+                return float(value)
+            except ValueError:
+                return 0.0
+    return 1.0
+
+
+def wants_protobuf(accept: str | None) -> bool:
+    """
+    True se o cabeçalho Accept preferir protobuf a JSON. Os curingas (*/*, application/*) não
+    contam contra o protobuf; em empate explícito entre os dois, ganha o JSON.
+    """
+    if not accept or "protobuf" not in accept:
+        return False
+    protobuf_q = json_q = 0.0
+    for part in accept.split(","):
+        media, _, params = part.partition(";")
+        media = media.strip().lower()
+        if media in _PROTOBUF_TYPES:
+            protobuf_q = max(protobuf_q, _q(params))
+        elif media == JSON:
+            json_q = max(json_q, _q(params))
+    return protobuf_q > json_q
+
+
+def accepts_encoding(accept_encoding: str | None, coding: str) -> bool:
+    """
+    True se o cabeçalho Accept-Encoding aceitar 'coding' (diretamente ou por '*') com q > 0.
+    """
+    if not accept_encoding:
+        return False
+    for part in accept_encoding.split(","):
+        name, _, params = part.partition(";")
+        if name.strip().lower() in (coding, "*") and _q(params) > 0:
+            return True
+    return False
+
+
+def representation_etag(etag: str, protobuf: bool) -> str:
+    """
+    ETag da representação pedida: JSON e protobuf têm corpos diferentes, logo ETags diferentes.
+    """
+    return etag[:-1] + '.pb"' if protobuf else etag
+
+
+class Reply:
+    """
+    Resposta do AR/AV: os bytes protobuf recebidos e a mensagem, descodificada só quando é usada.
+    """
+
+    __slots__ = ("raw", "_cls", "_message")
+
+    def __init__(self, raw: bytes, message_cls):
+        self.raw = raw
+        self._cls = message_cls
+        self._message = None
+
+    @property
+    def message(self):
+        if self._message is None:
+            self._message = self._cls.FromString(self.raw)
+        return self._message
+
+
+class Body:
+    """
+    Corpo codificado de uma representação, com o seu ETag e a variante gzip (só se compensar).
+    """
+
+    __slots__ = ("data", "media_type", "etag", "gzip")
+
+    def __init__(self, data: bytes, media_type: str, etag: str):
+        self.data = data
+        self.media_type = media_type
+        self.etag = etag
+        self.gzip = None
+        if 0 < RESPONSE_GZIP_MIN_BYTES <= len(data):
+            compressed = gzip.compress(data, RESPONSE_GZIP_LEVEL, mtime=0)
+            if len(compressed) < len(data):
+                self.gzip = compressed
+
+    def response(self, accept_encoding: str | None, if_none_match: str | None, headers: dict) -> Response:
+        """
+        Escreve os bytes guardados (gzip se o cliente aceitar), ou 304 se o ETag coincidir.
+        """
+        headers = {**headers, "ETag": self.etag}
+        data = self.data
+        if self.gzip is not None and accepts_encoding(accept_encoding, "gzip"):
+            headers["ETag"] = self.etag[:-1] + '.gz"'
+            headers["Content-Encoding"] = "gzip"
+            data = self.gzip
+        if etag_matches(if_none_match, headers["ETag"]):
+            return Response(status_code=304, headers=headers)
+        return Response(data, media_type=self.media_type, headers=headers)
+
+
+def protobuf_response(raw: bytes, headers: dict | None = None) -> Response:
+    return Response(raw, media_type=PROTOBUF, headers=headers)
+
+
+def json_response(body: str, headers: dict | None = None, status_code: int = 200) -> Response:
+    return Response(body.encode("utf-8"), status_code=status_code, media_type=JSON, headers=headers)
+
+
+def _bool(value: bool) -> str:
+    return "true" if value else "false"
+
+
+def register_json(m) -> str:
+    return f'{{"is_eligible":{_bool(m.is_eligible)},"voting_credential":{_str(m.voting_credential)}}}'
+
+
+def vote_json(m) -> str:
+    return f'{{"success":{_bool(m.success)},"message":{_str(m.message)}}}'
+
+
+def candidates_json(candidates: Iterable) -> str:
+    rows = ",".join(f'{{"id":{c.id},"name":{_str(c.name)}}}' for c in candidates)
+    return f'{{"candidates":[{rows}]}}'
+
+
+def result_rows_json(results: Iterable) -> str:
+    return ",".join(f'{{"id":{r.id},"name":{_str(r.name)},"votes":{r.votes}}}' for r in results)
+
+
+def results_json(version: int, results: Iterable, since: int | None = None) -> str:
+    rows = result_rows_json(results)
+    if since is None:
+        return f'{{"version":{version},"results":[{rows}]}}'
+    return f'{{"version":{version},"since":{since},"delta":true,"results":[{rows}]}}'
+
+
+def candidates_page_json(candidates: Iterable, total: int, offset: int, limit: int) -> str:
+    rows = ",".join(f'{{"id":{c.id},"name":{_str(c.name)}}}' for c in candidates)
+    return f'{{"total":{total},"offset":{offset},"limit":{limit},"candidates":[{rows}]}}'
+
+
+def results_page_json(version: int, results: Iterable, total: int, offset: int, limit: int,
+                      order: str | None) -> str:
+    order_json = _str(order) if order else "null"
+    return (f'{{"version":{version},"total":{total},"offset":{offset},"limit":{limit},"order":{order_json},'
+            f'"results":[{result_rows_json(results)}]}}')
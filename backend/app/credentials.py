@@ -0,0 +1,382 @@
+"""
+Registo local de credenciais já usadas (bloqueio de voto repetido).
+
+Em vez de guardar as credenciais completas num set, guarda-se um digest de 16 bytes
+(BLAKE2b) de cada credencial. Três implementações, escolhidas por CREDENTIAL_STORE:
+
+  memory -> tabela de endereçamento aberto num bytearray + filtro de Bloom (por processo)
+  mmap   -> a mesma tabela num ficheiro mapeado em memória, partilhado pelos workers da máquina
+  sqlite -> base de dados SQLite em modo WAL (partilhada e persistente)
+
+Todas expõem 'credencial in store', store.add(credencial) e len(store), como o set original,
+e 'store.full' (só o mmap tem capacidade fixa): com o registo cheio, /vote responde 503 antes de
+contactar o AV. 'store.blocking' indica que as operações podem esperar por I/O ou por locks (sqlite):
+o backend chama-as numa thread (asyncio.to_thread), fora do event loop.
+"""
+import hashlib
+import mmap
+import os
+import sqlite3
+import struct
+import threading
+from pathlib import Path
+
+CREDENTIAL_STORE = os.getenv("CREDENTIAL_STORE", "memory").strip().lower()
+CREDENTIAL_STORE_PATH = os.getenv("CREDENTIAL_STORE_PATH", "")
+# Capacidade fixa do mmap em número de credenciais (o memory começa pequeno e cresce por passos).
+CREDENTIAL_STORE_CAPACITY = int(os.getenv("CREDENTIAL_STORE_CAPACITY", "1000000"))
+# Espera máxima pelo lock de escrita do SQLite (outro worker a escrever) antes de CredentialStoreBusy.
+CREDENTIAL_STORE_TIMEOUT_S = float(os.getenv("CREDENTIAL_STORE_TIMEOUT_S", "5"))
+
+DIGEST_SIZE = 16
+_EMPTY = bytes(DIGEST_SIZE)
+
+
+class CredentialStoreFull(RuntimeError):
+    pass
+
+
+class CredentialStoreBusy(RuntimeError):
+    pass
+
+
+def credential_digest(credential: str) -> bytes:
+    d = hashlib.blake2b(credential.encode("utf-8"), digest_size=DIGEST_SIZE).digest()
+    # O digest nulo marca posições vazias na tabela.
+    return d if d != _EMPTY else b"\x01" + d[1:]
+
+
+def _capacity_for(entries: int, load: float = 0.5) -> int:
+    """
+    Menor potência de 2 que mantém a taxa de ocupação abaixo de 'load'.
+    """
+    n = 16
+    while n * load < entries:
+        n *= 2
+    return n
+
+
+class _DigestTable:
+    """
+    Tabela de endereçamento aberto (sondagem linear) sobre um buffer de posições de 16 bytes.
+    O buffer pode ser um bytearray ou um mmap; não guarda estado além do próprio buffer.
+    """
+
+    def __init__(self, buf, offset: int, capacity: int):
+        self.buf = buf
+        self.offset = offset
+        self.capacity = capacity
+        self.mask = capacity - 1
+
+    def _slot(self, digest: bytes) -> int:
+        return int.from_bytes(digest[:8], "little") & self.mask
+
+    def find(self, digest: bytes) -> bool:
+        buf, offset, mask = self.buf, self.offset, self.mask
+        i = self._slot(digest)
+        while True:
+            o = offset + i * DIGEST_SIZE
+            cur = buf[o:o + DIGEST_SIZE]
+            if cur == digest:
+                return True
+            if cur == _EMPTY:
+                return False
+            i = (i + 1) & mask
+
+    def insert(self, digest: bytes) -> bool:
+        """
+        Insere 'digest'; devolve False se já existia. Quem chama garante que há espaço livre.
+        """
+        buf, offset, mask = self.buf, self.offset, self.mask
+        i = self._slot(digest)
+        while True:
+            o = offset + i * DIGEST_SIZE
+            cur = buf[o:o + DIGEST_SIZE]
+            if cur == digest:
+                return False
+            if cur == _EMPTY:
+                buf[o:o + DIGEST_SIZE] = digest
+                return True
+            i = (i + 1) & mask
+
+    def digests(self, start: int = 0, stop: int | None = None):
+        buf, offset = self.buf, self.offset
+        for i in range(start, self.capacity if stop is None else min(stop, self.capacity)):
+            o = offset + i * DIGEST_SIZE
+            cur = bytes(buf[o:o + DIGEST_SIZE])
+            if cur != _EMPTY:
+                yield cur
+
+
+class BloomFilter:
+    """
+    Filtro de Bloom com k posições retiradas de fatias distintas do próprio digest
+    (já é um hash uniforme; não é preciso voltar a calcular hashes).
+    Um "não" é definitivo; um "talvez" é confirmado na tabela.
+    """
+
+    def __init__(self, entries: int, bits_per_entry: int = 10, k: int = 4):
+        nbits = 64
+        while nbits < entries * bits_per_entry:
+            nbits *= 2
+        self.mask = nbits - 1
+        self.k = k
+        self.shift = DIGEST_SIZE * 8 // k
+        if nbits > 1 << self.shift:
+            raise ValueError("Filtro de Bloom demasiado grande para k fatias do digest")
+        self.bits = bytearray(nbits // 8)
+
+    def add(self, digest: bytes) -> None:
+        bits, mask, shift = self.bits, self.mask, self.shift
+        h = int.from_bytes(digest, "little")
+        for _ in range(self.k):
+            p = h & mask
+            bits[p >> 3] |= 1 << (p & 7)
+            h >>= shift
+
+    def might_contain(self, digest: bytes) -> bool:
+        bits, mask, shift = self.bits, self.mask, self.shift
+        h = int.from_bytes(digest, "little")
+        for _ in range(self.k):
+            p = h & mask
+            if not bits[p >> 3] & (1 << (p & 7)):
+                return False
+            h >>= shift
+        return True
+
+
+class MemoryCredentialStore:
+    """
+    ~32-64 bytes por credencial (16 B de digest a ≤50% de ocupação) + ~1,25 B do filtro de Bloom.
+    Local ao processo e volátil.
+
+    Começa com 'capacity' credenciais e duplica quando enche. A cópia para a tabela nova é feita
+    por passos (MIGRATE_STEP posições por add) para nenhum add parar o event loop; até acabar,
+    as consultas veem as duas tabelas.
+    """
+
+    LOAD = 0.5
+    MIGRATE_STEP = 256
+    full = False
+    blocking = False
+
+    def __init__(self, capacity: int = 1024):
+        self._count = 0
+        self._lock = threading.Lock()
+        slots = _capacity_for(capacity, self.LOAD)
+        # (tabela, Bloom, tabela antiga, Bloom antigo) publicado de uma vez: as leituras (sem lock)
+        # usam sempre um estado coerente.
+        self._state = (_DigestTable(bytearray(slots * DIGEST_SIZE), 0, slots), BloomFilter(int(slots * self.LOAD)),
+                       None, None)
+        self._migrated = 0
+
+    def __contains__(self, credential: str) -> bool:
+        d = credential_digest(credential)
+        table, bloom, old, old_bloom = self._state
+        if bloom.might_contain(d) and table.find(d):
+            return True
+        return old is not None and old_bloom.might_contain(d) and old.find(d)
+
+    def _grow(self) -> None:
+        while self._state[2] is not None:
+            self._migrate()
+        table, bloom, _, _ = self._state
+        slots = table.capacity * 2
+        self._state = (_DigestTable(bytearray(slots * DIGEST_SIZE), 0, slots), BloomFilter(int(slots * self.LOAD)),
+                       table, bloom)
+        self._migrated = 0
+
+    def _migrate(self) -> None:
+        table, bloom, old, _ = self._state
+        stop = self._migrated + self.MIGRATE_STEP
+        for d in old.digests(self._migrated, stop):
+            table.insert(d)
+            bloom.add(d)
+        self._migrated = stop
+        if stop >= old.capacity:
+            self._state = (table, bloom, None, None)
+
+    def add(self, credential: str) -> bool:
+        d = credential_digest(credential)
+        with self._lock:
+            if self._count + 1 > self._state[0].capacity * self.LOAD:
+                self._grow()
+            table, bloom, old, old_bloom = self._state
+            if old is not None:
+                # As posições ainda não copiadas só existem na tabela antiga.
+                if old_bloom.might_contain(d) and old.find(d):
+                    return False
+                self._migrate()
+            if not table.insert(d):
+                return False
+            bloom.add(d)
+            self._count += 1
+            return True
+
+    def __len__(self) -> int:
+        return self._count
+
+    def close(self) -> None:
+        pass
+
+
+def _lock_file(f) -> None:
+    if os.name == "nt":
+        import msvcrt
+
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_LOCK, 1)
+    else:
+        import fcntl
+
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX)
+
+
+def _unlock_file(f) -> None:
+    if os.name == "nt":
+        import msvcrt
+
+        f.seek(0)
+        msvcrt.locking(f.fileno(), msvcrt.LK_UNLCK, 1)
+    else:
+        import fcntl
+
+        fcntl.flock(f.fileno(), fcntl.LOCK_UN)
+
+
+class MmapCredentialStore:
+    """
+    Tabela de digests num ficheiro mapeado em memória, partilhada por todos os workers da máquina.
+    Cabeçalho: magic (8 B) | capacidade (8 B) | contagem (8 B) | reservado (8 B).
+    As leituras não usam lock; as inserções são serializadas com um lock de ficheiro.
+    A capacidade é fixa (CREDENTIAL_STORE_CAPACITY) e definida quando o ficheiro é criado.
+    """
+
+    MAGIC = b"VSCRED01"
+    HEADER = struct.Struct("<8sQQQ")
+    LOAD = 0.7
+    blocking = False
+
+    def __init__(self, path: str, capacity: int = CREDENTIAL_STORE_CAPACITY):
+        self.path = Path(path)
+        self._file = open(os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644), "r+b")
+        self._lock = threading.Lock()
+        _lock_file(self._file)
+        try:
+            self._file.seek(0, os.SEEK_END)
+            if self._file.tell() == 0:
+                slots = _capacity_for(capacity, self.LOAD)
+                self._file.truncate(self.HEADER.size + slots * DIGEST_SIZE)
+                self._file.seek(0)
+                self._file.write(self.HEADER.pack(self.MAGIC, slots, 0, 0))
+                self._file.flush()
+            self._mm = mmap.mmap(self._file.fileno(), 0)
+        finally:
+            _unlock_file(self._file)
+
+        magic, slots, _, _ = self.HEADER.unpack_from(self._mm, 0)
+        if magic != self.MAGIC:
+            raise ValueError(f"Ficheiro de credenciais inválido: {self.path}")
+        self._table = _DigestTable(self._mm, self.HEADER.size, slots)
+        # Credenciais que cabem no ficheiro (definido na criação; pode diferir de 'capacity').
+        self.limit = int(slots * self.LOAD)
+
+    @property
+    def full(self) -> bool:
+        return len(self) >= self.limit
+
+    def __contains__(self, credential: str) -> bool:
+        return self._table.find(credential_digest(credential))
+
+    def add(self, credential: str) -> bool:
+        d = credential_digest(credential)
+        with self._lock:
+            _lock_file(self._file)
+            try:
+                count = len(self)
+                if count >= self.limit:
+                    raise CredentialStoreFull(
+                        f"Registo de credenciais cheio ({count}); aumentar CREDENTIAL_STORE_CAPACITY "
+                        f"e recriar {self.path}"
+                    )
+                if not self._table.insert(d):
+                    return False
+                struct.pack_into("<Q", self._mm, 16, count + 1)
+                return True
+            finally:
+                _unlock_file(self._file)
+
+    def __len__(self) -> int:
+        return struct.unpack_from("<Q", self._mm, 16)[0]
+
+    def close(self) -> None:
+        self._mm.close()
+        self._file.close()
+
+
+class SqliteCredentialStore:
+    """
+    Digests numa tabela SQLite (WAL): persistente, partilhada entre processos.
+    Uma ligação por thread (sqlite3 não permite partilhar ligações entre threads).
+    """
+
+    full = False
+    blocking = True
+
+    def __init__(self, path: str, timeout: float = CREDENTIAL_STORE_TIMEOUT_S):
+        self.path = path
+        self.timeout = timeout
+        self._local = threading.local()
+        self._conn().execute(
+            "CREATE TABLE IF NOT EXISTS used_credentials (digest BLOB PRIMARY KEY) WITHOUT ROWID"
+        )
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=self.timeout, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=NORMAL")
+            self._local.conn = conn
+        return conn
+
+    def _execute(self, sql: str, params: tuple) -> sqlite3.Cursor:
+        try:
+            return self._conn().execute(sql, params)
+        except sqlite3.OperationalError as e:
+            # "database is locked": outro processo reteve o lock mais do que 'timeout'.
+            raise CredentialStoreBusy(f"Registo de credenciais ocupado ({self.path}): {e}") from e
+
+    def __contains__(self, credential: str) -> bool:
+        row = self._execute(
+            "SELECT 1 FROM used_credentials WHERE digest = ?", (credential_digest(credential),)
+        ).fetchone()
+        return row is not None
+
+    def add(self, credential: str) -> bool:
+        cur = self._execute(
+            "INSERT OR IGNORE INTO used_credentials (digest) VALUES (?)", (credential_digest(credential),)
+        )
+        return cur.rowcount == 1
+
+    def __len__(self) -> int:
+        return self._conn().execute("SELECT COUNT(*) FROM used_credentials").fetchone()[0]
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+def open_credential_store(kind: str = CREDENTIAL_STORE, path: str = CREDENTIAL_STORE_PATH):
+    """
+    Cria o registo configurado por CREDENTIAL_STORE / CREDENTIAL_STORE_PATH.
+    """
+    if kind == "memory":
+        return MemoryCredentialStore()
+    if kind == "mmap":
+        return MmapCredentialStore(path or "used_credentials.bin")
+    if kind == "sqlite":
+        return SqliteCredentialStore(path or "used_credentials.sqlite3")
+    raise ValueError(f"CREDENTIAL_STORE inválido: {kind!r} (usar 'memory', 'mmap' ou 'sqlite')")
@@ -1,20 +1,65 @@
+import functools
+import hashlib
+import itertools
 import json
 import os
 import subprocess
+import tempfile
+import threading
 from pathlib import Path
 from typing import Any, Dict, List
 
+from .balancer import routed
+from .metrics import track_upstream
+from .tracing import span
+
+# Destino único por omissão. Para várias instâncias por serviço (balanceamento, ejeção de destinos
+# com falhas), ver GRPC_TARGETS_VOTER / GRPC_TARGETS_VOTING em balancer.py.
 GRPC_TARGET = os.getenv("GRPC_TARGET", "ken01.utad.pt:9091")
 
 # Se grpcurl estiver no PATH, deixa assim. Se não estiver, aponta para o executável completo:
 # Ex.: r"C:\tools\grpcurl\grpcurl.exe"
 GRPCURL_BIN = os.getenv("GRPCURL_BIN", "grpcurl")
 
+# Descritores já compilados (FileDescriptorSet) para o grpcurl não ter de analisar os .proto em
+# cada chamada. Vazio: gerado no aquecimento do arranque a partir dos *_pb2.py (ver use_protoset).
+GRPCURL_PROTOSET = os.getenv("GRPCURL_PROTOSET", "")
+
+# Transporte usado pelos clientes:
+#   "grpcurl" -> um processo grpcurl por pedido (mitigação original para o TLS do endpoint remoto)
+#   "grpc"    -> canais gRPC nativos, persistentes, com keepalive (stubs gerados em *_pb2_grpc.py)
+GRPC_TRANSPORT = os.getenv("GRPC_TRANSPORT", "grpcurl").strip().lower()
+
+# Número de canais HTTP/2 mantidos abertos pelo transporte nativo (distribuição round-robin).
+GRPC_POOL_SIZE = int(os.getenv("GRPC_POOL_SIZE", "4"))
+GRPC_KEEPALIVE_MS = int(os.getenv("GRPC_KEEPALIVE_MS", "30000"))
+GRPC_KEEPALIVE_TIMEOUT_MS = int(os.getenv("GRPC_KEEPALIVE_TIMEOUT_MS", "10000"))
+
+# TLS do transporte nativo. O certificado do endpoint remoto não tem SAN/hostname válido,
+# pelo que é necessário indicar o PEM e o nome que consta no certificado.
+GRPC_CERT_PEM_PATH = os.getenv("GRPC_CERT_PEM_PATH", "")
+GRPC_CERT_HOSTNAME = os.getenv("GRPC_CERT_HOSTNAME", "")
+
+# Ligação sem TLS (ex.: servidores locais de teste). Aplica-se a ambos os transportes.
+GRPC_PLAINTEXT = os.getenv("GRPC_PLAINTEXT", "0") == "1"
+
+# Prazo (deadline) por chamada, em segundos. GRPC_DEADLINE_S é o valor por omissão;
+# cada método pode ser ajustado com GRPC_DEADLINE_<MÉTODO>, ex.: GRPC_DEADLINE_VOTE=10.
+GRPC_DEADLINE_S = float(os.getenv("GRPC_DEADLINE_S", "5"))
+
 
 class GrpcurlError(RuntimeError):
     pass
 
 
+def is_unimplemented(e: Exception) -> bool:
+    """
+    O serviço não implementa o método (ex.: RPCs acrescentados ao .proto que o AV remoto não tem).
+    Transporte nativo: código no erro gRPC original; grpcurl: "Code: Unimplemented" na mensagem.
+    """
+    return "code=UNIMPLEMENTED" in str(e) or "Code: Unimplemented" in str(e)
+
+
 # Estrutura esperada:
 # backend/
 #   app/
@@ -27,49 +72,92 @@ PROTOS_DIR = BASE_DIR / "protos"                        # .../backend/protos
 VOTER_PROTO_NAME = "voter.proto"
 VOTING_PROTO_NAME = "voting.proto"
 
+_protoset = GRPCURL_PROTOSET
+
 
-def _run_grpcurl(proto_name: str, full_method: str, payload: Dict[str, Any] | None = None) -> Dict[str, Any]:
+def build_protoset() -> bytes:
+    """
+    FileDescriptorSet de voter.proto e voting.proto, a partir dos módulos gerados (sem protoc).
+    """
+    from google.protobuf import descriptor_pb2
+
+    from . import voter_pb2, voting_pb2
+
+    fds = descriptor_pb2.FileDescriptorSet()
+    for module in (voter_pb2, voting_pb2):
+        module.DESCRIPTOR.CopyToProto(fds.file.add())
+    return fds.SerializeToString(deterministic=True)
+
+
+def use_protoset() -> str:
+    """
+    Passa a invocar o grpcurl com -protoset em vez de -import-path/-proto. Sem GRPCURL_PROTOSET,
+    o ficheiro é escrito no diretório temporário com o digest do conteúdo no nome (partilhado
+    pelos workers e reescrito só quando os .proto mudam).
+    """
+    global _protoset
+    if not _protoset:
+        data = build_protoset()
+        path = Path(tempfile.gettempdir()) / f"votingsystem-{hashlib.sha256(data).hexdigest()[:16]}.protoset"
+        if not path.exists():
+            tmp = path.with_suffix(f".{os.getpid()}.tmp")
+            tmp.write_bytes(data)
+            tmp.replace(path)
+        _protoset = str(path)
+    return _protoset
+
+
+def _grpcurl_cmd(proto_name: str, full_method: str, timeout: float | None = None,
+                 target: str = GRPC_TARGET, authority: str = "") -> List[str]:
     """
     Invoca grpcurl com -insecure (TLS sem validação de certificado).
     Importante: quando usamos -proto, definimos também -import-path, e executamos com cwd=backend/.
+    Com um protoset (use_protoset) o grpcurl lê os descritores já compilados.
+    'authority' é o nome do serviço quando 'target' é um endereço resolvido por DNS.
     """
+    schema = ["-protoset", _protoset] if _protoset else ["-import-path", str(PROTOS_DIR), "-proto", proto_name]
     cmd = [
         GRPCURL_BIN,
-        "-insecure",
-        "-import-path", str(PROTOS_DIR),
-        "-proto", proto_name,
+        "-plaintext" if GRPC_PLAINTEXT else "-insecure",
+        *schema,
         "-d", "@",
-        GRPC_TARGET,
-        full_method,
     ]
+    if timeout is not None:
+        cmd += ["-max-time", f"{timeout:g}"]
+    if authority:
+        cmd += ["-authority", authority]
+    return cmd + [target, full_method]
 
-    stdin = ""
-    if payload is not None:
-        stdin = json.dumps(payload)
 
+def _dict_to_message(full_method: str, data: Dict[str, Any]):
+    """
+    Reconstrói a mensagem de resposta protobuf a partir do JSON do grpcurl (aceita snake_case e lowerCamelCase).
+    """
+    from google.protobuf import json_format
+
+    response_cls = _message_table()[full_method][1]
     try:
-        p = subprocess.run(
-            cmd,
-            input=stdin,
-            text=True,
-            capture_output=True,
-            check=False,
-            cwd=str(BASE_DIR),   # garante que o proto_name é resolvido corretamente
-        )
-    except FileNotFoundError as e:
-        raise GrpcurlError(
-            "grpcurl não encontrado. "
-            "Define GRPCURL_BIN com o caminho completo para o grpcurl.exe (ou adiciona ao PATH). "
-            f"Detalhe: {e}"
-        ) from e
+        return json_format.ParseDict(data, response_cls(), ignore_unknown_fields=True)
+    except json_format.ParseError as e:
+        raise GrpcurlError(f"Resposta grpcurl não corresponde a {response_cls.__name__}: {e}") from e
+
+
+def _grpcurl_not_found(e: Exception) -> GrpcurlError:
+    return GrpcurlError(
+        "grpcurl não encontrado. "
+        "Define GRPCURL_BIN com o caminho completo para o grpcurl.exe (ou adiciona ao PATH). "
+        f"Detalhe: {e}"
+    )
 
-    if p.returncode != 0:
+
+def _parse_grpcurl_output(returncode: int, stdout: str, stderr: str) -> Dict[str, Any]:
+    if returncode != 0:
         raise GrpcurlError(
-            f"Falha grpcurl (code={p.returncode}). "
-            f"STDERR: {p.stderr.strip()} | STDOUT: {p.stdout.strip()}"
+            f"Falha grpcurl (code={returncode}). "
+            f"STDERR: {stderr.strip()} | STDOUT: {stdout.strip()}"
         )
 
-    out = p.stdout.strip()
+    out = stdout.strip()
     if not out:
         return {}
 
@@ -79,35 +167,364 @@ def _run_grpcurl(proto_name: str, full_method: str, payload: Dict[str, Any] | No
         raise GrpcurlError(f"Resposta grpcurl não é JSON válido: {out}") from e
 
 
-class RegistrationClient:
-    def issue_credential(self, citizen_card_number: str) -> Dict[str, Any]:
-        return _run_grpcurl(
+def _run_grpcurl(proto_name: str, full_method: str, payload: Dict[str, Any] | None = None,
+                 timeout: float | None = None, target: str = GRPC_TARGET, authority: str = "") -> Dict[str, Any]:
+    stdin = ""
+    if payload is not None:
+        stdin = json.dumps(payload)
+
+    try:
+        with span("grpcurl"):
+            p = subprocess.run(
+                _grpcurl_cmd(proto_name, full_method, timeout, target, authority),
+                input=stdin,
+                text=True,
+                capture_output=True,
+                check=False,
+                cwd=str(BASE_DIR),   # garante que o proto_name é resolvido corretamente
+                # margem para o arranque do processo; o deadline efetivo é o -max-time do grpcurl
+                timeout=None if timeout is None else timeout + 1.0,
+            )
+    except FileNotFoundError as e:
+        raise _grpcurl_not_found(e) from e
+    except subprocess.TimeoutExpired as e:
+        raise GrpcurlError(f"Deadline excedido ({timeout:g}s) em {full_method}") from e
+
+    return _parse_grpcurl_output(p.returncode, p.stdout, p.stderr)
+
+
+class GrpcurlTransport:
+    """
+    Transporte original: um processo grpcurl por chamada, para o destino escolhido pelo balanceador.
+    Mantido como alternativa (GRPC_TRANSPORT=grpcurl).
+    """
+
+    name = "grpcurl"
+
+    def call(self, proto_name: str, full_method: str, payload: Dict[str, Any],
+             timeout: float | None = None) -> Dict[str, Any]:
+        with routed(full_method) as endpoint:
+            return _run_grpcurl(proto_name, full_method, payload, timeout, endpoint.target, endpoint.authority)
+
+    def call_raw(self, proto_name: str, full_method: str, payload: Dict[str, Any],
+                 timeout: float | None = None) -> bytes:
+        data = self.call(proto_name, full_method, payload, timeout)
+        return _dict_to_message(full_method, data).SerializeToString(deterministic=True)
+
+
+@functools.lru_cache(maxsize=None)
+def _message_table() -> Dict[str, tuple]:
+    """
+    Mapeia "pacote.Serviço/Método" -> (classe do pedido, classe da resposta).
+    Só usa os módulos *_pb2: o transporte grpcurl não carrega o runtime grpc.
+    """
+    from . import voter_pb2, voting_pb2
+
+    return {
+        "voting.VoterRegistrationService/IssueVotingCredential": (voter_pb2.VoterRequest, voter_pb2.VoterResponse),
+        "voting.VotingService/GetCandidates": (voting_pb2.GetCandidatesRequest, voting_pb2.GetCandidatesResponse),
+        "voting.VotingService/Vote": (voting_pb2.VoteRequest, voting_pb2.VoteResponse),
+        "voting.VotingService/GetResults": (voting_pb2.GetResultsRequest, voting_pb2.GetResultsResponse),
+        "voting.VotingService/BatchVote": (voting_pb2.VoteRequest, voting_pb2.BatchVoteResponse),
+        "voting.VotingService/WatchResults": (voting_pb2.WatchResultsRequest, voting_pb2.GetResultsResponse),
+    }
+
+
+@functools.lru_cache(maxsize=None)
+def _method_table() -> Dict[str, tuple]:
+    """
+    Mapeia "pacote.Serviço/Método" -> (classe do stub, nome do método, classe do pedido, classe da resposta).
+    Import tardio: os stubs *_pb2_grpc importam grpc, que só o transporte nativo usa.
+    """
+    from . import voter_pb2_grpc, voting_pb2_grpc
+
+    stubs = {
+        "voting.VoterRegistrationService": voter_pb2_grpc.VoterRegistrationServiceStub,
+        "voting.VotingService": voting_pb2_grpc.VotingServiceStub,
+    }
+    table = {}
+    for full_method, (request_cls, response_cls) in _message_table().items():
+        service, method = full_method.rsplit("/", 1)
+        table[full_method] = (stubs[service], method, request_cls, response_cls)
+    return table
+
+
+def deadline_for(full_method: str) -> float:
+    """
+    Deadline configurado para "pacote.Serviço/Método" (ex.: GRPC_DEADLINE_GETRESULTS).
+    """
+    method = full_method.rsplit("/", 1)[-1].upper()
+    return float(os.getenv(f"GRPC_DEADLINE_{method}", GRPC_DEADLINE_S))
+
+
+def _channel_options(authority: str = "") -> List[tuple]:
+    options = [
+        ("grpc.keepalive_time_ms", GRPC_KEEPALIVE_MS),
+        ("grpc.keepalive_timeout_ms", GRPC_KEEPALIVE_TIMEOUT_MS),
+        ("grpc.keepalive_permit_without_calls", 1),
+        ("grpc.http2.max_pings_without_data", 0),
+        # Sem isto, canais com os mesmos argumentos partilham a mesma ligação TCP
+        # e o pool deixaria de ter efeito.
+        ("grpc.use_local_subchannel_pool", 1),
+    ]
+    if GRPC_CERT_HOSTNAME:
+        options.append(("grpc.ssl_target_name_override", GRPC_CERT_HOSTNAME))
+    elif authority and not GRPC_PLAINTEXT:
+        options.append(("grpc.ssl_target_name_override", authority))
+    if authority:
+        options.append(("grpc.default_authority", authority))
+    return options
+
+
+def _channel_credentials():
+    import grpc
+
+    root = None
+    if GRPC_CERT_PEM_PATH:
+        root = Path(GRPC_CERT_PEM_PATH).read_bytes()
+    return grpc.ssl_channel_credentials(root_certificates=root)
+
+
+def _open_channel(api, target: str, authority: str = ""):
+    """
+    Abre um canal com as opções/credenciais configuradas; 'api' é o módulo grpc ou grpc.aio.
+    """
+    if GRPC_PLAINTEXT:
+        return api.insecure_channel(target, options=_channel_options(authority))
+    return api.secure_channel(target, _channel_credentials(), options=_channel_options(authority))
+
+
+class _ChannelPool:
+    """
+    Canais de um destino (abertos na primeira utilização, round-robin), com stubs e RPCs em cache
+    por canal.
+    """
+
+    def __init__(self, api, endpoint, size: int = GRPC_POOL_SIZE):
+        self._api = api
+        self.endpoint = endpoint
+        self.size = max(1, size)
+        self.channels: List[Any] = []
+        self._stubs: List[Dict[Any, Any]] = []
+        self._next = itertools.count()
+
+    def open(self) -> None:
+        if not self.channels:
+            for _ in range(self.size):
+                self.channels.append(_open_channel(self._api, self.endpoint.target, self.endpoint.authority))
+                self._stubs.append({})
+
+    def _slot(self) -> int:
+        self.open()
+        return next(self._next) % len(self.channels)
+
+    def stub(self, stub_cls):
+        i = self._slot()
+        stub = self._stubs[i].get(stub_cls)
+        if stub is None:
+            stub = self._stubs[i][stub_cls] = stub_cls(self.channels[i])
+        return stub
+
+    def raw_rpc(self, full_method: str, request_cls):
+        # Sem response_deserializer: a chamada devolve os bytes da resposta tal como recebidos.
+        i = self._slot()
+        rpc = self._stubs[i].get(full_method)
+        if rpc is None:
+            rpc = self._stubs[i][full_method] = self.channels[i].unary_unary(
+                "/" + full_method, request_serializer=request_cls.SerializeToString, response_deserializer=None,
+            )
+        return rpc
+
+    def raw_client_stream(self, full_method: str, request_cls):
+        # Client-streaming (vários pedidos, uma resposta) com a resposta em bytes (ver raw_rpc).
+        i = self._slot()
+        key = ("client_stream", full_method)
+        rpc = self._stubs[i].get(key)
+        if rpc is None:
+            rpc = self._stubs[i][key] = self.channels[i].stream_unary(
+                "/" + full_method, request_serializer=request_cls.SerializeToString, response_deserializer=None,
+            )
+        return rpc
+
+    def raw_stream(self, full_method: str, request_cls):
+        # Server-streaming com as respostas em bytes (ver raw_rpc).
+        i = self._slot()
+        key = ("stream", full_method)
+        rpc = self._stubs[i].get(key)
+        if rpc is None:
+            rpc = self._stubs[i][key] = self.channels[i].unary_stream(
+                "/" + full_method, request_serializer=request_cls.SerializeToString, response_deserializer=None,
+            )
+        return rpc
+
+
+def _message_to_dict(message) -> Dict[str, Any]:
+    """
+    Converte a resposta protobuf no mesmo formato de dicionário devolvido pelo caminho grpcurl
+    (nomes snake_case e valores por omissão incluídos).
+    """
+    from google.protobuf import json_format
+
+    return json_format.MessageToDict(
+        message,
+        preserving_proto_field_name=True,
+        always_print_fields_with_no_presence=True,
+    )
+
+
+class GrpcTransport:
+    """
+    Transporte nativo: por destino, um pool de canais gRPC persistentes (keepalive) e stubs gerados.
+    O destino de cada chamada é escolhido pelo balanceador (balancer.routed).
+    Os erros gRPC são convertidos em GrpcurlError para manter o mapeamento HTTP 502 em main.py.
+    """
+
+    name = "grpc"
+
+    def __init__(self, pool_size: int = GRPC_POOL_SIZE):
+        import grpc
+
+        self._grpc = grpc
+        self.pool_size = pool_size
+        self._methods = _method_table()
+        self._pools: Dict[str, _ChannelPool] = {}
+        self._lock = threading.Lock()
+
+    def _pool(self, endpoint) -> _ChannelPool:
+        pool = self._pools.get(endpoint.target)
+        if pool is None:
+            with self._lock:
+                pool = self._pools.get(endpoint.target)
+                if pool is None:
+                    pool = _ChannelPool(self._grpc, endpoint, self.pool_size)
+                    pool.open()
+                    self._pools[endpoint.target] = pool
+        return pool
+
+    def _method(self, full_method: str) -> tuple:
+        try:
+            return self._methods[full_method]
+        except KeyError as e:
+            raise GrpcurlError(f"Método gRPC desconhecido: {full_method}") from e
+
+    def call(self, proto_name: str, full_method: str, payload: Dict[str, Any],
+             timeout: float | None = None) -> Dict[str, Any]:
+        stub_cls, method_name, request_cls, _ = self._method(full_method)
+        with routed(full_method) as endpoint:
+            rpc = getattr(self._pool(endpoint).stub(stub_cls), method_name)
+            try:
+                with span("rpc"):
+                    response = rpc(request_cls(**payload), timeout=timeout)
+            except self._grpc.RpcError as e:
+                raise GrpcurlError(
+                    f"Falha gRPC (code={e.code().name}). Detalhe: {e.details()}"
+                ) from e
+        return _message_to_dict(response)
+
+    def call_raw(self, proto_name: str, full_method: str, payload: Dict[str, Any],
+                 timeout: float | None = None) -> bytes:
+        _, _, request_cls, _ = self._method(full_method)
+        with routed(full_method) as endpoint:
+            rpc = self._pool(endpoint).raw_rpc(full_method, request_cls)
+            try:
+                with span("rpc"):
+                    return rpc(request_cls(**payload), timeout=timeout)
+            except self._grpc.RpcError as e:
+                raise GrpcurlError(
+                    f"Falha gRPC (code={e.code().name}). Detalhe: {e.details()}"
+                ) from e
+
+    def close(self) -> None:
+        for pool in self._pools.values():
+            for channel in pool.channels:
+                channel.close()
+
+
+_transport = None
+_transport_lock = threading.Lock()
+
+
+def get_transport():
+    """
+    Devolve o transporte partilhado, escolhido por GRPC_TRANSPORT (criado na primeira utilização).
+    """
+    global _transport
+    if _transport is None:
+        with _transport_lock:
+            if _transport is None:
+                if GRPC_TRANSPORT == "grpc":
+                    _transport = GrpcTransport()
+                elif GRPC_TRANSPORT == "grpcurl":
+                    _transport = GrpcurlTransport()
+                else:
+                    raise GrpcurlError(f"GRPC_TRANSPORT inválido: {GRPC_TRANSPORT!r} (usar 'grpc' ou 'grpcurl')")
+    return _transport
+
+
+class _Client:
+    def __init__(self, transport=None):
+        self._transport = transport
+
+    @property
+    def transport(self):
+        return self._transport or get_transport()
+
+    def _call(self, proto_name: str, full_method: str, payload: Dict[str, Any], raw: bool = False):
+        """
+        Devolve o dicionário da resposta ou, com raw=True, os bytes protobuf da resposta.
+        """
+        # Import tardio: resilience depende de GrpcurlError, definido neste módulo.
+        from .resilience import breaker_for
+
+        breaker = breaker_for(full_method)
+        breaker.before_call()
+        call = self.transport.call_raw if raw else self.transport.call
+        try:
+            with track_upstream(full_method):
+                result = call(proto_name, full_method, payload, timeout=deadline_for(full_method))
+        except Exception:
+            # Qualquer erro (não só GrpcurlError) liberta a sonda do HALF_OPEN.
+            breaker.on_failure()
+            raise
+        breaker.on_success()
+        return result
+
+
+class RegistrationClient(_Client):
+    def issue_credential(self, citizen_card_number: str, raw: bool = False):
+        return self._call(
             VOTER_PROTO_NAME,
             "voting.VoterRegistrationService/IssueVotingCredential",
             {"citizen_card_number": citizen_card_number},
+            raw=raw,
         )
 
 
-class VotingClient:
-    def get_candidates(self) -> List[Dict[str, Any]]:
-        data = _run_grpcurl(
+class VotingClient(_Client):
+    def get_candidates(self, raw: bool = False):
+        # raw=True: bytes protobuf da resposta, tal como recebidos do AV.
+        data = self._call(
             VOTING_PROTO_NAME,
             "voting.VotingService/GetCandidates",
             {},
+            raw=raw,
         )
-        return data.get("candidates", [])
+        return data if raw else data.get("candidates", [])
 
-    def vote(self, voting_credential: str, candidate_id: int) -> Dict[str, Any]:
-        return _run_grpcurl(
+    def vote(self, voting_credential: str, candidate_id: int, raw: bool = False):
+        return self._call(
             VOTING_PROTO_NAME,
             "voting.VotingService/Vote",
             {"voting_credential": voting_credential, "candidate_id": candidate_id},
+            raw=raw,
         )
 
-    def get_results(self) -> List[Dict[str, Any]]:
-        data = _run_grpcurl(
+    def get_results(self, raw: bool = False):
+        # raw=True: bytes protobuf da resposta, tal como recebidos do AV.
+        data = self._call(
             VOTING_PROTO_NAME,
             "voting.VotingService/GetResults",
             {},
+            raw=raw,
         )
-        return data.get("results", [])
+        return data if raw else data.get("results", [])
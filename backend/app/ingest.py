@@ -0,0 +1,316 @@
+"""
+Modo de ingestão assíncrona de votos (VOTE_INGEST_MODE=queue).
+
+/vote valida localmente, grava o voto numa fila SQLite durável e responde 202 com um ticket.
+Um dispatcher em segundo plano envia a fila ao AV com concorrência limitada e novas tentativas
+(backoff exponencial); GET /vote/{ticket} devolve o estado e, no fim, success/message do AV.
+
+Cada voto reclamado pelo dispatcher fica "sending" com uma lease: se o processo terminar a meio,
+a lease expira e o voto volta a ser enviado (o AV recusa credenciais repetidas).
+A mesma credencial só pode ter um voto na fila ou aceite; depois de um voto "failed" ou recusado
+pode voltar a ser submetida.
+"""
+import asyncio
+import logging
+import os
+import sqlite3
+import threading
+import time
+import uuid
+from typing import Any, Awaitable, Callable, Dict, List
+
+from .credentials import credential_digest
+from .grpc_clients import GrpcurlError
+from .metrics import Counter, Gauge
+
+VOTE_INGEST_MODE = os.getenv("VOTE_INGEST_MODE", "sync").strip().lower()
+VOTE_QUEUE_PATH = os.getenv("VOTE_QUEUE_PATH", "vote_queue.sqlite3")
+VOTE_QUEUE_MAX_DEPTH = int(os.getenv("VOTE_QUEUE_MAX_DEPTH", "100000"))
+VOTE_QUEUE_CONCURRENCY = int(os.getenv("VOTE_QUEUE_CONCURRENCY", "32"))
+VOTE_QUEUE_MAX_ATTEMPTS = int(os.getenv("VOTE_QUEUE_MAX_ATTEMPTS", "8"))
+VOTE_QUEUE_LEASE_S = float(os.getenv("VOTE_QUEUE_LEASE_S", "60"))
+
+PENDING, SENDING, DONE, FAILED = "pending", "sending", "done", "failed"
+
+QUEUE_DEPTH = Gauge("vote_queue_depth", "Votos na fila à espera de envio ao AV.")
+QUEUE_EVENTS = Counter("vote_queue_events_total", "Eventos da fila de votos.", ("event",))
+
+_log = logging.getLogger(__name__)
+
+
+class QueueFull(Exception):
+    pass
+
+
+class DuplicateVote(Exception):
+    def __init__(self, ticket: str):
+        self.ticket = ticket
+        super().__init__(ticket)
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS vote_queue (
+    ticket          TEXT PRIMARY KEY,
+    digest          BLOB NOT NULL,
+    credential      TEXT NOT NULL,
+    candidate_id    INTEGER NOT NULL,
+    status          TEXT NOT NULL,
+    success         INTEGER,
+    message         TEXT NOT NULL DEFAULT '',
+    attempts        INTEGER NOT NULL DEFAULT 0,
+    not_before      REAL NOT NULL,
+    created_at      REAL NOT NULL,
+    updated_at      REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS vote_queue_ready ON vote_queue (status, not_before);
+"""
+
+# Uma credencial só bloqueia novos votos enquanto o seu voto está na fila ou depois de aceite pelo AV:
+# um voto "failed" (AV indisponível) ou recusado não impede que a credencial volte a ser usada.
+_ACTIVE = "status IN ('pending', 'sending') OR (status = 'done' AND success = 1)"
+_ACTIVE_INDEX = f"CREATE UNIQUE INDEX IF NOT EXISTS vote_queue_active ON vote_queue (digest) WHERE {_ACTIVE};"
+
+# Filas criadas por versões anteriores têm UNIQUE na coluna digest (também para votos falhados).
+_MIGRATE_DIGEST_UNIQUE = """
+BEGIN IMMEDIATE;
+ALTER TABLE vote_queue RENAME TO vote_queue_old;
+DROP INDEX IF EXISTS vote_queue_ready;
+""" + _SCHEMA + """
+INSERT INTO vote_queue SELECT * FROM vote_queue_old;
+DROP TABLE vote_queue_old;
+COMMIT;
+"""
+
+
+class VoteQueue:
+    """
+    Fila durável em SQLite (WAL, synchronous=FULL): um voto aceite (202) sobrevive a um reinício.
+    Uma ligação por thread; as operações são chamadas via asyncio.to_thread.
+
+    Com vários workers, qualquer um pode concluir um voto que outro pôs na fila: a profundidade
+    (VOTE_QUEUE_MAX_DEPTH, vote_queue_depth) vem da contagem na base de dados, refeita em claim()
+    no máximo a cada DEPTH_REFRESH_S, e não de contadores locais.
+    """
+
+    DEPTH_REFRESH_S = 1.0
+
+    def __init__(self, path: str = VOTE_QUEUE_PATH):
+        self.path = path
+        self._local = threading.local()
+        self._lock = threading.Lock()
+        conn = self._conn()
+        conn.executescript(_SCHEMA)
+        table = conn.execute("SELECT sql FROM sqlite_master WHERE type = 'table' AND name = 'vote_queue'").fetchone()[0]
+        if "NOT NULL UNIQUE" in table:
+            conn.executescript(_MIGRATE_DIGEST_UNIQUE)
+        conn.executescript(_ACTIVE_INDEX)
+        self._refresh_depth()
+
+    def _conn(self) -> sqlite3.Connection:
+        conn = getattr(self._local, "conn", None)
+        if conn is None:
+            conn = sqlite3.connect(self.path, timeout=30, isolation_level=None)
+            conn.execute("PRAGMA journal_mode=WAL")
+            conn.execute("PRAGMA synchronous=FULL")
+            self._local.conn = conn
+        return conn
+
+    def _count_open(self) -> int:
+        return self._conn().execute(
+            "SELECT COUNT(*) FROM vote_queue WHERE status IN (?, ?)", (PENDING, SENDING)
+        ).fetchone()[0]
+
+    @property
+    def depth(self) -> int:
+        """
+        Votos por enviar em toda a fila (partilhada pelos workers): a última contagem na base de dados,
+        mais os votos que este processo acrescentou desde então.
+        """
+        return self._depth
+
+    def _refresh_depth(self) -> int:
+        depth = self._count_open()
+        with self._lock:
+            self._depth = depth
+            self._depth_at = time.monotonic()
+        QUEUE_DEPTH.set(depth)
+        return depth
+
+    def enqueue(self, credential: str, candidate_id: int) -> str:
+        # Com a estimativa no limite, confirma na base: outros workers podem ter esvaziado a fila.
+        if self._depth >= VOTE_QUEUE_MAX_DEPTH and self._refresh_depth() >= VOTE_QUEUE_MAX_DEPTH:
+            raise QueueFull()
+        digest = credential_digest(credential)
+        ticket = uuid.uuid4().hex
+        now = time.time()
+        try:
+            self._conn().execute(
+                "INSERT INTO vote_queue (ticket, digest, credential, candidate_id, status, not_before, created_at, updated_at)"
+                " VALUES (?, ?, ?, ?, ?, ?, ?, ?)",
+                (ticket, digest, credential, candidate_id, PENDING, now, now, now),
+            )
+        except sqlite3.IntegrityError:
+            row = self._conn().execute(
+                f"SELECT ticket FROM vote_queue WHERE digest = ? AND ({_ACTIVE})", (digest,)
+            ).fetchone()
+            raise DuplicateVote(row[0] if row else "")
+        with self._lock:
+            self._depth += 1
+        QUEUE_EVENTS.labels("enqueued").inc()
+        return ticket
+
+    def claim(self, limit: int) -> List[Dict[str, Any]]:
+        """
+        Reclama até 'limit' votos prontos (pendentes ou com lease expirada) e marca-os "sending".
+        """
+        now = time.time()
+        conn = self._conn()
+        conn.execute("BEGIN IMMEDIATE")
+        try:
+            rows = conn.execute(
+                "SELECT ticket, credential, candidate_id, attempts FROM vote_queue"
+                " WHERE status IN (?, ?) AND not_before <= ? ORDER BY not_before LIMIT ?",
+                (PENDING, SENDING, now, limit),
+            ).fetchall()
+            conn.executemany(
+                "UPDATE vote_queue SET status = ?, attempts = attempts + 1, not_before = ?, updated_at = ?"
+                " WHERE ticket = ?",
+                [(SENDING, now + VOTE_QUEUE_LEASE_S, now, r[0]) for r in rows],
+            )
+            conn.execute("COMMIT")
+        except BaseException:
+            conn.execute("ROLLBACK")
+            raise
+        if time.monotonic() - self._depth_at >= self.DEPTH_REFRESH_S:
+            self._refresh_depth()
+        return [
+            {"ticket": r[0], "credential": r[1], "candidate_id": r[2], "attempts": r[3] + 1}
+            for r in rows
+        ]
+
+    def complete(self, ticket: str, success: bool, message: str) -> None:
+        # A credencial deixa de ser necessária: só fica o digest.
+        self._conn().execute(
+            "UPDATE vote_queue SET status = ?, success = ?, message = ?, credential = '', updated_at = ?"
+            " WHERE ticket = ?",
+            (DONE, int(success), message, time.time(), ticket),
+        )
+        QUEUE_EVENTS.labels("delivered").inc()
+
+    def retry(self, ticket: str, delay: float, message: str) -> None:
+        self._conn().execute(
+            "UPDATE vote_queue SET status = ?, message = ?, not_before = ?, updated_at = ? WHERE ticket = ?",
+            (PENDING, message, time.time() + delay, time.time(), ticket),
+        )
+        QUEUE_EVENTS.labels("retried").inc()
+
+    def fail(self, ticket: str, message: str) -> None:
+        self._conn().execute(
+            "UPDATE vote_queue SET status = ?, success = 0, message = ?, credential = '', updated_at = ?"
+            " WHERE ticket = ?",
+            (FAILED, message, time.time(), ticket),
+        )
+        QUEUE_EVENTS.labels("failed").inc()
+
+    def status(self, ticket: str) -> Dict[str, Any] | None:
+        row = self._conn().execute(
+            "SELECT status, success, message, attempts FROM vote_queue WHERE ticket = ?", (ticket,)
+        ).fetchone()
+        if row is None:
+            return None
+        status, success, message, attempts = row
+        out: Dict[str, Any] = {"ticket": ticket, "status": status, "attempts": attempts}
+        if status in (DONE, FAILED):
+            out["success"] = bool(success)
+            out["message"] = message
+        return out
+
+    def close(self) -> None:
+        conn = getattr(self._local, "conn", None)
+        if conn is not None:
+            conn.close()
+            self._local.conn = None
+
+
+class VoteDispatcher:
+    """
+    Esvazia a fila para o AV com no máximo 'concurrency' votos em curso.
+    Falhas de transporte (incluindo circuit breaker aberto) e erros inesperados voltam à fila com
+    backoff exponencial; ao fim de VOTE_QUEUE_MAX_ATTEMPTS o voto fica "failed".
+    """
+
+    def __init__(self, queue: VoteQueue, send: Callable[[str, int], Awaitable[Dict[str, Any]]],
+                 on_success: Callable[[str], Awaitable[None]], concurrency: int = VOTE_QUEUE_CONCURRENCY,
+                 poll_s: float = 0.5):
+        self.queue = queue
+        self._send = send
+        self._on_success = on_success
+        self.concurrency = concurrency
+        self.poll_s = poll_s
+        self._wakeup = asyncio.Event()
+        self._tasks: set = set()
+        self._runner: asyncio.Task | None = None
+
+    def notify(self) -> None:
+        self._wakeup.set()
+
+    def start(self) -> None:
+        self._runner = asyncio.ensure_future(self._run())
+
+    async def stop(self, grace_s: float = 5.0) -> None:
+        if self._runner is not None:
+            self._runner.cancel()
+        if self._tasks:
+            # Os votos não concluídos voltam a ser enviados após a lease (no próximo arranque).
+            await asyncio.wait(self._tasks, timeout=grace_s)
+
+    async def _run(self) -> None:
+        while True:
+            free = self.concurrency - len(self._tasks)
+            if free <= 0:
+                # Backpressure: só reclama mais votos quando um envio termina.
+                await asyncio.wait(set(self._tasks), return_when=asyncio.FIRST_COMPLETED)
+                continue
+
+            self._wakeup.clear()
+            try:
+                rows = await asyncio.to_thread(self.queue.claim, free)
+            except sqlite3.Error:
+                rows = []
+            for row in rows:
+                task = asyncio.ensure_future(self._deliver(row))
+                self._tasks.add(task)
+                task.add_done_callback(self._tasks.discard)
+
+            if not rows:
+                try:
+                    await asyncio.wait_for(self._wakeup.wait(), self.poll_s)
+                except asyncio.TimeoutError:
+                    pass
+
+    async def _deliver(self, row: Dict[str, Any]) -> None:
+        try:
+            await self._deliver_once(row)
+        except Exception:
+            # Ex.: erro do SQLite ao atualizar o estado: o voto volta a ser enviado quando a lease expirar.
+            _log.exception("Falha ao processar o voto em fila %s", row["ticket"])
+
+    async def _deliver_once(self, row: Dict[str, Any]) -> None:
+        try:
+            resp = await self._send(row["credential"], row["candidate_id"])
+            success = bool(resp.get("success", False))
+            message = str(resp.get("message", ""))
+        except Exception as e:
+            # Falhas de transporte e erros inesperados (ex.: resposta inválida) voltam à fila com recuo.
+            if not isinstance(e, GrpcurlError):
+                _log.exception("Erro inesperado ao enviar o voto em fila %s", row["ticket"])
+            if row["attempts"] >= VOTE_QUEUE_MAX_ATTEMPTS:
+                await asyncio.to_thread(self.queue.fail, row["ticket"], f"Falha ao contactar AV: {e}")
+            else:
+                delay = min(60.0, 0.5 * 2 ** (row["attempts"] - 1))
+                await asyncio.to_thread(self.queue.retry, row["ticket"], delay, str(e))
+            return
+
+        if success:
+            await self._on_success(row["credential"])
+        await asyncio.to_thread(self.queue.complete, row["ticket"], success, message)
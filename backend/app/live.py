@@ -0,0 +1,173 @@
+"""
+Resultados em tempo real: um único stream WatchResults ao AV, distribuído a todos os browsers
+ligados a /results/stream (Server-Sent Events).
+
+- Uma só ligação ao AV, seja qual for a audiência: aberta com o primeiro cliente e fechada quando
+  sai o último. Cada snapshot recebido é instalado na cache de resultados (ResultsCache.publish),
+  pelo que /results também deixa de chamar GetResults enquanto o stream está ativo.
+- Se o AV não implementar WatchResults (UNIMPLEMENTED), ou com RESULTS_WATCH=poll, os snapshots
+  vêm da cache de resultados: no máximo um GetResults por RESULTS_REFRESH_S, como em /results.
+- Backpressure por cliente: cada cliente guarda apenas o snapshot mais recente ainda por enviar.
+  Um cliente lento (ligação saturada) salta versões intermédias em vez de acumular uma fila, e
+  recebe depois o delta desde a última versão que lhe foi efetivamente enviada.
+"""
+import asyncio
+import logging
+import os
+import random
+from typing import AsyncIterator, Callable, Set
+
+from .cache import ResultsCache, ResultsSnapshot
+from .grpc_clients import GrpcurlError, is_unimplemented
+from .metrics import Counter, Gauge, error_class
+from .resilience import UpstreamUnavailable
+
+# auto: tenta WatchResults e passa a consultas periódicas se o AV não o implementar; poll: só consultas.
+RESULTS_WATCH = os.getenv("RESULTS_WATCH", "auto").strip().lower()
+RESULTS_STREAM_MAX_CLIENTS = int(os.getenv("RESULTS_STREAM_MAX_CLIENTS", "10000"))
+RESULTS_STREAM_HEARTBEAT_S = float(os.getenv("RESULTS_STREAM_HEARTBEAT_S", "15"))
+RESULTS_WATCH_RETRY_MAX_S = float(os.getenv("RESULTS_WATCH_RETRY_MAX_S", "30"))
+
+STREAM_CLIENTS = Gauge("results_stream_clients", "Clientes ligados a /results/stream.")
+STREAM_UPDATES = Counter(
+    "results_stream_updates_total", "Snapshots de resultados obtidos pelo broadcaster, por origem.", ("source",))
+STREAM_COALESCED = Counter(
+    "results_stream_coalesced_total", "Snapshots substituídos por um mais recente antes de chegarem a um cliente lento.")
+STREAM_FAILURES = Counter(
+    "results_watch_failures_total", "Streams WatchResults interrompidos, por classe de erro.", ("error",))
+
+_log = logging.getLogger(__name__)
+
+
+class Subscriber:
+    """
+    Um cliente de /results/stream: o snapshot mais recente ainda por enviar (no máximo um).
+    """
+
+    __slots__ = ("_latest", "_event")
+
+    def __init__(self):
+        self._latest: ResultsSnapshot | None = None
+        self._event = asyncio.Event()
+
+    def offer(self, snapshot: ResultsSnapshot) -> None:
+        if self._latest is not None:
+            STREAM_COALESCED.inc()
+        self._latest = snapshot
+        self._event.set()
+
+    async def next(self, timeout: float) -> ResultsSnapshot | None:
+        """
+        Próximo snapshot a enviar, ou None se nada chegou em 'timeout' segundos (heartbeat).
+        """
+        try:
+            await asyncio.wait_for(self._event.wait(), timeout)
+        except asyncio.TimeoutError:
+            return None
+        self._event.clear()
+        snapshot, self._latest = self._latest, None
+        return snapshot
+
+
+class ResultsBroadcaster:
+    """
+    Distribui os snapshots de resultados (um stream ao AV) por todos os clientes ligados.
+    'watch' devolve o iterador assíncrono de bytes GetResultsResponse (AsyncVotingClient.watch_results).
+    """
+
+    def __init__(self, cache: ResultsCache, watch: Callable[[], AsyncIterator[bytes]], poll_interval: float,
+                 max_clients: int = RESULTS_STREAM_MAX_CLIENTS, mode: str = RESULTS_WATCH):
+        self._cache = cache
+        self._watch = watch
+        self.poll_interval = poll_interval
+        self.max_clients = max_clients
+        self.streaming = mode != "poll"
+        self._subscribers: Set[Subscriber] = set()
+        self._task: asyncio.Task | None = None
+        self._version: int | None = None
+
+    @property
+    def full(self) -> bool:
+        return len(self._subscribers) >= self.max_clients
+
+    def subscribe(self) -> Subscriber:
+        subscriber = Subscriber()
+        self._subscribers.add(subscriber)
+        STREAM_CLIENTS.set(len(self._subscribers))
+        # Primeira resposta imediata com o snapshot que já existe; as atualizações seguem-se.
+        snapshot = self._cache.peek()
+        if snapshot is not None:
+            subscriber.offer(snapshot)
+        if self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+        return subscriber
+
+    def unsubscribe(self, subscriber: Subscriber) -> None:
+        self._subscribers.discard(subscriber)
+        STREAM_CLIENTS.set(len(self._subscribers))
+        if not self._subscribers:
+            self._stop()
+
+    def _stop(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            self._task = None
+        self._version = None
+        self._cache.live = False
+
+    async def close(self) -> None:
+        task = self._task
+        self._stop()
+        if task is not None:
+            await asyncio.gather(task, return_exceptions=True)
+
+    def _publish(self, snapshot: ResultsSnapshot, source: str) -> None:
+        STREAM_UPDATES.labels(source).inc()
+        if snapshot.version == self._version:
+            return
+        self._version = snapshot.version
+        for subscriber in self._subscribers:
+            subscriber.offer(snapshot)
+
+    async def _watch_once(self) -> bool:
+        """
+        Consome o stream WatchResults até terminar; devolve True se chegou a receber alguma mensagem.
+        """
+        received = False
+        try:
+            async for raw in self._watch():
+                self._cache.live = True
+                received = True
+                self._publish(self._cache.publish(raw), "stream")
+        except GrpcurlError as e:
+            STREAM_FAILURES.labels(error_class(e)).inc()
+            if is_unimplemented(e):
+                # O AV não tem WatchResults: passa a consultas periódicas até ao fim do processo.
+                self.streaming = False
+        except Exception as e:
+            # Erro inesperado (ex.: mensagem inválida): regista e religa com recuo, como numa falha do AV.
+            STREAM_FAILURES.labels(error_class(e)).inc()
+            _log.exception("Stream WatchResults interrompido por um erro inesperado")
+        finally:
+            self._cache.live = False
+        return received
+
+    async def _run(self) -> None:
+        delay = self.poll_interval
+        while True:
+            if self.streaming:
+                if await self._watch_once():
+                    delay = self.poll_interval
+            # Sem stream (ou entre tentativas): snapshot da cache, com o mesmo limite de chamadas de /results.
+            try:
+                self._publish(await self._cache.get(), "poll")
+            except (GrpcurlError, UpstreamUnavailable):
+                pass
+            except Exception:
+                _log.exception("Falha inesperada ao obter os resultados para /results/stream")
+            if self.streaming:
+                # Nova tentativa com recuo exponencial e jitter (evita religações em sincronia).
+                await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+                delay = min(delay * 2, RESULTS_WATCH_RETRY_MAX_S)
+            else:
+                await asyncio.sleep(self.poll_interval)
@@ -1,15 +1,105 @@
-from fastapi import FastAPI, HTTPException
+import asyncio
+import collections
+import functools
+import hmac
+import json
+import logging
+from contextlib import asynccontextmanager
+from pathlib import Path
+from typing import List
+
+from fastapi import FastAPI, HTTPException, Query, Request, Response
 from pydantic import BaseModel, Field
-from dotenv import load_dotenv
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import JSONResponse, StreamingResponse
 import os
 
-
-from .grpc_clients import RegistrationClient, VotingClient, GrpcurlError
-
-load_dotenv()
-
-app = FastAPI(title="VotingSystem-App Backend", version="0.2.1")
+# Carregar o .env antes de importar os clientes: a configuração gRPC é lida no import.
+# O python-dotenv só é importado se existir um .env (procurado a partir desta pasta, como o find_dotenv).
+_ENV_FILE = next((d / ".env" for d in Path(__file__).resolve().parents if (d / ".env").is_file()), None)
+if _ENV_FILE is not None:
+    from dotenv import load_dotenv
+
+    load_dotenv(_ENV_FILE)
+
+from .grpc_clients import GrpcurlError
+from .aio_clients import AsyncRegistrationClient, AsyncVotingClient, close_async_transport, get_async_transport
+from .audit import ACCEPTED, AUDIT_FAILURES, AUDIT_LOG_PATH, ERROR, REJECTED, AuditLog
+from .balancer import start_health_checks, stop_health_checks
+from .batching import VOTE_BATCH_MAX, VoteBatcher
+from .capture import CAPTURE_PATH, CaptureLog, CaptureMiddleware
+from .cache import CandidateCache, IdempotencyCache, ResultsCache, make_etag
+from .codec import (
+    JSON,
+    PROTOBUF,
+    Body,
+    Reply,
+    candidates_json,
+    candidates_page_json,
+    json_response,
+    protobuf_response,
+    register_json,
+    representation_etag,
+    results_json,
+    results_page_json,
+    vote_json,
+    wants_protobuf,
+)
+from .credentials import CredentialStoreBusy, CredentialStoreFull, open_credential_store
+from .resilience import UpstreamUnavailable
+from .profiler import ADMIN_TOKEN, PROFILE_ON_START, ProfilerBusy, profiler
+from .static_site import SERVE_SITE, register_site_routes
+from .tracing import ENABLED as TRACING_ENABLED, TimingMiddleware, mark, span
+from .live import RESULTS_STREAM_HEARTBEAT_S, ResultsBroadcaster
+from .ranking import PAGE_MAX, PAGE_SIZE, rank_position
+from .shared import SHARED_SNAPSHOTS, Election, SharedFeed, SharedSegment, segment_name
+from .startup import STARTUP_STEP_TIMEOUT_S, STARTUP_WARMUP, Readiness
+from .ingest import VOTE_INGEST_MODE, DuplicateVote, QueueFull, VoteDispatcher, VoteQueue
+from .metrics import CONTENT_TYPE, REGISTRY, VOTE_REJECTIONS, MetricsMiddleware, register_routes
+from .voter_pb2 import VoterResponse
+from .voting_pb2 import GetCandidatesResponse, GetResultsResponse, VoteResponse
+
+_log = logging.getLogger(__name__)
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    global audit_log, vote_queue, vote_dispatcher
+    start_health_checks()
+    readiness.start()
+    if election is not None:
+        election.start(_lead_shared)
+    if PROFILE_ON_START:
+        profiler.start()
+    if AUDIT_LOG_PATH:
+        audit_log = AuditLog(AUDIT_LOG_PATH)
+    if VOTE_INGEST_MODE == "queue":
+        vote_queue = VoteQueue()
+        vote_dispatcher = VoteDispatcher(vote_queue, _send_queued_vote, _mark_used)
+        vote_dispatcher.start()
+    yield
+    await readiness.close()
+    if election is not None:
+        await election.close()
+        candidates_feed.segment.close()
+        results_feed.segment.close()
+    if vote_dispatcher is not None:
+        await vote_dispatcher.stop()
+        vote_queue.close()
+    if audit_log is not None:
+        audit_log.close()
+    await results_broadcaster.close()
+    if vote_batcher is not None:
+        await vote_batcher.close()
+    await stop_health_checks()
+    profiler.stop()
+    await close_async_transport()
+    USED_CREDENTIALS.close()
+    if capture_log is not None:
+        capture_log.close()
+
+
+app = FastAPI(title="VotingSystem-App Backend", version="0.2.1", lifespan=lifespan)
 
 # -----------------------------
 # CORS (Cross-Origin Resource Sharing)
@@ -36,24 +126,150 @@ app.add_middleware(
     allow_methods=["*"],
     allow_headers=["*"],
 )
+app.add_middleware(MetricsMiddleware)
+if TRACING_ENABLED:
+    # Server-Timing e log estruturado por pedido (ver app/tracing.py).
+    app.add_middleware(TimingMiddleware)
+# Captura para o bench/replay.py (ver app/capture.py); adicionado por último, envolve os restantes.
+capture_log = CaptureLog(CAPTURE_PATH) if CAPTURE_PATH else None
+if capture_log is not None:
+    app.add_middleware(CaptureMiddleware, log=capture_log)
+
+
+registration = AsyncRegistrationClient()
+voting = AsyncVotingClient()
+
+fetch_candidates = functools.partial(voting.get_candidates, raw=True)
+fetch_results = functools.partial(voting.get_results, raw=True)
+watch_results = voting.watch_results
+
+# Modo multi-worker (python -m app.supervisor): só o worker eleito chama GetCandidates, GetResults e
+# WatchResults; os restantes leem os snapshots da memória partilhada (ver app/shared.py).
+election = Election(SHARED_SNAPSHOTS) if SHARED_SNAPSHOTS else None
+if election is not None:
+    candidates_feed = SharedFeed(
+        SharedSegment(segment_name(SHARED_SNAPSHOTS, "candidates")), election, fetch_candidates)
+    results_feed = SharedFeed(
+        SharedSegment(segment_name(SHARED_SNAPSHOTS, "results")), election, fetch_results, watch_results,
+        on_read=lambda version: results_cache.follow(version))
+    fetch_candidates, fetch_results, watch_results = candidates_feed.fetch, results_feed.fetch, results_feed.watch
+
+# Cache da lista de candidatos (muda raramente durante uma eleição).
+# Após CANDIDATES_TTL_S o snapshot continua a ser servido durante CANDIDATES_STALE_S
+# enquanto é atualizado em segundo plano.
+CANDIDATES_TTL_S = float(os.getenv("CANDIDATES_TTL_S", "30"))
+CANDIDATES_STALE_S = float(os.getenv("CANDIDATES_STALE_S", "300"))
+candidate_cache = CandidateCache("candidates", fetch_candidates, CANDIDATES_TTL_S, CANDIDATES_STALE_S)
+
+# Snapshots de resultados: no máximo um GetResults por RESULTS_REFRESH_S, seja qual for
+# o número de clientes; RESULTS_HISTORY versões guardadas para /results?since=<versão>.
+RESULTS_REFRESH_S = float(os.getenv("RESULTS_REFRESH_S", "1"))
+RESULTS_STALE_S = float(os.getenv("RESULTS_STALE_S", "5"))
+RESULTS_HISTORY = int(os.getenv("RESULTS_HISTORY", "64"))
+results_cache = ResultsCache("results", fetch_results, RESULTS_REFRESH_S, RESULTS_STALE_S, RESULTS_HISTORY)
+
+# /results/stream: um único stream WatchResults ao AV (ou uma consulta por RESULTS_REFRESH_S),
+# distribuído a todos os clientes SSE ligados; RESULTS_STREAM_RETRY_MS é o intervalo de religação do browser.
+RESULTS_STREAM_RETRY_MS = int(os.getenv("RESULTS_STREAM_RETRY_MS", "2000"))
+results_broadcaster = ResultsBroadcaster(results_cache, watch_results, RESULTS_REFRESH_S)
+
+
+async def _lead_shared() -> None:
+    """
+    Worker eleito (modo multi-worker): publica na memória partilhada os candidatos a cada
+    CANDIDATES_TTL_S e cada snapshot de resultados do broadcaster (stream WatchResults ao AV).
+    """
+    # Parte do último snapshot do líder anterior, para as versões de resultados continuarem a crescer.
+    latest = results_feed.latest()
+    if latest is not None:
+        results_cache.publish(latest)
+    await asyncio.gather(
+        candidates_feed.mirror(candidate_cache.get, CANDIDATES_TTL_S),
+        results_feed.mirror_stream(
+            results_broadcaster.subscribe, results_broadcaster.unsubscribe, RESULTS_STREAM_HEARTBEAT_S),
+    )
+
+# Aquecimento do arranque (ver app/startup.py): /ready só responde 200 depois destes passos.
+_WARMUP_METHODS = ["voting.VoterRegistrationService/IssueVotingCredential", "voting.VotingService/GetCandidates"]
+readiness = Readiness([
+    ("transport", lambda: get_async_transport().warm_up(_WARMUP_METHODS, STARTUP_STEP_TIMEOUT_S)),
+    ("candidates", candidate_cache.get),
+    ("results", results_cache.get),
+] if STARTUP_WARMUP else [])
+
+# Idempotência de /register (duplo clique, refresh): a mesma resposta do AR para o mesmo cartão
+# durante REGISTER_CACHE_TTL_S, sem guardar o número do cartão em claro. REGISTER_CACHE_SIZE=0 desativa.
+REGISTER_CACHE_SIZE = int(os.getenv("REGISTER_CACHE_SIZE", "100000"))
+REGISTER_CACHE_TTL_S = float(os.getenv("REGISTER_CACHE_TTL_S", "600"))
+register_cache = IdempotencyCache("register", REGISTER_CACHE_SIZE, REGISTER_CACHE_TTL_S)
+
+# Lotes de votos (/votes/batch): votos em curso em simultâneo e tamanho máximo do lote.
+BATCH_VOTE_CONCURRENCY = int(os.getenv("BATCH_VOTE_CONCURRENCY", "16"))
+BATCH_VOTE_MAX_ITEMS = int(os.getenv("BATCH_VOTE_MAX_ITEMS", "50000"))
+
+# Micro-lotes de votos (VOTE_BATCH_MAX > 1): os /vote concorrentes seguem para o AV numa só chamada BatchVote.
+vote_batcher = (
+    VoteBatcher(voting.batch_vote, functools.partial(voting.vote, raw=True)) if VOTE_BATCH_MAX > 1 else None
+)
+
+# Mitigação local: impedir repetição da mesma credencial neste protótipo.
+# Guarda apenas digests; CREDENTIAL_STORE=mmap|sqlite partilha o registo entre workers.
+USED_CREDENTIALS = open_credential_store()
+
+# Ingestão assíncrona (VOTE_INGEST_MODE=queue): fila durável + dispatcher, criados no arranque.
+vote_queue: VoteQueue | None = None
+vote_dispatcher: VoteDispatcher | None = None
+
+# Registo de auditoria dos votos enviados ao AV (AUDIT_LOG_PATH), aberto no arranque.
+audit_log: AuditLog | None = None
+
+
+# As respostas dependem do cabeçalho Accept (JSON ou protobuf).
+_VARY = {"Vary": "Accept"}
+# /candidates e /results também dependem de Accept-Encoding (variante gzip pré-calculada).
+_VARY_ENCODED = {"Vary": "Accept, Accept-Encoding"}
+
+
+def _unavailable(e: UpstreamUnavailable) -> HTTPException:
+    """
+    Circuit breaker aberto ou serviço saturado: 503 com Retry-After, sem chegar a contactar o serviço remoto.
+    """
+    return HTTPException(status_code=503, detail=str(e), headers={"Retry-After": str(e.retry_after)})
 
 
-registration = RegistrationClient()
-voting = VotingClient()
+class ClientDisconnected(Exception):
+    pass
 
-# Mitigação local: impedir repetição da mesma credencial neste protótipo
-USED_CREDENTIALS = set()
 
+@app.exception_handler(ClientDisconnected)
+async def client_disconnected_handler(request: Request, exc: ClientDisconnected):
+    # 499 (convenção nginx): o cliente desligou antes da resposta; ninguém a vai ler.
+    return Response(status_code=499)
 
-def _get(resp: dict, *keys, default=None):
+
+async def _wait_disconnect(request: Request) -> None:
+    while True:
+        message = await request.receive()
+        if message["type"] == "http.disconnect":
+            return
+
+
+async def _upstream(request: Request, coro):
     """
-    Obtém a primeira chave existente em 'resp' (para suportar snake_case e lowerCamelCase),
-    devolvendo 'default' se nenhuma existir.
+    Executa a chamada ao serviço remoto, cancelando-a se o cliente HTTP desligar entretanto
+    (a ligação gRPC/processo grpcurl é libertada de imediato).
     """
-    for k in keys:
-        if k in resp:
-            return resp[k]
-    return default
+    call = asyncio.ensure_future(coro)
+    watcher = asyncio.ensure_future(_wait_disconnect(request))
+    try:
+        await asyncio.wait({call, watcher}, return_when=asyncio.FIRST_COMPLETED)
+    finally:
+        watcher.cancel()
+        if not call.done():
+            call.cancel()
+    if not call.done():
+        raise ClientDisconnected()
+    return call.result()
 
 
 class RegisterIn(BaseModel):
@@ -62,94 +278,582 @@ class RegisterIn(BaseModel):
 
 class VoteIn(BaseModel):
     voting_credential: str = Field(min_length=1)
-    candidate_id: int
+    # int32 no .proto (e no registo de auditoria).
+    candidate_id: int = Field(ge=-(2**31), le=2**31 - 1)
 
 
 @app.get("/health")
-def health():
+async def health():
     return {"status": "ok"}
 
 
+@app.get("/ready")
+async def ready():
+    """
+    Readiness para o balanceador: 200 depois do aquecimento (canais ligados, candidatos e resultados
+    em cache) e enquanto nenhum circuit breaker AR/AV estiver aberto; 503 caso contrário.
+    """
+    ok, body = readiness.status()
+    return JSONResponse(body, status_code=200 if ok else 503)
+
+
+@app.get("/metrics")
+async def metrics():
+    """
+    Métricas em formato Prometheus (latência/erros por método AR/AV e por rota, caches, rejeições locais).
+    """
+    return Response(REGISTRY.render(), media_type=CONTENT_TYPE)
+
+
 @app.post("/register")
-def register(data: RegisterIn):
+async def register(data: RegisterIn, request: Request):
     """
     Fase 1 — Registo:
     Recebe citizen_card_number e obtém voting_credential via serviço AR (grpcurl).
+    Pedidos repetidos para o mesmo cartão (em curso ou recentes) recebem a mesma credencial.
+    Com Accept: application/x-protobuf devolve o VoterResponse recebido do AR.
     """
+    mark("validate")
+    cc = data.citizen_card_number
     try:
-        resp = registration.issue_credential(data.citizen_card_number)
+        raw = await _upstream(
+            request, register_cache.get(cc, lambda: registration.issue_credential(cc, raw=True))
+        )
+    except ClientDisconnected:
+        raise
+    except UpstreamUnavailable as e:
+        raise _unavailable(e)
     except GrpcurlError as e:
         raise HTTPException(status_code=502, detail=f"Erro ao contactar AR (grpcurl): {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro interno no registo: {e}")
 
-    # Suporta snake_case e lowerCamelCase (Protobuf JSON mapping)
-    is_eligible = bool(_get(resp, "is_eligible", "isEligible", default=False))
-    voting_credential = _get(resp, "voting_credential", "votingCredential", default="")
-
-    return {
-        "is_eligible": is_eligible,
-        "voting_credential": voting_credential,
-    }
+    with span("encode"):
+        if wants_protobuf(request.headers.get("accept")):
+            return protobuf_response(raw, _VARY)
+        return json_response(register_json(VoterResponse.FromString(raw)), _VARY)
 
 
 @app.get("/candidates")
-def candidates():
+async def candidates(
+    request: Request,
+    q: str | None = Query(None, max_length=200),
+    offset: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1, le=PAGE_MAX),
+):
     """
     Fase 2 (parte i) — Listagem de candidatos:
-    Obtém a lista de candidatos via serviço AV (grpcurl).
+    Obtém a lista de candidatos via serviço AV (grpcurl), com cache local e ETag.
+    Com Accept: application/x-protobuf devolve o GetCandidatesResponse recebido do AV.
+    Com ?q=<prefixo do nome>, ?offset= ou ?limit= devolve só uma página (com o total), por ordem
+    alfabética na pesquisa e pela ordem do AV nos restantes casos.
     """
     try:
-        resp = voting.get_candidates()  # lista de dicts: [{"id":..., "name":...}, ...]
+        with span("snapshot"):
+            snapshot = await _upstream(request, candidate_cache.get())
+    except ClientDisconnected:
+        raise
+    except UpstreamUnavailable as e:
+        raise _unavailable(e)
     except GrpcurlError as e:
         raise HTTPException(status_code=502, detail=f"Erro ao contactar AV (grpcurl): {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro interno ao obter candidatos: {e}")
 
-    return {"candidates": resp}
+    protobuf = wants_protobuf(request.headers.get("accept"))
+    if q is not None or offset or limit is not None:
+        return _candidates_page(request, snapshot, q, offset, limit or PAGE_SIZE, protobuf)
+    with span("encode"):
+        if protobuf:
+            body = snapshot.body(PROTOBUF, lambda: Body(snapshot.raw, PROTOBUF, representation_etag(snapshot.etag, True)))
+        else:
+            # {"candidates": [{"id":..., "name":...}, ...]}
+            body = snapshot.body(JSON, lambda: Body(candidates_json(snapshot.data).encode("utf-8"), JSON, snapshot.etag))
+        # no-cache: o browser guarda a resposta mas revalida-a com If-None-Match (304 sem corpo).
+        return body.response(
+            request.headers.get("accept-encoding"), request.headers.get("if-none-match"),
+            {"Cache-Control": "no-cache", **_VARY_ENCODED},
+        )
 
 
-@app.post("/vote")
-def do_vote(data: VoteIn):
+def _candidates_page(request: Request, snapshot, q: str | None, offset: int, limit: int, protobuf: bool) -> Response:
     """
-    Fase 2 (partes ii–iii) — Submissão de voto:
-    Submete o voto com voting_credential e candidate_id.
-    Inclui bloqueio local para evitar repetição da credencial no protótipo.
+    Uma página de candidatos (pesquisa por prefixo do nome ou posição na lista), com o total no
+    cabeçalho X-Total-Count (e também no JSON). Não fica guardada no snapshot: as pesquisas variam muito.
+    """
+    with span("search"):
+        if q:
+            total, positions = snapshot.name_index().search(q, offset, limit)
+        else:
+            total = len(snapshot.data)
+            positions = range(offset, min(total, offset + limit))
+        rows = [snapshot.data[i] for i in positions]
+    with span("encode"):
+        etag = representation_etag(make_etag([snapshot.etag, q or "", offset, limit]), protobuf)
+        if protobuf:
+            body = Body(GetCandidatesResponse(candidates=rows).SerializeToString(), PROTOBUF, etag)
+        else:
+            body = Body(candidates_page_json(rows, total, offset, limit).encode("utf-8"), JSON, etag)
+        return body.response(
+            request.headers.get("accept-encoding"), request.headers.get("if-none-match"),
+            {"Cache-Control": "no-cache", "X-Total-Count": str(total), **_VARY_ENCODED},
+        )
+
+
+async def _check_candidate(candidate_id: int) -> None:
+    """
+    Rejeita localmente candidate_id que não constem da lista em cache (sem ida ao AV).
+    Se a lista não puder ser obtida, a validação fica a cargo do AV.
+    """
+    try:
+        snapshot = await candidate_cache.get()
+    except GrpcurlError:
+        return
+    if snapshot.ids and candidate_id not in snapshot.ids:
+        VOTE_REJECTIONS.labels("unknown_candidate").inc()
+        raise HTTPException(status_code=422, detail=f"Candidato inexistente: candidate_id={candidate_id}.")
+
+
+def _check_store_room() -> None:
+    """
+    Registo de credenciais de capacidade fixa (mmap) cheio: recusa antes de contactar o AV, para
+    nenhum voto aceite ficar sem bloqueio local.
+    """
+    if USED_CREDENTIALS.full:
+        VOTE_REJECTIONS.labels("credential_store_full").inc()
+        raise HTTPException(
+            status_code=503,
+            detail="Registo local de credenciais cheio; aumentar CREDENTIAL_STORE_CAPACITY.",
+        )
+
+
+async def _credential_used(credential: str) -> bool:
+    """
+    Consulta o registo local de credenciais; o sqlite corre numa thread, para não parar o event loop.
+    """
+    try:
+        if USED_CREDENTIALS.blocking:
+            return await asyncio.to_thread(USED_CREDENTIALS.__contains__, credential)
+        return credential in USED_CREDENTIALS
+    except CredentialStoreBusy:
+        raise HTTPException(
+            status_code=503,
+            detail="Registo local de credenciais ocupado; tente novamente dentro de instantes.",
+            headers={"Retry-After": "1"},
+        )
+
+
+async def _mark_used(credential: str) -> None:
+    # O voto já foi aceite pelo AV: uma falha aqui só deixa a credencial sem bloqueio local
+    # (ex.: outro worker encheu o registo depois de _check_store_room).
+    try:
+        if USED_CREDENTIALS.blocking:
+            await asyncio.to_thread(USED_CREDENTIALS.add, credential)
+        else:
+            USED_CREDENTIALS.add(credential)
+    except (CredentialStoreFull, CredentialStoreBusy) as e:
+        _log.error("Credencial aceite pelo AV sem bloqueio local: %s", e)
+
+
+def _audit(credential: str, candidate_id: int, status: int) -> None:
+    # O AV já respondeu: uma falha no registo de auditoria não pode mudar a resposta ao cliente.
+    if audit_log is not None:
+        try:
+            audit_log.append(credential, candidate_id, status)
+        except Exception:
+            AUDIT_FAILURES.inc()
+            _log.exception("Falha ao acrescentar o voto ao registo de auditoria")
+
+
+async def _send_vote(credential: str, candidate_id: int) -> bytes:
+    """
+    Bytes do VoteResponse do AV: num micro-lote (vote_batcher) ou numa chamada Vote própria.
     """
-    if data.voting_credential in USED_CREDENTIALS:
+    if vote_batcher is not None:
+        return await vote_batcher.vote(credential, candidate_id)
+    return await voting.vote(credential, candidate_id, raw=True)
+
+
+async def _send_queued_vote(credential: str, candidate_id: int) -> dict:
+    """
+    Envio ao AV pelo dispatcher da fila (VOTE_INGEST_MODE=queue), com registo de auditoria.
+    """
+    try:
+        resp = VoteResponse.FromString(await _send_vote(credential, candidate_id))
+    except UpstreamUnavailable:
+        raise
+    except GrpcurlError:
+        _audit(credential, candidate_id, ERROR)
+        raise
+    _audit(credential, candidate_id, ACCEPTED if resp.success else REJECTED)
+    return {"success": resp.success, "message": resp.message}
+
+
+async def _cast_vote(data: VoteIn) -> Reply:
+    """
+    Bloqueio local da credencial, validação do candidato e submissão ao AV.
+    Devolve o VoteResponse do AV; os erros são devolvidos como HTTPException (usado por /vote e /votes/batch).
+    """
+    with span("credentials"):
+        used = await _credential_used(data.voting_credential)
+    if used:
+        VOTE_REJECTIONS.labels("duplicate_credential").inc()
         raise HTTPException(
             status_code=409,
             detail="Esta credencial já foi usada nesta aplicação (bloqueio local do protótipo).",
         )
 
+    _check_store_room()
+
+    with span("candidate"):
+        await _check_candidate(data.candidate_id)
+
     try:
-        resp = voting.vote(data.voting_credential, data.candidate_id)
+        with span("upstream"):
+            raw = await _send_vote(data.voting_credential, data.candidate_id)
+        reply = Reply(raw, VoteResponse)
+    except UpstreamUnavailable as e:
+        raise _unavailable(e)
     except GrpcurlError as e:
+        _audit(data.voting_credential, data.candidate_id, ERROR)
         raise HTTPException(status_code=502, detail=f"Erro ao contactar AV (grpcurl): {e}")
+    except asyncio.CancelledError:
+        # Cliente desligou-se a meio (_upstream cancela a chamada): o voto pode já ter chegado ao AV.
+        _audit(data.voting_credential, data.candidate_id, ERROR)
+        raise
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro interno ao submeter voto: {e}")
 
-    # Suporta snake_case e lowerCamelCase
-    success = bool(_get(resp, "success", default=False))
-    message = str(_get(resp, "message", default=""))
+    _audit(data.voting_credential, data.candidate_id, ACCEPTED if reply.message.success else REJECTED)
+    if reply.message.success:
+        await _mark_used(data.voting_credential)
+
+    return reply
+
+
+@app.post("/vote")
+async def do_vote(data: VoteIn, request: Request):
+    """
+    Fase 2 (partes ii–iii) — Submissão de voto:
+    Submete o voto com voting_credential e candidate_id.
+    Inclui bloqueio local para evitar repetição da credencial no protótipo.
+    Com VOTE_INGEST_MODE=queue, o voto é gravado numa fila local e a resposta é 202 com um ticket.
+    Com Accept: application/x-protobuf devolve o VoteResponse recebido do AV.
+    """
+    mark("validate")
+    if vote_queue is not None:
+        return await _enqueue_vote(data)
+    reply = await _upstream(request, _cast_vote(data))
+    with span("encode"):
+        if wants_protobuf(request.headers.get("accept")):
+            return protobuf_response(reply.raw, _VARY)
+        return json_response(vote_json(reply.message), _VARY)
+
+
+async def _enqueue_vote(data: VoteIn) -> Response:
+    if await _credential_used(data.voting_credential):
+        VOTE_REJECTIONS.labels("duplicate_credential").inc()
+        raise HTTPException(
+            status_code=409,
+            detail="Esta credencial já foi usada nesta aplicação (bloqueio local do protótipo).",
+        )
+
+    _check_store_room()
+    await _check_candidate(data.candidate_id)
 
-    if success:
-        USED_CREDENTIALS.add(data.voting_credential)
+    try:
+        ticket = await asyncio.to_thread(vote_queue.enqueue, data.voting_credential, data.candidate_id)
+    except QueueFull:
+        raise HTTPException(
+            status_code=503,
+            detail="Fila de votos cheia; tente novamente dentro de instantes.",
+            headers={"Retry-After": "5"},
+        )
+    except DuplicateVote as e:
+        VOTE_REJECTIONS.labels("duplicate_credential").inc()
+        raise HTTPException(
+            status_code=409,
+            detail=f"Já existe um voto em processamento com esta credencial (ticket {e.ticket}).",
+        )
 
-    return {"success": success, "message": message}
+    vote_dispatcher.notify()
+    return JSONResponse(
+        {"ticket": ticket, "status": "pending"},
+        status_code=202,
+        headers={"Location": f"/vote/{ticket}"},
+    )
+
+
+@app.get("/vote/{ticket}")
+async def vote_status(ticket: str):
+    """
+    Estado de um voto aceite em modo fila: pending / sending / done / failed
+    (em done/failed inclui success e message do AV).
+    """
+    status = await asyncio.to_thread(vote_queue.status, ticket) if vote_queue is not None else None
+    if status is None:
+        raise HTTPException(status_code=404, detail="Ticket desconhecido.")
+    return status
+
+
+async def _batch_item(index: int, data: VoteIn, duplicate_of: int | None) -> dict:
+    if duplicate_of is not None:
+        VOTE_REJECTIONS.labels("duplicate_in_batch").inc()
+        return {
+            "index": index, "status": 409, "success": False,
+            "message": f"Credencial repetida no lote (ver índice {duplicate_of}).",
+        }
+    try:
+        reply = await _cast_vote(data)
+    except HTTPException as e:
+        return {"index": index, "status": e.status_code, "success": False, "message": str(e.detail)}
+    return {"index": index, "status": 200, "success": reply.message.success, "message": reply.message.message}
+
+
+@app.post("/votes/batch")
+async def votes_batch(items: List[VoteIn]):
+    """
+    Submissão de votos em lote (quiosques / agregadores de mesas de voto):
+    valida todo o lote de uma vez (incluindo credenciais repetidas no próprio lote), submete ao AV
+    com no máximo BATCH_VOTE_CONCURRENCY votos em curso e devolve NDJSON — uma linha por voto,
+    pela ordem de entrada, enviada assim que fica disponível.
+    """
+    mark("validate")
+    if len(items) > BATCH_VOTE_MAX_ITEMS:
+        raise HTTPException(status_code=413, detail=f"Lote demasiado grande (máximo {BATCH_VOTE_MAX_ITEMS} votos).")
+
+    first_seen: dict = {}
+    duplicates = [first_seen.setdefault(item.voting_credential, i) for i, item in enumerate(items)]
+
+    async def stream():
+        window = collections.deque()
+        try:
+            for i, item in enumerate(items):
+                dup = duplicates[i] if duplicates[i] != i else None
+                window.append(asyncio.ensure_future(_batch_item(i, item, dup)))
+                if len(window) >= BATCH_VOTE_CONCURRENCY:
+                    yield json.dumps(await window.popleft(), ensure_ascii=False) + "\n"
+            while window:
+                yield json.dumps(await window.popleft(), ensure_ascii=False) + "\n"
+        finally:
+            # Cliente desligou a meio: não deixar votos pendentes a correr sem destinatário.
+            for task in window:
+                task.cancel()
+
+    return StreamingResponse(stream(), media_type="application/x-ndjson")
+
+
+def _results_json_body(snapshot, since: int | None, etag: str) -> Body:
+    """
+    Corpo JSON de /results (completo ou delta desde 'since'), codificado uma vez por snapshot.
+    Só as versões ainda no histórico têm delta; as restantes recebem a resposta completa.
+    """
+    def full() -> Body:
+        # {"version": ..., "results": [{"id":..., "name":..., "votes":...}, ...]}
+        return snapshot.body(
+            JSON, lambda: Body(results_json(snapshot.version, snapshot.data).encode("utf-8"), JSON, etag),
+        )
+
+    def delta() -> Body:
+        changed = results_cache.delta(snapshot, since)
+        if changed is None:
+            return full()
+        return Body(results_json(snapshot.version, changed, since).encode("utf-8"), JSON, etag)
+
+    if since is None or not results_cache.has_version(since):
+        return full()
+    return snapshot.body(("delta", since), delta)
+
+
+def _results_page(order: str | None, offset: int, limit: int | None, top: int | None) -> tuple | None:
+    """
+    (ordem, offset, limit) da página pedida, ou None para a lista completa (com delta ?since=).
+    ?top=k é o mesmo que ?order=votes&limit=k.
+    """
+    if top is not None:
+        return "votes", 0, top
+    if order is None and not offset and limit is None:
+        return None
+    return order, offset, limit or PAGE_SIZE
+
+
+def _results_page_body(snapshot, page: tuple, protobuf: bool) -> Body:
+    """
+    Página de resultados, pela ordem do AV ou por votos (ranking mantido em cada snapshot),
+    codificada uma vez por snapshot: os clientes na mesma página (ex.: top 50) partilham os bytes
+    (só as PAGE_BODIES_MAX páginas mais usadas ficam guardadas).
+    """
+    order, offset, limit = page
+
+    def encode() -> Body:
+        n = len(snapshot.data)
+        if order == "votes":
+            positions = [rank_position(key, n) for key in snapshot.ranking[offset:offset + limit]]
+        else:
+            positions = range(offset, min(n, offset + limit))
+        rows = [snapshot.data[i] for i in positions]
+        etag = representation_etag(f'"r{snapshot.version}-{order or "av"}-{offset}-{limit}"', protobuf)
+        if protobuf:
+            return Body(GetResultsResponse(results=rows).SerializeToString(), PROTOBUF, etag)
+        return Body(results_page_json(snapshot.version, rows, n, offset, limit, order).encode("utf-8"), JSON, etag)
+
+    return snapshot.page_body(("page", protobuf, *page), encode)
 
 
 @app.get("/results")
-def results():
+async def results(
+    request: Request,
+    since: int | None = None,
+    top: int | None = Query(None, ge=1, le=PAGE_MAX),
+    order: str | None = Query(None, pattern="^votes$"),
+    offset: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1, le=PAGE_MAX),
+):
     """
     Fase 3 — Apuramento:
-    Obtém resultados agregados via serviço AV (grpcurl).
+    Obtém resultados agregados via serviço AV (grpcurl), a partir do snapshot versionado.
+    Com ?since=<versão> devolve apenas os candidatos cujos votos mudaram (ou 304 se nada mudou).
+    Com ?top=k, ?order=votes, ?offset= ou ?limit= devolve só uma página (com o total), por votos
+    ou pela ordem do AV; ?since=<versão> dá 304 se a versão não mudou.
+    Com Accept: application/x-protobuf devolve o GetResultsResponse completo recebido do AV
+    (a versão segue no cabeçalho X-Results-Version).
     """
     try:
-        resp = voting.get_results()  # lista de dicts: [{"id":..., "name":..., "votes":...}, ...]
+        with span("snapshot"):
+            snapshot = await _upstream(request, results_cache.get())
+    except ClientDisconnected:
+        raise
+    except UpstreamUnavailable as e:
+        raise _unavailable(e)
     except GrpcurlError as e:
         raise HTTPException(status_code=502, detail=f"Erro ao obter resultados (grpcurl): {e}")
     except Exception as e:
         raise HTTPException(status_code=500, detail=f"Erro interno ao obter resultados: {e}")
 
-    return {"results": resp}
+    protobuf = wants_protobuf(request.headers.get("accept"))
+    headers = {"Cache-Control": "no-cache", **_VARY_ENCODED}
+    page = _results_page(order, offset, limit, top)
+    if page is not None:
+        with span("encode"):
+            body = _results_page_body(snapshot, page, protobuf)
+        headers["X-Results-Version"] = str(snapshot.version)
+        headers["X-Total-Count"] = str(len(snapshot.data))
+        if since == snapshot.version:
+            return Response(status_code=304, headers={"ETag": body.etag, **headers})
+        return body.response(request.headers.get("accept-encoding"), request.headers.get("if-none-match"), headers)
+
+    etag = representation_etag(f'"r{snapshot.version}"', protobuf)
+    if since == snapshot.version:
+        return Response(status_code=304, headers={"ETag": etag, **headers})
+
+    with span("encode"):
+        if protobuf:
+            # GetResultsResponse não tem versão nem formato delta: vai sempre completo.
+            headers["X-Results-Version"] = str(snapshot.version)
+            body = snapshot.body(PROTOBUF, lambda: Body(snapshot.raw, PROTOBUF, etag))
+        else:
+            body = _results_json_body(snapshot, since, etag)
+        return body.response(request.headers.get("accept-encoding"), request.headers.get("if-none-match"), headers)
+
+
+def _sse_event(snapshot, since: int | None) -> bytes:
+    """
+    Evento SSE "results" com o JSON de /results (delta desde 'since', se ainda estiver no histórico),
+    codificado uma vez por snapshot e versão de origem: os clientes a par partilham os mesmos bytes.
+    """
+    if since is not None and not results_cache.has_version(since):
+        since = None
+    etag = representation_etag(f'"r{snapshot.version}"', False)
+    return snapshot.body(
+        ("sse", since),
+        lambda: b"id: %d\nevent: results\ndata: %s\n\n" % (
+            snapshot.version, _results_json_body(snapshot, since, etag).data),
+    )
+
+
+def _sse_page_event(snapshot, page: tuple) -> bytes:
+    """
+    Evento SSE "results" com uma página de /results (ex.: ?top=50), codificado uma vez por snapshot.
+    """
+    return snapshot.page_body(
+        ("sse-page", *page),
+        lambda: b"id: %d\nevent: results\ndata: %s\n\n" % (
+            snapshot.version, _results_page_body(snapshot, page, False).data),
+    )
+
+
+@app.get("/results/stream")
+async def results_stream(
+    request: Request,
+    top: int | None = Query(None, ge=1, le=PAGE_MAX),
+    order: str | None = Query(None, pattern="^votes$"),
+    offset: int = Query(0, ge=0),
+    limit: int | None = Query(None, ge=1, le=PAGE_MAX),
+):
+    """
+    Resultados em tempo real (Server-Sent Events): um evento "results" por nova versão, com o mesmo
+    JSON de /results — o primeiro completo, os seguintes delta desde o último enviado a este cliente.
+    Ao religar, o browser envia Last-Event-ID e recebe só o que mudou desde essa versão.
+    Com os parâmetros de página de /results (?top=, ?order=, ?offset=, ?limit=) cada evento traz
+    essa página, e só quando ela muda.
+    """
+    if results_broadcaster.full:
+        raise HTTPException(status_code=503, detail="Demasiados clientes ligados a /results/stream.",
+                            headers={"Retry-After": "5"})
+    last_event_id = request.headers.get("last-event-id", "")
+    since = int(last_event_id) if last_event_id.isdigit() else None
+    page = _results_page(order, offset, limit, top)
+
+    async def stream():
+        nonlocal since
+        subscriber = results_broadcaster.subscribe()
+        sent = None
+        try:
+            yield b"retry: %d\n\n" % RESULTS_STREAM_RETRY_MS
+            while True:
+                snapshot = await subscriber.next(RESULTS_STREAM_HEARTBEAT_S)
+                if snapshot is None:
+                    # Comentário SSE: mantém a ligação viva através de proxies com timeout de inatividade.
+                    yield b": ping\n\n"
+                elif page is not None:
+                    # Só quando a página muda: as chaves de ranking (ou os votos, pela ordem do AV)
+                    # das linhas visíveis identificam o conteúdo; votos noutros candidatos não contam.
+                    order, start, size = page
+                    rows = (snapshot.ranking if order == "votes" else snapshot.counts)[start:start + size]
+                    if (len(snapshot.data), rows) != sent:
+                        yield _sse_page_event(snapshot, page)
+                        sent = (len(snapshot.data), rows)
+                elif snapshot.version != since:
+                    yield _sse_event(snapshot, since)
+                    since = snapshot.version
+        finally:
+            results_broadcaster.unsubscribe(subscriber)
+
+    return StreamingResponse(
+        stream(), media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
+if ADMIN_TOKEN:
+    @app.post("/admin/profile", status_code=202)
+    async def admin_profile(request: Request, seconds: float = 30.0):
+        """
+        Inicia uma janela do profiler por amostragem (app/profiler.py); exige X-Admin-Token.
+        """
+        if not hmac.compare_digest(request.headers.get("x-admin-token", ""), ADMIN_TOKEN):
+            raise HTTPException(status_code=403, detail="Token de administração inválido.")
+        if seconds <= 0:
+            raise HTTPException(status_code=422, detail="seconds tem de ser positivo.")
+        try:
+            path = profiler.start(seconds)
+        except ProfilerBusy as e:
+            raise HTTPException(status_code=409, detail=str(e))
+        return {"file": str(path), "seconds": seconds}
+
+
+if SERVE_SITE:
+    # Depois das rotas da API: o frontend é servido na mesma origem (sem CORS nem preflight).
+    register_site_routes(app)
+
+register_routes(app)
@@ -0,0 +1,359 @@
+"""
+Métricas no formato de texto do Prometheus (exposto em /metrics), sem dependências externas.
+
+O registo de valores não usa locks: cada thread escreve na sua própria "fatia" (lista de contadores)
+e a agregação só acontece quando /metrics é lido. O lock só é usado na primeira escrita de cada
+thread/combinação de labels.
+"""
+import asyncio
+import bisect
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable, Dict, List, Sequence, Tuple
+
+_get_ident = threading.get_ident
+
+# Buckets de latência (segundos), adequados a chamadas locais (µs) e remotas (s).
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _escape(value: str) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _fmt_labels(names: Sequence[str], values: Sequence[str], extra: str = "") -> str:
+    parts = [f'{n}="{_escape(v)}"' for n, v in zip(names, values)]
+    if extra:
+        parts.append(extra)
+    return "{" + ",".join(parts) + "}" if parts else ""
+
+
+def _fmt_value(v: float) -> str:
+    if v == float("inf"):
+        return "+Inf"
+    return repr(float(v)) if isinstance(v, float) and not v.is_integer() else str(int(v))
+
+
+class _Sharded:
+    """
+    Vetor de 'size' contadores com uma cópia por thread; soma as cópias na leitura.
+    """
+
+    __slots__ = ("size", "_shards", "_lock")
+
+    def __init__(self, size: int):
+        self.size = size
+        self._shards: Dict[int, List[float]] = {}
+        self._lock = threading.Lock()
+
+    def shard(self) -> List[float]:
+        shard = self._shards.get(_get_ident())
+        if shard is None:
+            with self._lock:
+                shard = self._shards.setdefault(_get_ident(), [0] * self.size)
+        return shard
+
+    def totals(self) -> List[float]:
+        out = [0] * self.size
+        for shard in list(self._shards.values()):
+            for i, v in enumerate(shard):
+                out[i] += v
+        return out
+
+
+class _Metric:
+    kind = ""
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = ()):
+        self.name = name
+        self.doc = doc
+        self.labelnames = tuple(labelnames)
+        self._children: Dict[Tuple[str, ...], object] = {}
+        self._lock = threading.Lock()
+        REGISTRY.register(self)
+
+    def _new_child(self):
+        raise NotImplementedError
+
+    def labels(self, *values):
+        key = tuple(str(v) for v in values)
+        child = self._children.get(key)
+        if child is None:
+            with self._lock:
+                child = self._children.setdefault(key, self._new_child())
+        return child
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for key, child in sorted(self._children.items()):
+            lines.extend(self._render_child(key, child))
+        return lines
+
+
+class _CounterChild:
+    __slots__ = ("_v",)
+
+    def __init__(self):
+        self._v = _Sharded(1)
+
+    def inc(self, n: float = 1) -> None:
+        self._v.shard()[0] += n
+
+    def value(self) -> float:
+        return self._v.totals()[0]
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def _new_child(self):
+        return _CounterChild()
+
+    def inc(self, n: float = 1) -> None:
+        self.labels().inc(n)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(child.value())}"]
+
+
+class _GaugeChild:
+    __slots__ = ("_v", "_set")
+
+    def __init__(self):
+        self._v = _Sharded(1)
+        self._set = 0.0
+
+    def inc(self, n: float = 1) -> None:
+        self._v.shard()[0] += n
+
+    def dec(self, n: float = 1) -> None:
+        self._v.shard()[0] -= n
+
+    def set(self, v: float) -> None:
+        # set() é usado para estados (ex.: circuit breaker); inc/dec para contagens em curso.
+        self._set = v
+
+    def value(self) -> float:
+        return self._set + self._v.totals()[0]
+
+
+class Gauge(_Metric):
+    kind = "gauge"
+
+    def _new_child(self):
+        return _GaugeChild()
+
+    def set(self, v: float) -> None:
+        self.labels().set(v)
+
+    def _render_child(self, key, child):
+        return [f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(child.value())}"]
+
+
+class GaugeFunc(_Metric):
+    """
+    Gauge calculado no momento da leitura: fn() -> {(valores dos labels): valor}.
+    """
+
+    kind = "gauge"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str], fn: Callable[[], Dict[tuple, float]]):
+        super().__init__(name, doc, labelnames)
+        self._fn = fn
+
+    def render(self) -> List[str]:
+        lines = [f"# HELP {self.name} {self.doc}", f"# TYPE {self.name} {self.kind}"]
+        for key, value in sorted(self._fn().items()):
+            lines.append(f"{self.name}{_fmt_labels(self.labelnames, key)} {_fmt_value(value)}")
+        return lines
+
+
+class _HistogramChild:
+    __slots__ = ("_bounds", "_v")
+
+    def __init__(self, bounds: Sequence[float]):
+        self._bounds = bounds
+        # [contagem por bucket..., +Inf, soma]
+        self._v = _Sharded(len(bounds) + 2)
+
+    def observe(self, value: float) -> None:
+        shard = self._v.shard()
+        shard[bisect.bisect_left(self._bounds, value)] += 1
+        shard[-1] += value
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, name: str, doc: str, labelnames: Sequence[str] = (), buckets: Sequence[float] = LATENCY_BUCKETS):
+        self.buckets = tuple(sorted(buckets))
+        super().__init__(name, doc, labelnames)
+
+    def _new_child(self):
+        return _HistogramChild(self.buckets)
+
+    def _render_child(self, key, child):
+        totals = child._v.totals()
+        lines, cumulative = [], 0
+        for bound, n in zip(self.buckets + (float("inf"),), totals[:-1]):
+            cumulative += n
+            le = 'le="' + _fmt_value(bound) + '"'
+            lines.append(f"{self.name}_bucket{_fmt_labels(self.labelnames, key, le)} {cumulative}")
+        labels = _fmt_labels(self.labelnames, key)
+        lines.append(f"{self.name}_sum{labels} {_fmt_value(totals[-1])}")
+        lines.append(f"{self.name}_count{labels} {cumulative}")
+        return lines
+
+
+class Registry:
+    def __init__(self):
+        self._metrics: List[_Metric] = []
+
+    def register(self, metric: _Metric) -> None:
+        self._metrics.append(metric)
+
+    def render(self) -> str:
+        lines: List[str] = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+REGISTRY = Registry()
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+# -----------------------------
+# Métricas da aplicação
+# -----------------------------
+UPSTREAM_LATENCY = Histogram(
+    "upstream_request_duration_seconds", "Latência das chamadas aos serviços AR/AV.", ("method",))
+UPSTREAM_IN_FLIGHT = Gauge(
+    "upstream_requests_in_flight", "Chamadas aos serviços AR/AV em curso.", ("method",))
+UPSTREAM_ERRORS = Counter(
+    "upstream_errors_total", "Chamadas aos serviços AR/AV falhadas, por classe de erro.", ("method", "error"))
+
+HTTP_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latência dos pedidos HTTP por rota.", ("route", "method"))
+HTTP_REQUESTS = Counter(
+    "http_requests_total", "Pedidos HTTP por rota e código de resposta.", ("route", "method", "status"))
+HTTP_IN_FLIGHT = Gauge(
+    "http_requests_in_flight", "Pedidos HTTP em curso por rota.", ("route", "method"))
+
+CACHE_REQUESTS = Counter(
+    "cache_requests_total", "Consultas às caches locais (hit, stale, coalesced, miss).", ("cache", "result"))
+CACHE_ENTRIES = Gauge(
+    "cache_entries", "Entradas guardadas nas caches locais.", ("cache",))
+VOTE_REJECTIONS = Counter(
+    "vote_local_rejections_total", "Votos rejeitados localmente, sem ida ao AV.", ("reason",))
+
+
+def _cache_hit_ratio() -> Dict[tuple, float]:
+    totals: Dict[str, List[float]] = {}
+    for (cache, result), child in list(CACHE_REQUESTS._children.items()):
+        t = totals.setdefault(cache, [0, 0])
+        t[1] += child.value()
+        if result in ("hit", "stale", "coalesced"):
+            t[0] += child.value()
+    return {(cache,): (hits / total if total else 0.0) for cache, (hits, total) in totals.items()}
+
+
+CACHE_HIT_RATIO = GaugeFunc(
+    "cache_hit_ratio", "Fração de consultas servidas sem nova chamada ao AR/AV (hit + stale + coalesced).",
+    ("cache",), _cache_hit_ratio)
+
+
+def method_name(full_method: str) -> str:
+    return full_method.rsplit("/", 1)[-1]
+
+
+def error_class(exc: BaseException) -> str:
+    """
+    Classe de erro para labels: código gRPC quando existe (UNAVAILABLE, DEADLINE_EXCEEDED, ...),
+    caso contrário o tipo da exceção original.
+    """
+    cause = exc.__cause__ or exc
+    code = getattr(cause, "code", None)
+    if callable(code):
+        try:
+            return code().name
+        except Exception:
+            pass
+    if isinstance(cause, asyncio.TimeoutError):
+        return "DEADLINE_EXCEEDED"
+    return type(cause).__name__
+
+
+@contextmanager
+def track_upstream(full_method: str):
+    method = method_name(full_method)
+    in_flight = UPSTREAM_IN_FLIGHT.labels(method)
+    in_flight.inc()
+    t0 = time.perf_counter()
+    try:
+        yield
+    except asyncio.CancelledError:
+        UPSTREAM_ERRORS.labels(method, "CANCELLED").inc()
+        raise
+    except Exception as e:
+        UPSTREAM_ERRORS.labels(method, error_class(e)).inc()
+        raise
+    finally:
+        in_flight.dec()
+        UPSTREAM_LATENCY.labels(method).observe(time.perf_counter() - t0)
+
+
+class MetricsMiddleware:
+    """
+    Middleware ASGI: latência, contagem e pedidos em curso por rota (modelo da rota, ex. /vote/{ticket}).
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+            await send(message)
+
+        t0 = time.perf_counter()
+        method = scope["method"]
+        # A rota só é conhecida depois do encaminhamento; os pedidos em curso usam o caminho
+        # apenas quando corresponde diretamente a uma rota estática.
+        in_flight = HTTP_IN_FLIGHT.labels(_route_of(scope), method)
+        in_flight.inc()
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            in_flight.dec()
+            route = _route_of(scope)
+            HTTP_LATENCY.labels(route, method).observe(time.perf_counter() - t0)
+            HTTP_REQUESTS.labels(route, method, status[0]).inc()
+
+
+_STATIC_ROUTES: set = set()
+
+
+def _route_of(scope) -> str:
+    route = scope.get("route")
+    if route is not None:
+        return getattr(route, "path", "other")
+    path = scope.get("path", "")
+    return path if path in _STATIC_ROUTES else "other"
+
+
+def register_routes(app) -> None:
+    """
+    Regista os caminhos sem parâmetros da aplicação (para labelar pedidos ainda sem rota resolvida).
+    """
+    for route in app.routes:
+        path = getattr(route, "path", "")
+        if path and "{" not in path:
+            _STATIC_ROUTES.add(path)
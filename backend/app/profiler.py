@@ -0,0 +1,100 @@
+"""
+Profiler por amostragem, opcional, para usar com tráfego real.
+
+Uma thread recolhe a pilha de todas as threads (sys._current_frames) a cada PROFILE_INTERVAL_MS,
+durante uma janela de PROFILE_WINDOW_S, e escreve um ficheiro em formato "collapsed stacks"
+(uma linha "thread;módulo:função;...;módulo:função N" por pilha), que pode ser aberto em
+speedscope.app ou convertido com flamegraph.pl.
+
+Ativação:
+  - PROFILE_ON_START=1: uma janela logo no arranque;
+  - POST /admin/profile?seconds=30 com o cabeçalho X-Admin-Token igual a ADMIN_TOKEN
+    (sem ADMIN_TOKEN o endpoint não existe).
+Os ficheiros ficam em PROFILE_DIR (profile-<data>.folded).
+"""
+import collections
+import os
+import sys
+import threading
+import time
+from pathlib import Path
+
+PROFILE_ON_START = os.getenv("PROFILE_ON_START", "0") == "1"
+PROFILE_DIR = os.getenv("PROFILE_DIR", "profiles")
+PROFILE_INTERVAL_MS = float(os.getenv("PROFILE_INTERVAL_MS", "5"))
+PROFILE_WINDOW_S = float(os.getenv("PROFILE_WINDOW_S", "30"))
+PROFILE_MAX_WINDOW_S = 600.0
+ADMIN_TOKEN = os.getenv("ADMIN_TOKEN", "")
+
+
+class ProfilerBusy(Exception):
+    pass
+
+
+def _frame_name(frame) -> str:
+    code = frame.f_code
+    module = frame.f_globals.get("__name__", Path(code.co_filename).stem)
+    return f"{module}:{code.co_name}"
+
+
+class SamplingProfiler:
+    def __init__(self, directory: str = PROFILE_DIR, interval_s: float = PROFILE_INTERVAL_MS / 1000):
+        self.directory = Path(directory)
+        self.interval_s = interval_s
+        self._lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self.path: Path | None = None
+
+    @property
+    def running(self) -> bool:
+        return self._thread is not None and self._thread.is_alive()
+
+    def start(self, seconds: float = PROFILE_WINDOW_S) -> Path:
+        """
+        Inicia uma janela de amostragem; devolve o ficheiro onde o perfil vai ser escrito.
+        """
+        with self._lock:
+            if self.running:
+                raise ProfilerBusy(f"Já existe uma recolha em curso ({self.path})")
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self.path = self.directory / time.strftime("profile-%Y%m%d-%H%M%S.folded")
+            self._stop.clear()
+            self._thread = threading.Thread(
+                target=self._run, args=(min(seconds, PROFILE_MAX_WINDOW_S), self.path),
+                name="sampling-profiler", daemon=True,
+            )
+            self._thread.start()
+            return self.path
+
+    def stop(self) -> None:
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join()
+
+    def _run(self, seconds: float, path: Path) -> None:
+        me = threading.get_ident()
+        names = {}
+        stacks: "collections.Counter[str]" = collections.Counter()
+        deadline = time.monotonic() + seconds
+        while time.monotonic() < deadline and not self._stop.wait(self.interval_s):
+            if len(names) != threading.active_count():
+                names = {t.ident: t.name for t in threading.enumerate()}
+            for ident, frame in sys._current_frames().items():
+                if ident == me:
+                    continue
+                frames = []
+                while frame is not None:
+                    frames.append(_frame_name(frame))
+                    frame = frame.f_back
+                frames.append(names.get(ident, f"thread-{ident}"))
+                stacks[";".join(reversed(frames))] += 1
+
+        tmp = path.with_suffix(".tmp")
+        with open(tmp, "w", encoding="utf-8") as f:
+            for stack, count in stacks.most_common():
+                f.write(f"{stack} {count}\n")
+        tmp.replace(path)
+
+
+profiler = SamplingProfiler()
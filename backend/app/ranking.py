@@ -0,0 +1,99 @@
+"""
+Índices para boletins com milhares de listas e candidatos: paginação, top-k e pesquisa por prefixo.
+
+- Ranking dos resultados: lista ordenada de chaves inteiras "posição - votos * n" (mais votos
+  primeiro; em empate, a ordem do AV), mantida de snapshot para snapshot. Só os candidatos cujos
+  votos mudaram são reposicionados: até RESULTS_RANK_BISECT_MAX alterações com bisect (remoção e
+  inserção); acima disso, as chaves que não mudaram (já ordenadas) e as novas juntam-se num único
+  sort, que o timsort resolve como a fusão de duas sequências ordenadas. O ranking só é refeito
+  de raiz quando muda o conjunto de candidatos.
+- Pesquisa por prefixo do nome: nomes normalizados (minúsculas, sem acentos) ordenados; cada
+  pesquisa são dois bisect, O(log n + resultados).
+"""
+import bisect
+import itertools
+import operator
+import os
+import unicodedata
+from typing import Iterable, List, Sequence
+
+from .metrics import Counter
+
+# Tamanho de página por omissão e máximo (?limit=) de /candidates e /results.
+PAGE_SIZE = int(os.getenv("PAGE_SIZE", "50"))
+PAGE_MAX = int(os.getenv("PAGE_MAX", "500"))
+RESULTS_RANK_BISECT_MAX = int(os.getenv("RESULTS_RANK_BISECT_MAX", "256"))
+
+RANK_UPDATES = Counter(
+    "results_rank_updates_total",
+    "Atualizações do ranking de resultados, por modo (full, bisect, merge, unchanged).", ("mode",))
+
+
+def rank(counts: Sequence[int]) -> List[int]:
+    """
+    Ranking de raiz: chaves "posição - votos * n" por ordem crescente (ver rank_position).
+    """
+    RANK_UPDATES.labels("full").inc()
+    n = len(counts)
+    return sorted(i - v * n for i, v in enumerate(counts))
+
+
+def rerank(ranking: List[int], old_counts: Sequence[int], counts: Sequence[int]) -> List[int]:
+    """
+    Ranking de 'counts' a partir do ranking de 'old_counts' (os mesmos candidatos, pela mesma ordem).
+    Devolve uma lista nova: o ranking anterior continua a ser usado pelos pedidos em curso.
+    """
+    n = len(counts)
+    changed = list(itertools.compress(range(n), map(operator.ne, old_counts, counts)))
+    if not changed:
+        RANK_UPDATES.labels("unchanged").inc()
+        return ranking
+    if len(changed) <= RESULTS_RANK_BISECT_MAX:
+        RANK_UPDATES.labels("bisect").inc()
+        ranking = ranking.copy()
+        for i in changed:
+            del ranking[bisect.bisect_left(ranking, i - old_counts[i] * n)]
+            bisect.insort(ranking, i - counts[i] * n)
+        return ranking
+    RANK_UPDATES.labels("merge").inc()
+    moved = set(changed)
+    merged = [key for key in ranking if key % n not in moved]
+    merged.extend(sorted(i - counts[i] * n for i in changed))
+    merged.sort()
+    return merged
+
+
+def rank_position(key: int, n: int) -> int:
+    """
+    Posição (na lista do AV) do candidato com a chave de ranking 'key'.
+    """
+    return key % n
+
+
+def normalize(name: str) -> str:
+    """
+    Forma usada na pesquisa: minúsculas e sem acentos ("João" -> "joao").
+    """
+    return "".join(c for c in unicodedata.normalize("NFKD", name.casefold()) if not unicodedata.combining(c))
+
+
+class NameIndex:
+    """
+    Nomes normalizados por ordem alfabética, com a posição de cada um na lista do AV.
+    """
+
+    __slots__ = ("_keys", "_positions")
+
+    def __init__(self, names: Iterable[str]):
+        pairs = sorted((normalize(name), i) for i, name in enumerate(names))
+        self._keys = [key for key, _ in pairs]
+        self._positions = [i for _, i in pairs]
+
+    def search(self, prefix: str, offset: int, limit: int) -> tuple:
+        """
+        (total de nomes começados por 'prefix', posições da página [offset, offset + limit)).
+        """
+        prefix = normalize(prefix)
+        lo = bisect.bisect_left(self._keys, prefix)
+        hi = bisect.bisect_left(self._keys, prefix + "\U0010ffff", lo)
+        return hi - lo, self._positions[lo + offset:min(hi, lo + offset + limit)]
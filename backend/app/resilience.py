@@ -0,0 +1,384 @@
+"""
+Proteções nas chamadas aos serviços AR/AV:
+
+- circuit breaker por serviço: após BREAKER_FAILURES falhas seguidas, as chamadas falham de imediato
+  (HTTP 503 + Retry-After) durante BREAKER_OPEN_S; depois é deixada passar uma chamada de teste
+  (half-open) que decide se o circuito fecha ou volta a abrir;
+- hedging nas leituras idempotentes (GetCandidates, GetResults): se a resposta demorar mais do que
+  o p95 recente, é enviada uma segunda tentativa e vale a primeira que responder;
+- limite de concorrência adaptativo por serviço (AIMD sobre o RTT medido), com prioridades:
+  Vote e IssueVotingCredential passam à frente de GetCandidates e GetResults, que são recusados
+  de imediato (HTTP 503 + Retry-After) quando o serviço está saturado.
+"""
+import asyncio
+import collections
+import os
+import threading
+import time
+from typing import Awaitable, Callable, Dict
+
+from .grpc_clients import GrpcurlError
+from .metrics import Counter, Gauge, GaugeFunc, method_name
+
+BREAKER_FAILURES = int(os.getenv("BREAKER_FAILURES", "5"))
+BREAKER_OPEN_S = float(os.getenv("BREAKER_OPEN_S", "10"))
+
+HEDGE_READS = os.getenv("HEDGE_READS", "0") == "1"
+HEDGE_PERCENTILE = float(os.getenv("HEDGE_PERCENTILE", "95"))
+HEDGE_MIN_DELAY_S = float(os.getenv("HEDGE_MIN_DELAY_MS", "10")) / 1000.0
+# Atraso usado enquanto não há amostras suficientes para estimar o percentil.
+HEDGE_DEFAULT_DELAY_S = float(os.getenv("HEDGE_DEFAULT_DELAY_MS", "200")) / 1000.0
+
+HEDGEABLE_METHODS = {"GetCandidates", "GetResults"}
+
+LIMITER_ENABLED = os.getenv("LIMITER_ENABLED", "1") == "1"
+LIMIT_INITIAL = float(os.getenv("LIMIT_INITIAL", "20"))
+LIMIT_MIN = float(os.getenv("LIMIT_MIN", "2"))
+LIMIT_MAX = float(os.getenv("LIMIT_MAX", "200"))
+# Mediana das RTT recentes acima de LIMIT_RTT_TOLERANCE x a menor mediana recente é sinal de fila no serviço remoto.
+LIMIT_RTT_TOLERANCE = float(os.getenv("LIMIT_RTT_TOLERANCE", "2.0"))
+LIMIT_BACKOFF = float(os.getenv("LIMIT_BACKOFF", "0.9"))
+# Intervalo mínimo entre duas reduções do limite.
+LIMIT_DECREASE_INTERVAL_S = float(os.getenv("LIMIT_DECREASE_INTERVAL_MS", "250")) / 1000.0
+# Fração do limite que as chamadas de baixa prioridade podem ocupar.
+LIMIT_LOW_PRIORITY_SHARE = float(os.getenv("LIMIT_LOW_PRIORITY_SHARE", "0.8"))
+# Espera máxima por uma vaga das chamadas de alta prioridade antes de serem recusadas.
+LIMIT_QUEUE_TIMEOUT_S = float(os.getenv("LIMIT_QUEUE_TIMEOUT_MS", "500")) / 1000.0
+
+HIGH, LOW = "high", "low"
+HIGH_PRIORITY_METHODS = {"Vote", "BatchVote", "IssueVotingCredential"}
+
+CLOSED, HALF_OPEN, OPEN = 0, 1, 2
+_STATE_NAMES = {CLOSED: "closed", HALF_OPEN: "half_open", OPEN: "open"}
+
+BREAKER_STATE = Gauge(
+    "circuit_breaker_state", "Estado do circuit breaker (0=fechado, 1=half-open, 2=aberto).", ("service",))
+BREAKER_TRANSITIONS = Counter(
+    "circuit_breaker_transitions_total", "Mudanças de estado do circuit breaker.", ("service", "state"))
+BREAKER_REJECTED = Counter(
+    "circuit_breaker_rejected_total", "Chamadas recusadas com o circuito aberto.", ("service",))
+HEDGES = Counter(
+    "upstream_hedges_total", "Tentativas de hedging: enviadas e ganhas pela segunda tentativa.", ("method", "outcome"))
+LIMITER_LIMIT = Gauge(
+    "upstream_concurrency_limit", "Limite adaptativo de chamadas em curso por serviço.", ("service",))
+LIMITER_SHED = Counter(
+    "upstream_shed_total", "Chamadas recusadas pelo limite de concorrência.", ("service", "priority"))
+
+
+def _hedge_win_ratio() -> Dict[tuple, float]:
+    sent: Dict[str, float] = {}
+    won: Dict[str, float] = {}
+    for (method, outcome), child in list(HEDGES._children.items()):
+        (sent if outcome == "sent" else won if outcome == "won" else {})[method] = child.value()
+    return {(m,): (won.get(m, 0) / n if n else 0.0) for m, n in sent.items()}
+
+
+HEDGE_WIN_RATIO = GaugeFunc(
+    "upstream_hedge_win_ratio", "Fração dos hedges em que a segunda tentativa respondeu primeiro.",
+    ("method",), _hedge_win_ratio)
+
+
+class UpstreamUnavailable(GrpcurlError):
+    """
+    Chamada recusada localmente, sem contactar o serviço remoto (HTTP 503 + Retry-After).
+    """
+
+    def __init__(self, message: str, retry_after: int):
+        self.retry_after = retry_after
+        super().__init__(message)
+
+
+class CircuitOpenError(UpstreamUnavailable):
+    """
+    Circuito aberto: o serviço remoto está a falhar e a chamada não chegou a ser feita.
+    """
+
+    def __init__(self, service: str, retry_after: float):
+        self.service = service
+        retry_after = max(1, int(retry_after + 0.999))
+        super().__init__(
+            f"Serviço {service} indisponível (circuit breaker aberto); tentar dentro de {retry_after}s", retry_after
+        )
+
+
+class OverloadedError(UpstreamUnavailable):
+    """
+    Limite de concorrência atingido: a chamada foi recusada antes de chegar ao serviço remoto.
+    """
+
+    def __init__(self, service: str, priority: str):
+        self.service = service
+        self.priority = priority
+        super().__init__(f"Serviço {service} saturado; pedido de prioridade {priority} recusado", 1)
+
+
+class CircuitBreaker:
+    def __init__(self, service: str, failures: int = BREAKER_FAILURES, open_s: float = BREAKER_OPEN_S):
+        self.service = service
+        self.failures = failures
+        self.open_s = open_s
+        self.state = CLOSED
+        self._consecutive = 0
+        self._opened_at = 0.0
+        self._probe_in_flight = False
+        self._lock = threading.Lock()
+        self._gauge = BREAKER_STATE.labels(service)
+        self._gauge.set(CLOSED)
+
+    def _transition(self, state: int) -> None:
+        if state != self.state:
+            self.state = state
+            self._gauge.set(state)
+            BREAKER_TRANSITIONS.labels(self.service, _STATE_NAMES[state]).inc()
+
+    def before_call(self) -> None:
+        """
+        Levanta CircuitOpenError se a chamada não deve ser feita.
+        """
+        if self.state == CLOSED:
+            return
+        with self._lock:
+            if self.state == OPEN:
+                remaining = self._opened_at + self.open_s - time.monotonic()
+                if remaining > 0:
+                    BREAKER_REJECTED.labels(self.service).inc()
+                    raise CircuitOpenError(self.service, remaining)
+                self._transition(HALF_OPEN)
+            if self.state == HALF_OPEN:
+                if self._probe_in_flight:
+                    BREAKER_REJECTED.labels(self.service).inc()
+                    raise CircuitOpenError(self.service, 1)
+                self._probe_in_flight = True
+
+    def on_success(self) -> None:
+        self._consecutive = 0
+        if self.state != CLOSED:
+            with self._lock:
+                self._probe_in_flight = False
+                self._transition(CLOSED)
+
+    def on_failure(self) -> None:
+        with self._lock:
+            self._consecutive += 1
+            if self.state == HALF_OPEN or self._consecutive >= self.failures:
+                self._probe_in_flight = False
+                self._opened_at = time.monotonic()
+                self._transition(OPEN)
+
+    def on_cancel(self) -> None:
+        # Chamada cancelada (ex.: cliente desligou): não conta como falha, mas liberta a sonda.
+        if self.state == HALF_OPEN:
+            with self._lock:
+                self._probe_in_flight = False
+
+    def retry_after(self) -> int:
+        return max(1, int(self._opened_at + self.open_s - time.monotonic() + 0.999))
+
+
+_breakers: Dict[str, CircuitBreaker] = {}
+_breakers_lock = threading.Lock()
+
+
+def breaker_for(full_method: str) -> CircuitBreaker:
+    """
+    Um breaker por serviço (ex.: "voting.VotingService"), partilhado por clientes síncronos e assíncronos.
+    """
+    service = full_method.rsplit("/", 1)[0]
+    breaker = _breakers.get(service)
+    if breaker is None:
+        with _breakers_lock:
+            breaker = _breakers.setdefault(service, CircuitBreaker(service))
+    return breaker
+
+
+class ConcurrencyLimiter:
+    """
+    Limite adaptativo de chamadas em curso (AIMD): cresce ~1 por janela enquanto a mediana das
+    últimas RTT_SAMPLES RTT se mantém perto da menor mediana recente e diminui (x LIMIT_BACKOFF,
+    no máximo uma vez por LIMIT_DECREASE_INTERVAL_S) quando a chamada falha ou a mediana sobe com
+    o limite em uso. Um pico isolado, ou jitter com poucas chamadas em curso, não reduz o limite.
+
+    Alta prioridade usa todo o limite e espera até LIMIT_QUEUE_TIMEOUT_S por uma vaga;
+    baixa prioridade só usa LIMIT_LOW_PRIORITY_SHARE do limite, não passa à frente de quem espera
+    e é recusada de imediato. Usado só a partir do event loop (sem locks).
+    """
+
+    # O RTT de referência é a menor mediana da janela atual e da anterior (acompanha mudanças permanentes).
+    RTT_WINDOW_S = 10.0
+    RTT_SAMPLES = 16
+
+    def __init__(self, service: str, initial: float = LIMIT_INITIAL, min_limit: float = LIMIT_MIN,
+                 max_limit: float = LIMIT_MAX, enabled: bool = LIMITER_ENABLED,
+                 clock: Callable[[], float] = time.monotonic):
+        self.service = service
+        self.enabled = enabled
+        self.limit = initial
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.in_flight = 0
+        self._min_rtt: float | None = None
+        self._window_min: float | None = None
+        self._window_end = 0.0
+        self._recent: collections.deque = collections.deque(maxlen=self.RTT_SAMPLES)
+        self._clock = clock
+        self._last_decrease = float("-inf")
+        self._waiters: collections.deque = collections.deque()
+        self._gauge = LIMITER_LIMIT.labels(service)
+        self._gauge.set(initial if enabled else 0)
+
+    def _shed(self, priority: str) -> OverloadedError:
+        LIMITER_SHED.labels(self.service, priority).inc()
+        return OverloadedError(self.service, priority)
+
+    async def acquire(self, priority: str) -> None:
+        if not self.enabled or (priority == HIGH and self.in_flight < self.limit):
+            self.in_flight += 1
+            return
+        if priority != HIGH:
+            if not self._waiters and self.in_flight < self.limit * LIMIT_LOW_PRIORITY_SHARE:
+                self.in_flight += 1
+                return
+            raise self._shed(priority)
+
+        waiter = asyncio.get_running_loop().create_future()
+        self._waiters.append(waiter)
+        try:
+            # A vaga é reservada por release() antes de resolver o future.
+            await asyncio.wait_for(waiter, LIMIT_QUEUE_TIMEOUT_S)
+        except (asyncio.TimeoutError, asyncio.CancelledError) as e:
+            if waiter.done() and not waiter.cancelled():
+                self.release()
+            else:
+                try:
+                    self._waiters.remove(waiter)
+                except ValueError:
+                    pass
+            if isinstance(e, asyncio.TimeoutError):
+                raise self._shed(priority) from None
+            raise
+
+    def release(self, rtt: float | None = None, dropped: bool = False) -> None:
+        """
+        Liberta a vaga; 'rtt' (sucesso) ou dropped=True (falha) ajustam o limite.
+        """
+        self.in_flight -= 1
+        if self.enabled and (rtt is not None or dropped):
+            self._update(rtt, dropped)
+        while self._waiters and self.in_flight < self.limit:
+            waiter = self._waiters.popleft()
+            if not waiter.done():
+                self.in_flight += 1
+                waiter.set_result(None)
+
+    def _observe(self, rtt: float, now: float) -> None:
+        if now >= self._window_end:
+            self._min_rtt = self._window_min
+            self._window_min = None
+            self._window_end = now + self.RTT_WINDOW_S
+        self._window_min = rtt if self._window_min is None else min(self._window_min, rtt)
+        self._min_rtt = rtt if self._min_rtt is None else min(self._min_rtt, rtt)
+
+    def _update(self, rtt: float | None, dropped: bool) -> None:
+        now = self._clock()
+        # Só reage à latência quando o limite está de facto a ser usado.
+        busy = self.in_flight + 1 >= self.limit / 2
+        if not dropped:
+            self._recent.append(rtt)
+            recent = sorted(self._recent)
+            median = recent[len(recent) // 2]
+            # A referência é a menor mediana recente: o mínimo de RTT isolados desce com o número de
+            # amostras e faria o jitter normal parecer fila.
+            self._observe(median, now)
+            if median <= self._min_rtt * LIMIT_RTT_TOLERANCE:
+                if busy:
+                    self.limit = min(self.max_limit, self.limit + 1.0 / self.limit)
+                    self._gauge.set(self.limit)
+                return
+            if not busy:
+                return
+
+        if now - self._last_decrease >= LIMIT_DECREASE_INTERVAL_S:
+            self._last_decrease = now
+            self.limit = max(self.min_limit, self.limit * LIMIT_BACKOFF)
+            self._gauge.set(self.limit)
+
+
+_limiters: Dict[str, ConcurrencyLimiter] = {}
+
+
+def limiter_for(full_method: str) -> ConcurrencyLimiter:
+    """
+    Um limite por serviço: Vote e GetResults partilham as vagas do AV, com prioridades diferentes.
+    """
+    service = full_method.rsplit("/", 1)[0]
+    limiter = _limiters.get(service)
+    if limiter is None:
+        limiter = _limiters[service] = ConcurrencyLimiter(service)
+    return limiter
+
+
+def priority_for(full_method: str) -> str:
+    return HIGH if method_name(full_method) in HIGH_PRIORITY_METHODS else LOW
+
+
+class LatencyTracker:
+    """
+    Janela das últimas latências com sucesso, para estimar o percentil usado como atraso do hedge.
+    """
+
+    def __init__(self, size: int = 512, min_samples: int = 20):
+        self._samples = collections.deque(maxlen=size)
+        self.min_samples = min_samples
+
+    def record(self, seconds: float) -> None:
+        self._samples.append(seconds)
+
+    def percentile(self, p: float) -> float | None:
+        if len(self._samples) < self.min_samples:
+            return None
+        values = sorted(self._samples)
+        return values[min(len(values) - 1, int(p / 100.0 * len(values)))]
+
+
+_latency: Dict[str, LatencyTracker] = {}
+
+
+def latency_for(full_method: str) -> LatencyTracker:
+    return _latency.setdefault(full_method, LatencyTracker())
+
+
+def hedge_delay(full_method: str) -> float:
+    p = latency_for(full_method).percentile(HEDGE_PERCENTILE)
+    return HEDGE_DEFAULT_DELAY_S if p is None else max(HEDGE_MIN_DELAY_S, p)
+
+
+async def hedged(full_method: str, attempt: Callable[[], Awaitable]):
+    """
+    Executa attempt(); se não terminar dentro de hedge_delay(), lança uma segunda tentativa
+    e devolve o primeiro sucesso (a outra é cancelada). Só falha se ambas falharem.
+    """
+    method = method_name(full_method)
+    first = asyncio.ensure_future(attempt())
+    pending = {first}
+    error = None
+    try:
+        # Dentro do try: se quem chama for cancelado durante a espera, a primeira tentativa também é.
+        done, _ = await asyncio.wait({first}, timeout=hedge_delay(full_method))
+        if done:
+            return first.result()
+
+        HEDGES.labels(method, "sent").inc()
+        second = asyncio.ensure_future(attempt())
+        pending = {first, second}
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                if task.exception() is None:
+                    if task is second:
+                        HEDGES.labels(method, "won").inc()
+                    return task.result()
+                error = task.exception()
+        raise error
+    finally:
+        for task in pending:
+            task.cancel()
@@ -0,0 +1,309 @@
+"""
+Snapshots de candidatos e resultados partilhados pelos workers da máquina (python -m app.supervisor).
+
+- O supervisor cria um segmento multiprocessing.shared_memory por snapshot ("<prefixo>-candidates",
+  "<prefixo>-results") e passa o prefixo aos workers em SHARED_SNAPSHOTS.
+- Um único worker, eleito com um lock de ficheiro não bloqueante, contacta o AV: mantém as caches
+  como no modo de um processo (incluindo o stream WatchResults) e escreve os bytes de cada novo
+  snapshot no segmento. Se esse worker morrer, o kernel liberta o lock e outro worker é eleito.
+- Os restantes workers leem o segmento em vez de chamar o AV: GetCandidates, GetResults e
+  WatchResults ao AV não aumentam com o número de workers.
+
+Cada segmento tem um cabeçalho protegido por um seqlock e dois buffers: o líder escreve sempre no
+buffer que não está publicado e só depois troca o cabeçalho. Os leitores não usam locks: se o
+contador mudou durante a leitura (o líder publicou duas vezes entretanto), repetem-na. Um worker
+só copia os bytes quando a versão publicada muda; com a versão igual, a leitura é só o cabeçalho.
+"""
+import asyncio
+import os
+import struct
+import tempfile
+import time
+from multiprocessing import shared_memory
+from typing import AsyncIterator, Awaitable, Callable
+
+from .grpc_clients import GrpcurlError
+from .metrics import Counter, Gauge, error_class
+
+# Prefixo dos segmentos (definido pelo supervisor; vazio = um só processo, sem partilha).
+SHARED_SNAPSHOTS = os.getenv("SHARED_SNAPSHOTS", "")
+# Tamanho de cada segmento (dois buffers de metade do tamanho, menos o cabeçalho).
+SHARED_SNAPSHOT_MB = float(os.getenv("SHARED_SNAPSHOT_MB", "32"))
+# Intervalo entre tentativas de eleição e entre leituras do segmento no stream de resultados.
+SHARED_ELECTION_S = float(os.getenv("SHARED_ELECTION_S", "1"))
+SHARED_POLL_S = float(os.getenv("SHARED_POLL_S", "0.1"))
+# Tempo máximo de espera pelo primeiro snapshot publicado pelo líder.
+SHARED_WAIT_S = float(os.getenv("SHARED_WAIT_S", "10"))
+
+LEADER = Gauge("shared_snapshot_leader", "1 se este worker é o líder que contacta o AV pelos restantes.")
+PUBLISHES = Counter("shared_snapshot_publishes_total", "Snapshots escritos na memória partilhada.", ("segment",))
+READS = Counter("shared_snapshot_reads_total", "Snapshots novos lidos da memória partilhada.", ("segment",))
+RETRIES = Counter("shared_snapshot_retries_total", "Leituras repetidas por o líder ter publicado durante a cópia.")
+FAILURES = Counter(
+    "shared_snapshot_failures_total", "Snapshots que o líder não conseguiu obter ou publicar, por classe de erro.",
+    ("segment", "error"))
+
+# Tentativas de leitura antes de desistir (o leitor fica com o snapshot que já tinha).
+_READ_ATTEMPTS = 1000
+
+
+def segment_name(prefix: str, segment: str) -> str:
+    return f"{prefix}-{segment}"
+
+
+def lock_path(prefix: str) -> str:
+    return os.path.join(tempfile.gettempdir(), f"{prefix}.lock")
+
+
+class SharedSegment:
+    """
+    Um snapshot num segmento de memória partilhada.
+    Cabeçalho: magic (8 B) | seq (8 B) | buffer (8 B) | tamanho (8 B) | tag (8 B) | seq de cada buffer (2 x 8 B).
+    'seq' é par com o cabeçalho estável; seq // 2 é a versão publicada (0 = nada publicado).
+    'tag' acompanha os bytes (a versão do ResultsSnapshot no líder).
+    """
+
+    MAGIC = b"VSSNAP01"
+    HEADER = struct.Struct("<8sQQQQQQ")
+    DATA = 64
+    _SEQ = 8
+    _SLOT_SEQ = 40
+
+    def __init__(self, name: str, create: bool = False, size: int = int(SHARED_SNAPSHOT_MB * 1024 * 1024)):
+        self.name = name
+        self._shm = shared_memory.SharedMemory(name=name, create=create, size=size if create else 0)
+        self._buf = self._shm.buf
+        if create:
+            self.HEADER.pack_into(self._buf, 0, self.MAGIC, 0, 0, 0, 0, 0, 0)
+        elif bytes(self._buf[:8]) != self.MAGIC:
+            raise ValueError(f"Segmento de memória partilhada inválido: {name}")
+        self.capacity = (self._shm.size - self.DATA) // 2
+
+    def _u64(self, offset: int) -> int:
+        return struct.unpack_from("<Q", self._buf, offset)[0]
+
+    def _set_u64(self, offset: int, value: int) -> None:
+        struct.pack_into("<Q", self._buf, offset, value)
+
+    @property
+    def version(self) -> int:
+        return self._u64(self._SEQ) // 2
+
+    def write(self, data: bytes, tag: int = 0) -> int:
+        """
+        Publica 'data' (só o líder escreve). Devolve a nova versão.
+        """
+        if len(data) > self.capacity:
+            raise ValueError(
+                f"Snapshot com {len(data)} bytes não cabe em {self.name} ({self.capacity} bytes por buffer); "
+                f"aumentar SHARED_SNAPSHOT_MB")
+        seq = self._u64(self._SEQ)
+        # Contadores ímpares: o líder anterior terminou a meio de uma escrita.
+        seq += seq & 1
+        slot = 1 - self._u64(16) if seq else 0
+        slot_seq = self._SLOT_SEQ + 8 * slot
+        count = self._u64(slot_seq)
+        count += count & 1
+        start = self.DATA + slot * self.capacity
+        self._set_u64(slot_seq, count + 1)
+        self._buf[start:start + len(data)] = data
+        self._set_u64(slot_seq, count + 2)
+        self._set_u64(self._SEQ, seq + 1)
+        struct.pack_into("<QQQ", self._buf, 16, slot, len(data), tag)
+        self._set_u64(self._SEQ, seq + 2)
+        return (seq + 2) // 2
+
+    def read(self, known: int = 0) -> tuple:
+        """
+        (versão, tag, bytes) do snapshot publicado; bytes é None se a versão for 'known', se
+        ainda nada foi publicado (versão 0) ou se o cabeçalho não estabilizou (fica-se com 'known').
+        """
+        for _ in range(_READ_ATTEMPTS):
+            seq = self._u64(self._SEQ)
+            if seq & 1:
+                continue
+            slot, length, tag = struct.unpack_from("<QQQ", self._buf, 16)
+            if self._u64(self._SEQ) != seq:
+                continue
+            version = seq // 2
+            if version == 0 or version == known:
+                return version, tag, None
+            slot_seq = self._SLOT_SEQ + 8 * slot
+            count = self._u64(slot_seq)
+            start = self.DATA + slot * self.capacity
+            data = bytes(self._buf[start:start + length])
+            # O slot estável não basta: com duas publicações entretanto, o mesmo slot recebeu bytes
+            # mais recentes do que o cabeçalho lido (versão, tamanho e tag antigos).
+            if not count & 1 and self._u64(slot_seq) == count and self._u64(self._SEQ) == seq:
+                return version, tag, data
+            RETRIES.inc()
+        return known, 0, None
+
+    def close(self) -> None:
+        self._buf = None
+        self._shm.close()
+
+    def unlink(self) -> None:
+        self._shm.unlink()
+
+
+def _try_lock(f) -> bool:
+    try:
+        if os.name == "nt":
+            import msvcrt
+
+            f.seek(0)
+            msvcrt.locking(f.fileno(), msvcrt.LK_NBLCK, 1)
+        else:
+            import fcntl
+
+            fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except OSError:
+        return False
+    return True
+
+
+class Election:
+    """
+    Eleição do worker líder: o primeiro a obter o lock exclusivo do ficheiro '<prefixo>.lock' na pasta
+    temporária. O lock fica com o processo até terminar; os restantes tentam a cada SHARED_ELECTION_S.
+    """
+
+    def __init__(self, prefix: str, interval: float = SHARED_ELECTION_S):
+        self.path = lock_path(prefix)
+        self.interval = interval
+        self.leader = False
+        self._file = None
+        self._task: asyncio.Task | None = None
+
+    def start(self, lead: Callable[[], Awaitable]) -> None:
+        """
+        Tenta a eleição em segundo plano; depois de eleito, corre lead() até ao fim do processo.
+        """
+        if self._task is None:
+            self._file = open(self.path, "a+b")
+            self._task = asyncio.ensure_future(self._run(lead))
+
+    async def _run(self, lead: Callable[[], Awaitable]) -> None:
+        while not _try_lock(self._file):
+            await asyncio.sleep(self.interval)
+        self.leader = True
+        LEADER.set(1)
+        await lead()
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+        if self._file is not None:
+            # Fechar o ficheiro liberta o lock (o próximo worker a tentar é eleito).
+            self._file.close()
+            self._file = None
+        self.leader = False
+        LEADER.set(0)
+
+
+class SharedFeed:
+    """
+    Origem de um snapshot (bytes protobuf) para SnapshotCache e ResultsBroadcaster, conforme o papel
+    do worker: no líder, as chamadas ao AV ('fetch' e 'watch'); nos restantes, o segmento partilhado.
+    'on_read(tag)' é chamado antes de entregar bytes novos lidos do segmento (ex.: ResultsCache.follow).
+    """
+
+    def __init__(self, segment: SharedSegment, election: Election, fetch: Callable[[], Awaitable[bytes]],
+                 watch: Callable[[], AsyncIterator[bytes]] | None = None,
+                 on_read: Callable[[int], None] | None = None):
+        self.segment = segment
+        self._election = election
+        self._fetch = fetch
+        self._watch = watch
+        self.on_read = on_read
+        self._version = 0
+        self._data: bytes | None = None
+        self._written: bytes | None = None
+        self._label = segment.name.rsplit("-", 1)[-1]
+        self._reads = READS.labels(self._label)
+        self._publishes = PUBLISHES.labels(self._label)
+
+    def latest(self) -> bytes | None:
+        """
+        Bytes do último snapshot publicado no segmento (None se ainda nada foi publicado).
+        """
+        version, tag, data = self.segment.read(self._version)
+        if data is not None:
+            self._reads.inc()
+            if self.on_read is not None:
+                self.on_read(tag)
+            self._version, self._data = version, data
+        return self._data
+
+    async def fetch(self) -> bytes:
+        """
+        Bytes do snapshot: do AV no líder; do segmento nos restantes (o mesmo objeto se nada mudou).
+        """
+        deadline = time.monotonic() + SHARED_WAIT_S
+        while not self._election.leader:
+            data = self.latest()
+            if data is not None:
+                return data
+            if time.monotonic() > deadline:
+                raise GrpcurlError(f"Nenhum snapshot publicado em {self.segment.name} pelo worker líder")
+            await asyncio.sleep(SHARED_POLL_S)
+        return await self._fetch()
+
+    async def watch(self) -> AsyncIterator[bytes]:
+        """
+        Stream de snapshots: WatchResults ao AV no líder; nos restantes, cada nova versão do segmento
+        (verificada a cada SHARED_POLL_S). Termina se este worker for eleito, para o broadcaster
+        voltar a abrir o stream, agora ao AV.
+        """
+        if self._election.leader:
+            async for data in self._watch():
+                yield data
+            return
+        while not self._election.leader:
+            known = self._version
+            data = self.latest()
+            if data is not None and self._version != known:
+                yield data
+            await asyncio.sleep(SHARED_POLL_S)
+
+    def publish(self, data: bytes, tag: int = 0) -> None:
+        """
+        Escreve o snapshot no segmento (no líder), se ainda não foi escrito.
+        """
+        if data is not self._written:
+            self.segment.write(data, tag)
+            self._written = data
+            self._publishes.inc()
+
+    async def mirror(self, get: Callable[[], Awaitable], interval: float) -> None:
+        """
+        No líder: publica o snapshot de get() (ex.: CandidateCache.get) a cada 'interval' segundos.
+        """
+        while True:
+            try:
+                snapshot = await get()
+                self.publish(snapshot.raw, getattr(snapshot, "version", 0))
+            except Exception as e:
+                # AV inacessível (os restantes workers continuam com o último snapshot) ou snapshot grande demais.
+                FAILURES.labels(self._label, error_class(e)).inc()
+            await asyncio.sleep(interval)
+
+    async def mirror_stream(self, subscribe: Callable, unsubscribe: Callable, heartbeat: float) -> None:
+        """
+        No líder: publica cada snapshot entregue por um ResultsBroadcaster (stream ou consultas ao AV).
+        """
+        subscriber = subscribe()
+        try:
+            while True:
+                snapshot = await subscriber.next(heartbeat)
+                if snapshot is None:
+                    continue
+                try:
+                    self.publish(snapshot.raw, snapshot.version)
+                except ValueError as e:
+                    FAILURES.labels(self._label, error_class(e)).inc()
+        finally:
+            unsubscribe(subscriber)
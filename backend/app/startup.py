@@ -0,0 +1,95 @@
+"""
+Arranque do worker: aquecimento antes de receber tráfego e estado para GET /ready.
+
+- /health diz apenas que o processo responde (liveness);
+- /ready responde 200 depois de concluído o aquecimento e enquanto nenhum circuit breaker
+  AR/AV estiver aberto; caso contrário 503, com o estado de cada passo.
+
+Passos do aquecimento (STARTUP_WARMUP=1), por ordem:
+  transport  -> importa grpc e liga os canais a todos os destinos (GRPC_TRANSPORT=grpc), ou
+                confirma o grpcurl e gera o protoset (GRPC_TRANSPORT=grpcurl);
+  candidates -> carrega a cache de candidatos;
+  results    -> carrega a cache de resultados.
+Um passo que falhe (ex.: AV inacessível) é repetido com recuo exponencial até
+STARTUP_RETRY_MAX_S; entretanto o worker serve pedidos normalmente, só não se declara pronto.
+"""
+import asyncio
+import os
+import random
+import time
+from typing import Awaitable, Callable, Dict, List
+
+from .metrics import Gauge, error_class
+from .resilience import OPEN, _breakers
+
+STARTUP_WARMUP = os.getenv("STARTUP_WARMUP", "1") == "1"
+STARTUP_STEP_TIMEOUT_S = float(os.getenv("STARTUP_STEP_TIMEOUT_S", "10"))
+STARTUP_RETRY_MAX_S = float(os.getenv("STARTUP_RETRY_MAX_S", "30"))
+
+READY = Gauge("startup_ready", "1 depois de concluído o aquecimento do arranque.")
+WARMUP_SECONDS = Gauge("startup_warmup_seconds", "Segundos desde o import da aplicação até ao fim do aquecimento.")
+
+_PROCESS_START = time.monotonic()
+
+
+class Readiness:
+    """
+    Executa os passos de aquecimento em segundo plano e guarda o estado de cada um.
+    'steps' é uma lista de (nome, função assíncrona sem argumentos).
+    """
+
+    def __init__(self, steps: List[tuple], step_timeout: float = STARTUP_STEP_TIMEOUT_S):
+        self.steps = steps
+        self.step_timeout = step_timeout
+        self.checks: Dict[str, str] = {name: "pending" for name, _ in steps}
+        self.warm = not steps
+        self._task: asyncio.Task | None = None
+        READY.set(1 if self.warm else 0)
+
+    def start(self) -> None:
+        if not self.warm and self._task is None:
+            self._task = asyncio.ensure_future(self._run())
+
+    async def close(self) -> None:
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
+
+    async def _step(self, name: str, step: Callable[[], Awaitable]) -> bool:
+        try:
+            await asyncio.wait_for(step(), self.step_timeout)
+        except asyncio.TimeoutError:
+            self.checks[name] = f"timeout ({self.step_timeout:g}s)"
+            return False
+        except Exception as e:
+            self.checks[name] = f"{error_class(e)}: {e}"
+            return False
+        self.checks[name] = "ok"
+        return True
+
+    async def _run(self) -> None:
+        delay = 0.5
+        while True:
+            # Cada passo depende do anterior (ex.: as caches precisam do transporte).
+            for name, step in self.steps:
+                if self.checks[name] != "ok" and not await self._step(name, step):
+                    break
+            else:
+                self.warm = True
+                READY.set(1)
+                WARMUP_SECONDS.set(time.monotonic() - _PROCESS_START)
+                return
+            await asyncio.sleep(delay * random.uniform(0.5, 1.0))
+            delay = min(delay * 2, STARTUP_RETRY_MAX_S)
+
+    def status(self) -> tuple:
+        """
+        (pronto?, corpo JSON de /ready).
+        """
+        open_breakers = sorted(service for service, b in list(_breakers.items()) if b.state == OPEN)
+        ready = self.warm and not open_breakers
+        body = {"status": "ready" if ready else "starting" if not self.warm else "degraded", "checks": self.checks}
+        if open_breakers:
+            body["open_breakers"] = open_breakers
+        return ready, body
@@ -0,0 +1,135 @@
+"""
+Servir o frontend (site/) a partir do backend (SERVE_SITE=1), na mesma origem da API.
+
+No arranque, cada ficheiro é lido para memória e pré-comprimido (gzip e, se o módulo brotli estiver
+instalado, br; sem ele fica um aviso no log). Os recursos referenciados pelo index.html (app.js,
+config.js, ...) ganham um nome com impressão digital do conteúdo (ex.: app.3f2a9c1b7e.js) e são servidos com
+"Cache-Control: immutable" durante um ano; o index.html é sempre revalidado (ETag + 304).
+
+O index.html recebe <meta name="backend-url" content="same-origin">: config.js usa então a própria
+origem da página como BACKEND_URL, sem pedidos CORS nem preflight.
+"""
+import gzip
+import hashlib
+import logging
+import mimetypes
+import os
+import re
+from pathlib import Path
+from typing import Dict
+
+from starlette.requests import Request
+from starlette.responses import Response
+
+from .cache import etag_matches
+from .codec import accepts_encoding
+from .grpc_clients import BASE_DIR
+
+SERVE_SITE = os.getenv("SERVE_SITE", "0") == "1"
+SITE_DIR = os.getenv("SITE_DIR", str(BASE_DIR.parent / "site"))
+
+_log = logging.getLogger(__name__)
+
+_IMMUTABLE = "public, max-age=31536000, immutable"
+_REVALIDATE = "no-cache"
+_COMPRESSIBLE = {"text/html", "text/css", "text/javascript", "application/javascript", "application/json",
+                 "image/svg+xml"}
+_SAME_ORIGIN_META = '<meta name="backend-url" content="same-origin" />'
+
+
+def _brotli():
+    try:
+        import brotli
+    except ImportError:
+        return None
+    return brotli
+
+
+class Asset:
+    """
+    Um ficheiro do site: corpo original e variantes comprimidas (só as que ficam mais pequenas).
+    """
+
+    def __init__(self, body: bytes, media_type: str, cache_control: str):
+        self.media_type = media_type
+        self.cache_control = cache_control
+        digest = hashlib.sha256(body).hexdigest()
+        self.fingerprint = digest[:10]
+        self.variants: Dict[str, tuple] = {"identity": (body, f'"{digest[:16]}"')}
+        if media_type.split(";")[0] in _COMPRESSIBLE:
+            self._add("gzip", gzip.compress(body, 9, mtime=0), digest)
+            brotli = _brotli()
+            if brotli is not None:
+                self._add("br", brotli.compress(body, quality=11), digest)
+
+    def with_cache_control(self, cache_control: str) -> "Asset":
+        asset = object.__new__(Asset)
+        asset.__dict__.update(self.__dict__, cache_control=cache_control)
+        return asset
+
+    def _add(self, encoding: str, data: bytes, digest: str) -> None:
+        if len(data) < len(self.variants["identity"][0]):
+            suffix = "gz" if encoding == "gzip" else encoding
+            self.variants[encoding] = (data, f'"{digest[:16]}.{suffix}"')
+
+    def pick(self, accept_encoding: str | None) -> str:
+        for encoding in ("br", "gzip"):
+            if encoding in self.variants and accepts_encoding(accept_encoding, encoding):
+                return encoding
+        return "identity"
+
+    def response(self, request: Request) -> Response:
+        encoding = self.pick(request.headers.get("accept-encoding"))
+        body, etag = self.variants[encoding]
+        headers = {"ETag": etag, "Cache-Control": self.cache_control, "Vary": "Accept-Encoding"}
+        if encoding != "identity":
+            headers["Content-Encoding"] = encoding
+        if etag_matches(request.headers.get("if-none-match"), etag):
+            return Response(status_code=304, headers=headers)
+        return Response(body, media_type=self.media_type, headers=headers)
+
+
+def _media_type(path: Path) -> str:
+    if path.suffix == ".js":
+        return "text/javascript; charset=utf-8"
+    media_type = mimetypes.guess_type(path.name)[0] or "application/octet-stream"
+    return media_type + "; charset=utf-8" if media_type.startswith("text/") else media_type
+
+
+def build_site(site_dir: str = SITE_DIR) -> Dict[str, Asset]:
+    """
+    Lê e prepara o site; devolve caminho URL -> Asset (nomes originais e com impressão digital).
+    """
+    root = Path(site_dir)
+    index_path = root / "index.html"
+    if not index_path.is_file():
+        raise RuntimeError(f"SERVE_SITE=1 mas {index_path} não existe (ver SITE_DIR)")
+    if _brotli() is None:
+        _log.warning("Módulo brotli não instalado (pip install -r requirements.txt): o site é servido só com gzip")
+
+    routes: Dict[str, Asset] = {}
+    html = index_path.read_text(encoding="utf-8")
+    for path in sorted(p for p in root.iterdir() if p.is_file() and p.name != "index.html"):
+        fingerprinted = Asset(path.read_bytes(), _media_type(path), _IMMUTABLE)
+        name = f"{path.stem}.{fingerprinted.fingerprint}{path.suffix}"
+        routes["/" + name] = fingerprinted
+        # Nome original: sempre revalidado (links antigos e ferramentas continuam a funcionar).
+        routes["/" + path.name] = fingerprinted.with_cache_control(_REVALIDATE)
+        html = re.sub(
+            rf'((?:src|href)=")(?:\./)?{re.escape(path.name)}"',
+            lambda m: f'{m.group(1)}./{name}"',
+            html,
+        )
+
+    html = html.replace("<head>", "<head>\n  " + _SAME_ORIGIN_META, 1)
+    index = Asset(html.encode("utf-8"), "text/html; charset=utf-8", _REVALIDATE)
+    routes["/"] = routes["/index.html"] = index
+    return routes
+
+
+def register_site_routes(app, site_dir: str = SITE_DIR) -> None:
+    for path, asset in build_site(site_dir).items():
+        async def serve(request: Request, asset: Asset = asset) -> Response:
+            return asset.response(request)
+
+        app.add_route(path, serve, methods=["GET"], include_in_schema=False)
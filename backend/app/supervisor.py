@@ -0,0 +1,193 @@
+"""
+Modo multi-worker: N processos uvicorn com app.main na mesma máquina e no mesmo porto.
+
+- Cria os segmentos de memória partilhada dos snapshots de candidatos e resultados (app/shared.py):
+  só um worker, eleito, contacta o AV para estas leituras; os restantes leem a memória partilhada.
+- Em Linux cada worker tem o seu socket no mesmo porto (SO_REUSEPORT) e o kernel distribui as ligações;
+  nos restantes sistemas (ex.: Windows) os workers partilham um único socket.
+- CREDENTIAL_STORE=memory passa a mmap: o bloqueio de credenciais tem de ser comum a todos os workers.
+  Sem CREDENTIAL_STORE_PATH, o ficheiro fica em <--state-dir>/used_credentials.bin (persistente entre
+  reinícios), com capacidade fixa --credential-capacity (definida quando o ficheiro é criado).
+- Um worker que termine é substituído (com recuo se falhar logo no arranque). SIGINT/SIGTERM terminam
+  todos os workers e removem os segmentos.
+
+Uso (a partir de backend/):
+    python -m app.supervisor --workers 4 --host 0.0.0.0 --port 8000 --state-dir ./state
+"""
+import argparse
+import multiprocessing
+import os
+import signal
+import socket
+import sys
+import time
+from pathlib import Path
+
+WORKERS = int(os.getenv("WORKERS", "0"))
+WORKER_RESTART_MAX_S = float(os.getenv("WORKER_RESTART_MAX_S", "30"))
+# Estado local desta instalação (registo de credenciais partilhado pelos workers).
+STATE_DIR = os.getenv("STATE_DIR", "state")
+
+
+def _load_env() -> None:
+    # O mesmo .env que app.main carrega: a configuração tem de ser vista antes de arrancar os workers.
+    env_file = next((d / ".env" for d in Path(__file__).resolve().parents if (d / ".env").is_file()), None)
+    if env_file is not None:
+        from dotenv import load_dotenv
+
+        load_dotenv(env_file)
+
+
+def _credential_store(state_dir: str, capacity: int) -> None:
+    """
+    Fixa no ambiente dos workers o registo de credenciais partilhado (mmap): caminho e capacidade.
+    O ficheiro é criado aqui, antes dos workers, e a capacidade efetiva é mostrada no arranque.
+    """
+    from .credentials import MmapCredentialStore
+
+    if os.getenv("CREDENTIAL_STORE", "memory").strip().lower() == "memory":
+        os.environ["CREDENTIAL_STORE"] = "mmap"
+    if os.environ["CREDENTIAL_STORE"].strip().lower() != "mmap":
+        return
+    path = os.getenv("CREDENTIAL_STORE_PATH", "")
+    if not path:
+        os.makedirs(state_dir, exist_ok=True)
+        path = os.path.join(state_dir, "used_credentials.bin")
+    os.environ["CREDENTIAL_STORE_PATH"] = path
+    os.environ["CREDENTIAL_STORE_CAPACITY"] = str(capacity)
+    store = MmapCredentialStore(path, capacity)
+    try:
+        print(f"Supervisor: credenciais em {os.path.abspath(path)}: {len(store)} de {store.limit} usadas", flush=True)
+        if store.limit < capacity:
+            print(f"Supervisor: AVISO: {path} foi criado com capacidade {store.limit} < {capacity}; "
+                  f"para aumentar, usar outro --state-dir (ou CREDENTIAL_STORE_PATH)", flush=True)
+    finally:
+        store.close()
+
+
+def _listen(host: str, port: int, reuse_port: bool) -> socket.socket:
+    family = socket.AF_INET6 if ":" in host else socket.AF_INET
+    sock = socket.socket(family, socket.SOCK_STREAM)
+    sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    if reuse_port:
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    sock.bind((host, port))
+    sock.listen(2048)
+    sock.set_inheritable(True)
+    return sock
+
+
+def _serve(sock: socket.socket, host: str, port: int, log_level: str) -> None:
+    """
+    Processo worker: a aplicação é importada aqui, já com SHARED_SNAPSHOTS no ambiente.
+    """
+    import uvicorn
+
+    config = uvicorn.Config("app.main:app", host=host, port=port, log_level=log_level)
+    uvicorn.Server(config).run(sockets=[sock])
+
+
+class Supervisor:
+    def __init__(self, workers: int, host: str, port: int, log_level: str = "info"):
+        from .shared import SHARED_SNAPSHOT_MB, SharedSegment, lock_path, segment_name
+
+        self.host = host
+        self.port = port
+        self.log_level = log_level
+        # Só o Linux distribui as ligações entre sockets com SO_REUSEPORT.
+        self.reuse_port = sys.platform.startswith("linux") and hasattr(socket, "SO_REUSEPORT")
+        self.prefix = f"vs{os.getpid()}"
+        self.lock_path = lock_path(self.prefix)
+        size = int(SHARED_SNAPSHOT_MB * 1024 * 1024)
+        self.segments = [SharedSegment(segment_name(self.prefix, name), create=True, size=size)
+                         for name in ("candidates", "results")]
+        # Um socket por worker com SO_REUSEPORT; o supervisor mantém-nos abertos, pelo que um worker
+        # substituído recebe o mesmo socket (e as ligações que entretanto ficaram na fila).
+        n = workers if self.reuse_port else 1
+        self.sockets = [_listen(host, port, self.reuse_port) for _ in range(n)]
+        self.processes: list = [None] * workers
+        self._started = [0.0] * workers
+        self._delay = [0.0] * workers
+        self._stopping = False
+        self._context = multiprocessing.get_context("spawn")
+
+    def _start(self, i: int) -> None:
+        sock = self.sockets[i % len(self.sockets)]
+        p = self._context.Process(
+            target=_serve, args=(sock, self.host, self.port, self.log_level), name=f"worker-{i}", daemon=False)
+        p.start()
+        self.processes[i] = p
+        self._started[i] = time.monotonic()
+
+    def stop(self, *_) -> None:
+        self._stopping = True
+
+    def run(self) -> None:
+        os.environ["SHARED_SNAPSHOTS"] = self.prefix
+        for i in range(len(self.processes)):
+            self._start(i)
+        mode = "SO_REUSEPORT" if self.reuse_port else "socket partilhado"
+        print(f"Supervisor {os.getpid()}: {len(self.processes)} workers em http://{self.host}:{self.port} ({mode})",
+              flush=True)
+        try:
+            while not self._stopping:
+                time.sleep(0.5)
+                for i, p in enumerate(self.processes):
+                    if p.is_alive() or self._stopping:
+                        continue
+                    # Falhou logo no arranque: recuo exponencial antes de tentar de novo.
+                    lived = time.monotonic() - self._started[i]
+                    self._delay[i] = 0.0 if lived > WORKER_RESTART_MAX_S else min(
+                        max(self._delay[i] * 2, 0.5), WORKER_RESTART_MAX_S)
+                    print(f"Supervisor: worker-{i} (pid {p.pid}) terminou com código {p.exitcode}; "
+                          f"a substituir em {self._delay[i]:g}s", flush=True)
+                    time.sleep(self._delay[i])
+                    if not self._stopping:
+                        self._start(i)
+        finally:
+            self._shutdown()
+
+    def _shutdown(self) -> None:
+        for p in self.processes:
+            if p is not None and p.is_alive():
+                p.terminate()
+        deadline = time.monotonic() + 10
+        for p in self.processes:
+            if p is not None:
+                p.join(max(0.0, deadline - time.monotonic()))
+                if p.is_alive():
+                    p.kill()
+        for sock in self.sockets:
+            sock.close()
+        for segment in self.segments:
+            segment.close()
+            segment.unlink()
+        if os.path.exists(self.lock_path):
+            os.remove(self.lock_path)
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", type=int, default=WORKERS or os.cpu_count() or 1,
+                    help="número de workers (WORKERS; por omissão, o número de CPUs)")
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=int(os.getenv("PORT", "8000")))
+    ap.add_argument("--log-level", default="info")
+    ap.add_argument("--state-dir", default=None, help="pasta do estado local (STATE_DIR; por omissão ./state)")
+    ap.add_argument("--credential-capacity", type=int, default=None,
+                    help="credenciais no registo partilhado (CREDENTIAL_STORE_CAPACITY; fixa na criação do ficheiro)")
+    args = ap.parse_args()
+
+    # Os valores por omissão dependem do .env, lido só agora.
+    _load_env()
+    _credential_store(args.state_dir or os.getenv("STATE_DIR", STATE_DIR),
+                      args.credential_capacity or int(os.getenv("CREDENTIAL_STORE_CAPACITY", "1000000")))
+
+    supervisor = Supervisor(args.workers, args.host, args.port, args.log_level)
+    signal.signal(signal.SIGTERM, supervisor.stop)
+    signal.signal(signal.SIGINT, supervisor.stop)
+    supervisor.run()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,132 @@
+"""
+Decomposição do tempo de cada pedido em spans (validação, bloqueio local, fila do limitador,
+arranque do grpcurl, RPC, codificação...).
+
+- SERVER_TIMING=1 (desativado por omissão: expõe tempos internos a qualquer cliente): cabeçalho
+  Server-Timing em cada resposta (visível nas DevTools do browser), ex.:
+    Server-Timing: validate;dur=0.21, credentials;dur=0.01, queue;dur=0.00, rpc;dur=12.4, total;dur=13.2
+- REQUEST_LOG=1: uma linha JSON por pedido (logger "app.timing", stderr) com rota, estado e spans;
+  com REQUEST_LOG_SLOW_MS só os pedidos mais lentos do que esse limite.
+
+Os spans são guardados numa ContextVar do pedido: com ambos desativados, span() não faz nada.
+Spans repetidos no mesmo pedido (ex.: votos de um lote) são somados (desc="n=<vezes>").
+"""
+import json
+import logging
+import os
+import sys
+import time
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Dict, List
+
+SERVER_TIMING = os.getenv("SERVER_TIMING", "0") == "1"
+REQUEST_LOG = os.getenv("REQUEST_LOG", "0") == "1"
+REQUEST_LOG_SLOW_MS = float(os.getenv("REQUEST_LOG_SLOW_MS", "0"))
+
+ENABLED = SERVER_TIMING or REQUEST_LOG
+
+
+class _Trace:
+    __slots__ = ("start", "spans")
+
+    def __init__(self):
+        self.start = time.perf_counter()
+        # nome -> [duração total (s), número de ocorrências]
+        self.spans: Dict[str, List[float]] = {}
+
+    def add(self, name: str, seconds: float) -> None:
+        entry = self.spans.get(name)
+        if entry is None:
+            self.spans[name] = [seconds, 1]
+        else:
+            entry[0] += seconds
+            entry[1] += 1
+
+
+_trace: ContextVar[_Trace | None] = ContextVar("trace", default=None)
+
+
+@contextmanager
+def span(name: str):
+    trace = _trace.get()
+    if trace is None:
+        yield
+        return
+    t0 = time.perf_counter()
+    try:
+        yield
+    finally:
+        trace.add(name, time.perf_counter() - t0)
+
+
+def mark(name: str) -> None:
+    """
+    Span desde o início do pedido até agora (ex.: "validate" no início do endpoint = leitura do corpo,
+    encaminhamento e validação Pydantic).
+    """
+    trace = _trace.get()
+    if trace is not None:
+        trace.add(name, time.perf_counter() - trace.start)
+
+
+def _server_timing(trace: _Trace, total: float) -> bytes:
+    parts = []
+    for name, (seconds, count) in trace.spans.items():
+        part = f"{name};dur={seconds * 1000:.2f}"
+        parts.append(part + f';desc="n={count}"' if count > 1 else part)
+    parts.append(f"total;dur={total * 1000:.2f}")
+    return ", ".join(parts).encode("latin-1")
+
+
+_log = logging.getLogger("app.timing")
+if REQUEST_LOG and not _log.handlers:
+    _handler = logging.StreamHandler(sys.stderr)
+    _handler.setFormatter(logging.Formatter("%(message)s"))
+    _log.addHandler(_handler)
+    _log.setLevel(logging.INFO)
+    _log.propagate = False
+
+
+class TimingMiddleware:
+    """
+    Middleware ASGI: abre o registo de spans do pedido, acrescenta Server-Timing à resposta e
+    escreve a linha de log estruturada no fim.
+    """
+
+    def __init__(self, app):
+        self.app = app
+
+    async def __call__(self, scope, receive, send):
+        if scope["type"] != "http":
+            return await self.app(scope, receive, send)
+
+        trace = _Trace()
+        token = _trace.set(trace)
+        status = [500]
+
+        async def send_wrapper(message):
+            if message["type"] == "http.response.start":
+                status[0] = message["status"]
+                if SERVER_TIMING:
+                    total = time.perf_counter() - trace.start
+                    headers = list(message.get("headers", []))
+                    headers.append((b"server-timing", _server_timing(trace, total)))
+                    message = {**message, "headers": headers}
+            await send(message)
+
+        try:
+            await self.app(scope, receive, send_wrapper)
+        finally:
+            _trace.reset(token)
+            total = time.perf_counter() - trace.start
+            if REQUEST_LOG and total * 1000 >= REQUEST_LOG_SLOW_MS:
+                route = scope.get("route")
+                _log.info(json.dumps({
+                    "ts": round(time.time(), 3),
+                    "method": scope["method"],
+                    "route": getattr(route, "path", scope.get("path", "")),
+                    "status": status[0],
+                    "dur_ms": round(total * 1000, 2),
+                    "spans": {name: round(s * 1000, 3) for name, (s, _) in trace.spans.items()},
+                }, separators=(",", ":")))
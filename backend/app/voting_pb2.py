@@ -24,7 +24,7 @@ _sym_db = _symbol_database.Default()
 
 
 
-DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0cvoting.proto\x12\x06voting\"\x16\n\x14GetCandidatesRequest\"\x13\n\x11GetResultsRequest\"%\n\tCandidate\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\">\n\x15GetCandidatesResponse\x12%\n\ncandidates\x18\x01 \x03(\x0b\x32\x11.voting.Candidate\">\n\x0bVoteRequest\x12\x19\n\x11voting_credential\x18\x01 \x01(\t\x12\x14\n\x0c\x63\x61ndidate_id\x18\x02 \x01(\x05\"0\n\x0cVoteResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\":\n\x0f\x43\x61ndidateResult\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\r\n\x05votes\x18\x03 \x01(\x05\">\n\x12GetResultsResponse\x12(\n\x07results\x18\x01 \x03(\x0b\x32\x17.voting.CandidateResult2\xd5\x01\n\rVotingService\x12L\n\rGetCandidates\x12\x1c.voting.GetCandidatesRequest\x1a\x1d.voting.GetCandidatesResponse\x12\x31\n\x04Vote\x12\x13.voting.VoteRequest\x1a\x14.voting.VoteResponse\x12\x43\n\nGetResults\x12\x19.voting.GetResultsRequest\x1a\x1a.voting.GetResultsResponseB\x16\xaa\x02\x13VotingSystem.Votingb\x06proto3')
+DESCRIPTOR = _descriptor_pool.Default().AddSerializedFile(b'\n\x0cvoting.proto\x12\x06voting\"\x16\n\x14GetCandidatesRequest\"\x13\n\x11GetResultsRequest\"\x15\n\x13WatchResultsRequest\"%\n\tCandidate\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\">\n\x15GetCandidatesResponse\x12%\n\ncandidates\x18\x01 \x03(\x0b\x32\x11.voting.Candidate\">\n\x0bVoteRequest\x12\x19\n\x11voting_credential\x18\x01 \x01(\t\x12\x14\n\x0c\x63\x61ndidate_id\x18\x02 \x01(\x05\"0\n\x0cVoteResponse\x12\x0f\n\x07success\x18\x01 \x01(\x08\x12\x0f\n\x07message\x18\x02 \x01(\t\":\n\x11\x42\x61tchVoteResponse\x12%\n\x07results\x18\x01 \x03(\x0b\x32\x14.voting.VoteResponse\":\n\x0f\x43\x61ndidateResult\x12\n\n\x02id\x18\x01 \x01(\x05\x12\x0c\n\x04name\x18\x02 \x01(\t\x12\r\n\x05votes\x18\x03 \x01(\x05\">\n\x12GetResultsResponse\x12(\n\x07results\x18\x01 \x03(\x0b\x32\x17.voting.CandidateResult2\xdf\x02\n\rVotingService\x12L\n\rGetCandidates\x12\x1c.voting.GetCandidatesRequest\x1a\x1d.voting.GetCandidatesResponse\x12\x31\n\x04Vote\x12\x13.voting.VoteRequest\x1a\x14.voting.VoteResponse\x12\x43\n\nGetResults\x12\x19.voting.GetResultsRequest\x1a\x1a.voting.GetResultsResponse\x12I\n\x0cWatchResults\x12\x1b.voting.WatchResultsRequest\x1a\x1a.voting.GetResultsResponse0\x01\x12=\n\tBatchVote\x12\x13.voting.VoteRequest\x1a\x19.voting.BatchVoteResponse(\x01\x42\x16\xaa\x02\x13VotingSystem.Votingb\x06proto3')
 
 _globals = globals()
 _builder.BuildMessageAndEnumDescriptors(DESCRIPTOR, _globals)
@@ -36,18 +36,22 @@ if not _descriptor._USE_C_DESCRIPTORS:
   _globals['_GETCANDIDATESREQUEST']._serialized_end=46
   _globals['_GETRESULTSREQUEST']._serialized_start=48
   _globals['_GETRESULTSREQUEST']._serialized_end=67
-  _globals['_CANDIDATE']._serialized_start=69
-  _globals['_CANDIDATE']._serialized_end=106
-  _globals['_GETCANDIDATESRESPONSE']._serialized_start=108
-  _globals['_GETCANDIDATESRESPONSE']._serialized_end=170
-  _globals['_VOTEREQUEST']._serialized_start=172
-  _globals['_VOTEREQUEST']._serialized_end=234
-  _globals['_VOTERESPONSE']._serialized_start=236
-  _globals['_VOTERESPONSE']._serialized_end=284
-  _globals['_CANDIDATERESULT']._serialized_start=286
-  _globals['_CANDIDATERESULT']._serialized_end=344
-  _globals['_GETRESULTSRESPONSE']._serialized_start=346
-  _globals['_GETRESULTSRESPONSE']._serialized_end=408
-  _globals['_VOTINGSERVICE']._serialized_start=411
-  _globals['_VOTINGSERVICE']._serialized_end=624
+  _globals['_WATCHRESULTSREQUEST']._serialized_start=69
+  _globals['_WATCHRESULTSREQUEST']._serialized_end=90
+  _globals['_CANDIDATE']._serialized_start=92
+  _globals['_CANDIDATE']._serialized_end=129
+  _globals['_GETCANDIDATESRESPONSE']._serialized_start=131
+  _globals['_GETCANDIDATESRESPONSE']._serialized_end=193
+  _globals['_VOTEREQUEST']._serialized_start=195
+  _globals['_VOTEREQUEST']._serialized_end=257
+  _globals['_VOTERESPONSE']._serialized_start=259
+  _globals['_VOTERESPONSE']._serialized_end=307
+  _globals['_BATCHVOTERESPONSE']._serialized_start=309
+  _globals['_BATCHVOTERESPONSE']._serialized_end=367
+  _globals['_CANDIDATERESULT']._serialized_start=369
+  _globals['_CANDIDATERESULT']._serialized_end=427
+  _globals['_GETRESULTSRESPONSE']._serialized_start=429
+  _globals['_GETRESULTSRESPONSE']._serialized_end=491
+  _globals['_VOTINGSERVICE']._serialized_start=494
+  _globals['_VOTINGSERVICE']._serialized_end=845
 # @@protoc_insertion_point(module_scope)
@@ -1,4 +1,4 @@
-﻿# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
+# Generated by the gRPC Python protocol compiler plugin. DO NOT EDIT!
 """Client and server classes corresponding to protobuf-defined services."""
 import grpc
 import warnings
@@ -26,7 +26,7 @@ if _version_not_supported:
 
 
 class VotingServiceStub(object):
-    """ServiÃ§o de votaÃ§Ã£o
+    """Serviço de votação
     """
 
     def __init__(self, channel):
@@ -50,10 +50,20 @@ class VotingServiceStub(object):
                 request_serializer=voting__pb2.GetResultsRequest.SerializeToString,
                 response_deserializer=voting__pb2.GetResultsResponse.FromString,
                 _registered_method=True)
+        self.WatchResults = channel.unary_stream(
+                '/voting.VotingService/WatchResults',
+                request_serializer=voting__pb2.WatchResultsRequest.SerializeToString,
+                response_deserializer=voting__pb2.GetResultsResponse.FromString,
+                _registered_method=True)
+        self.BatchVote = channel.stream_unary(
+                '/voting.VotingService/BatchVote',
+                request_serializer=voting__pb2.VoteRequest.SerializeToString,
+                response_deserializer=voting__pb2.BatchVoteResponse.FromString,
+                _registered_method=True)
 
 
 class VotingServiceServicer(object):
-    """ServiÃ§o de votaÃ§Ã£o
+    """Serviço de votação
     """
 
     def GetCandidates(self, request, context):
@@ -71,7 +81,21 @@ class VotingServiceServicer(object):
         raise NotImplementedError('Method not implemented!')
 
     def GetResults(self, request, context):
-        """Obter resultados: candidatos + nÃºmero de votos
+        """Obter resultados: candidatos + número de votos
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def WatchResults(self, request, context):
+        """Acompanhar resultados: envia o estado atual e um novo GetResultsResponse sempre que os votos mudam
+        """
+        context.set_code(grpc.StatusCode.UNIMPLEMENTED)
+        context.set_details('Method not implemented!')
+        raise NotImplementedError('Method not implemented!')
+
+    def BatchVote(self, request_iterator, context):
+        """Votar em lote: vários VoteRequest numa só chamada; um VoteResponse por voto, pela mesma ordem
         """
         context.set_code(grpc.StatusCode.UNIMPLEMENTED)
         context.set_details('Method not implemented!')
@@ -95,6 +119,16 @@ def add_VotingServiceServicer_to_server(servicer, server):
                     request_deserializer=voting__pb2.GetResultsRequest.FromString,
                     response_serializer=voting__pb2.GetResultsResponse.SerializeToString,
             ),
+            'WatchResults': grpc.unary_stream_rpc_method_handler(
+                    servicer.WatchResults,
+                    request_deserializer=voting__pb2.WatchResultsRequest.FromString,
+                    response_serializer=voting__pb2.GetResultsResponse.SerializeToString,
+            ),
+            'BatchVote': grpc.stream_unary_rpc_method_handler(
+                    servicer.BatchVote,
+                    request_deserializer=voting__pb2.VoteRequest.FromString,
+                    response_serializer=voting__pb2.BatchVoteResponse.SerializeToString,
+            ),
     }
     generic_handler = grpc.method_handlers_generic_handler(
             'voting.VotingService', rpc_method_handlers)
@@ -104,7 +138,7 @@ def add_VotingServiceServicer_to_server(servicer, server):
 
  # This class is part of an EXPERIMENTAL API.
 class VotingService(object):
-    """ServiÃ§o de votaÃ§Ã£o
+    """Serviço de votação
     """
 
     @staticmethod
@@ -187,3 +221,57 @@ class VotingService(object):
             timeout,
             metadata,
             _registered_method=True)
+
+    @staticmethod
+    def WatchResults(request,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.unary_stream(
+            request,
+            target,
+            '/voting.VotingService/WatchResults',
+            voting__pb2.WatchResultsRequest.SerializeToString,
+            voting__pb2.GetResultsResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
+
+    @staticmethod
+    def BatchVote(request_iterator,
+            target,
+            options=(),
+            channel_credentials=None,
+            call_credentials=None,
+            insecure=False,
+            compression=None,
+            wait_for_ready=None,
+            timeout=None,
+            metadata=None):
+        return grpc.experimental.stream_unary(
+            request_iterator,
+            target,
+            '/voting.VotingService/BatchVote',
+            voting__pb2.VoteRequest.SerializeToString,
+            voting__pb2.BatchVoteResponse.FromString,
+            options,
+            channel_credentials,
+            insecure,
+            call_credentials,
+            compression,
+            wait_for_ready,
+            timeout,
+            metadata,
+            _registered_method=True)
@@ -0,0 +1,102 @@
+"""
+Custo do registo de auditoria (app/audit.py) e tempo da recontagem offline (tools/recount.py).
+
+1) append(): latência por registo no caminho do pedido e número de fsync (group commit).
+2) Recontagem: gera um registo sintético com --records registos (NumPy), com alguns digests
+   repetidos de propósito, e mede a recontagem vetorizada.
+
+Uso (a partir de backend/):
+    python -m bench.audit_log --appends 200000 --records 100000000
+"""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from app.audit import ACCEPTED, AUDIT_FLUSH, HEADER, MAGIC, RECORD, VERSION, AuditLog
+from tools.recount import CHUNK_RECORDS, recount_numpy
+
+
+def _flushes() -> float:
+    # Contagem do histograma (soma dos buckets; o último total é a soma das durações).
+    return sum(AUDIT_FLUSH.labels()._v.totals()[:-1])
+
+
+def bench_append(tmp: Path, n: int, flush_ms: float) -> None:
+    before = _flushes()
+    log = AuditLog(str(tmp / "append.bin"), flush_s=flush_ms / 1000)
+    creds = [f"CRED-{i:012d}" for i in range(n)]
+    t0 = time.perf_counter()
+    for i, c in enumerate(creds):
+        log.append(c, 1 + i % 5, ACCEPTED)
+    elapsed = time.perf_counter() - t0
+    log.close()
+    flushes = _flushes() - before
+    size = (tmp / "append.bin").stat().st_size
+    assert size == HEADER.size + n * RECORD.size
+    print(
+        f"append: {elapsed / n * 1e6:.2f} µs/registo ({n / elapsed:,.0f}/s), "
+        f"{flushes:.0f} fsync (~{n / max(flushes, 1):,.0f} registos por fsync, AUDIT_FLUSH_MS={flush_ms:g})"
+    )
+
+
+def _generate(path: Path, n: int, candidates: int, duplicates: int) -> None:
+    import numpy as np
+
+    dtype = np.dtype([
+        ("ts", "<u8"), ("d0", "<u8"), ("d1", "<u8"), ("candidate", "<u4"), ("status", "u1"), ("_", "V3"),
+    ])
+    rng = np.random.default_rng(1)
+    with open(path, "wb") as f:
+        f.write(HEADER.pack(MAGIC, VERSION, RECORD.size))
+        for start in range(0, n, CHUNK_RECORDS):
+            m = min(CHUNK_RECORDS, n - start)
+            chunk = np.zeros(m, dtype=dtype)
+            chunk["ts"] = 1_700_000_000_000_000 + np.arange(start, start + m, dtype=np.uint64)
+            chunk["d0"] = rng.integers(0, 2 ** 63, m, dtype=np.uint64)
+            chunk["d1"] = rng.integers(0, 2 ** 63, m, dtype=np.uint64)
+            chunk["candidate"] = rng.integers(1, candidates + 1, m, dtype=np.uint32)
+            chunk["status"] = np.where(rng.random(m) < 0.98, ACCEPTED, 0)
+            if start == 0 and duplicates:
+                chunk[m - duplicates:][["d0", "d1", "status"]] = chunk[:duplicates][["d0", "d1", "status"]]
+                chunk["status"][:duplicates] = ACCEPTED
+                chunk["status"][m - duplicates:] = ACCEPTED
+            chunk.tofile(f)
+
+
+def bench_recount(tmp: Path, n: int, candidates: int) -> None:
+    path = tmp / "recount.bin"
+    duplicates = min(100, n // 2)
+    t0 = time.perf_counter()
+    _generate(path, n, candidates, duplicates)
+    print(f"gerado: {n:,} registos ({path.stat().st_size / 2**30:.2f} GiB) em {time.perf_counter() - t0:.1f}s")
+
+    t0 = time.perf_counter()
+    out = recount_numpy(str(path), n)
+    elapsed = time.perf_counter() - t0
+    print(
+        f"recontagem: {elapsed:.2f}s ({n / elapsed / 1e6:.1f} M registos/s), "
+        f"{sum(out['tally'].values()):,} votos aceites, {len(out['duplicates'])} duplicados (esperados {duplicates})"
+    )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--appends", type=int, default=200_000)
+    ap.add_argument("--flush-ms", type=float, default=10.0)
+    ap.add_argument("--records", type=int, default=10_000_000, help="registos da recontagem (0 para saltar)")
+    ap.add_argument("--candidates", type=int, default=5)
+    ap.add_argument("--dir", default=None, help="diretório temporário (precisa de --records x 32 bytes livres)")
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory(dir=args.dir) as d:
+        tmp = Path(d)
+        bench_append(tmp, args.appends, args.flush_ms)
+        if args.records:
+            bench_recount(tmp, args.records, args.candidates)
+            os.remove(tmp / "recount.bin")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,113 @@
+"""
+Micro-benchmark dos registos de credenciais usadas: memória por credencial e latência de consulta.
+
+Compara o set original (credenciais completas) com os backends de app/credentials.py.
+O memory começa com a capacidade por omissão e cresce durante a carga, como no backend; "pior add"
+é o add mais lento (o crescimento da tabela não pode parar o event loop).
+
+Uso (a partir de backend/):
+    python -m bench.credential_store --n 10000000
+    python -m bench.credential_store --n 1000000 --stores set,memory,mmap
+"""
+import argparse
+import gc
+import os
+import random
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from app.credentials import MemoryCredentialStore, MmapCredentialStore, SqliteCredentialStore
+
+
+def _credential(i: int) -> str:
+    # Formato semelhante ao emitido pelo AR (ex.: CRED-ABC-123...)
+    return f"CRED-{i:012d}-{(i * 2654435761) & 0xFFFFFFFF:08X}"
+
+
+def _open(kind: str, n: int, tmp: Path):
+    if kind == "set":
+        return set()
+    if kind == "memory":
+        return MemoryCredentialStore()
+    if kind == "mmap":
+        return MmapCredentialStore(str(tmp / "used.bin"), n)
+    if kind == "sqlite":
+        return SqliteCredentialStore(str(tmp / "used.sqlite3"))
+    raise ValueError(kind)
+
+
+def _footprint(kind: str, store, tmp: Path, traced: int) -> int:
+    """
+    Bytes ocupados: memória Python (tracemalloc) ou tamanho em disco para os backends em ficheiro.
+    """
+    if kind == "mmap":
+        return (tmp / "used.bin").stat().st_size
+    if kind == "sqlite":
+        return sum(p.stat().st_size for p in tmp.glob("used.sqlite3*"))
+    return traced
+
+
+def _lookup_ns(store, keys) -> float:
+    t0 = time.perf_counter_ns()
+    for k in keys:
+        k in store
+    return (time.perf_counter_ns() - t0) / len(keys)
+
+
+def run(kind: str, n: int, probes: int) -> None:
+    with tempfile.TemporaryDirectory() as d:
+        tmp = Path(d)
+        gc.collect()
+        tracemalloc.start()
+        base = tracemalloc.get_traced_memory()[0]
+
+        store = _open(kind, n, tmp)
+        t0 = time.perf_counter()
+        if kind == "sqlite":
+            # Inserção em lote numa transação: de outro modo a carga inicial domina o benchmark.
+            conn = store._conn()
+            conn.execute("BEGIN")
+        worst = 0
+        for i in range(n):
+            credential = _credential(i)
+            t = time.perf_counter_ns()
+            store.add(credential)
+            worst = max(worst, time.perf_counter_ns() - t)
+        if kind == "sqlite":
+            conn.execute("COMMIT")
+        load_s = time.perf_counter() - t0
+
+        traced = tracemalloc.get_traced_memory()[0] - base
+        tracemalloc.stop()
+        size = _footprint(kind, store, tmp, traced)
+
+        rnd = random.Random(1)
+        hits = [_credential(rnd.randrange(n)) for _ in range(probes)]
+        misses = [_credential(n + rnd.randrange(n)) for _ in range(probes)]
+        hit_ns = _lookup_ns(store, hits)
+        miss_ns = _lookup_ns(store, misses)
+
+        print(
+            f"{kind:>7} | n={n:>11,} | {size / n:8.1f} B/cred | carga {load_s:8.1f} s"
+            f" | pior add {worst / 1e6:7.2f} ms | hit {hit_ns:8.0f} ns | miss {miss_ns:8.0f} ns"
+        )
+        if hasattr(store, "close"):
+            store.close()
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--n", type=int, default=10_000_000, help="número de credenciais (por omissão 10M)")
+    ap.add_argument("--probes", type=int, default=200_000, help="consultas por medição")
+    ap.add_argument("--stores", default="set,memory,mmap,sqlite")
+    args = ap.parse_args()
+
+    print(f"pid={os.getpid()}  (memória: tracemalloc; mmap/sqlite: tamanho em disco)")
+    for kind in args.stores.split(","):
+        run(kind.strip(), args.n, args.probes)
+
+
+if __name__ == "__main__":
+    main()
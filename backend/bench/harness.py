@@ -0,0 +1,256 @@
+"""
+Utilitários comuns aos benchmarks: arranque de processos (stand-in AR/AV, gateway uvicorn),
+cliente HTTP/1.1 keep-alive mínimo (asyncio, sem dependências) e estatísticas de latência.
+"""
+import asyncio
+import json
+import os
+import socket
+import subprocess
+import sys
+import time
+import urllib.request
+from contextlib import contextmanager
+from pathlib import Path
+from typing import Dict, List
+
+BACKEND_DIR = Path(__file__).resolve().parents[1]
+
+
+def free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def wait_port(port: int, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=0.5):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"porto {port} não ficou disponível em {timeout}s")
+
+
+def wait_http(url: str, timeout: float = 15.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            urllib.request.urlopen(url, timeout=1).read()
+            return
+        except OSError:
+            time.sleep(0.05)
+    raise TimeoutError(f"{url} não respondeu em {timeout}s")
+
+
+@contextmanager
+def process(args: List[str], env: Dict[str, str] | None = None, quiet: bool = True):
+    p = subprocess.Popen(
+        args,
+        cwd=str(BACKEND_DIR),
+        env={**os.environ, **(env or {})},
+        stdout=subprocess.DEVNULL if quiet else None,
+        stderr=subprocess.DEVNULL if quiet else None,
+    )
+    try:
+        yield p
+    finally:
+        p.terminate()
+        try:
+            p.wait(timeout=5)
+        except subprocess.TimeoutExpired:
+            p.kill()
+
+
+@contextmanager
+def standin_process(latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+                    candidates: int = 5, extra: List[str] | None = None):
+    """
+    Arranca servers.standin num porto livre e devolve (target "127.0.0.1:<porto>", processo).
+    """
+    port = free_port()
+    args = [
+        sys.executable, "-m", "servers.standin", "--port", str(port),
+        "--latency-ms", str(latency_ms), "--jitter-ms", str(jitter_ms),
+        "--error-rate", str(error_rate), "--candidates", str(candidates),
+    ] + (extra or [])
+    with process(args) as p:
+        wait_port(port)
+        yield f"127.0.0.1:{port}", p
+
+
+@contextmanager
+def standin(latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0,
+            candidates: int = 5, extra: List[str] | None = None):
+    """
+    Arranca servers.standin num porto livre e devolve o target "127.0.0.1:<porto>".
+    """
+    with standin_process(latency_ms, jitter_ms, error_rate, candidates, extra) as (target, _):
+        yield target
+
+
+@contextmanager
+def reference(procs: int = 1, candidates: int = 5, workers: int = 16, env: Dict[str, str] | None = None):
+    """
+    Arranca servers.reference (estado temporário) num porto livre e devolve o target "127.0.0.1:<porto>".
+    """
+    port = free_port()
+    args = [
+        sys.executable, "-m", "servers.reference", "--port", str(port), "--procs", str(procs),
+        "--candidates", str(candidates), "--workers", str(workers),
+    ]
+    with process(args, env):
+        wait_port(port)
+        yield f"127.0.0.1:{port}"
+
+
+@contextmanager
+def gateway_process(target: str, transport: str = "grpc", env: Dict[str, str] | None = None):
+    """
+    Arranca o backend FastAPI (uvicorn) ligado a 'target' e devolve (URL base, processo).
+    """
+    port = free_port()
+    genv = {"GRPC_TARGET": target, "GRPC_PLAINTEXT": "1", "GRPC_TRANSPORT": transport, **(env or {})}
+    args = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"]
+    with process(args, genv) as p:
+        url = f"http://127.0.0.1:{port}"
+        wait_http(url + "/health")
+        yield url, p
+
+
+@contextmanager
+def gateway(target: str, transport: str = "grpc", env: Dict[str, str] | None = None):
+    """
+    Arranca o backend FastAPI (uvicorn) ligado a 'target' e devolve o URL base.
+    """
+    with gateway_process(target, transport, env) as (url, _):
+        yield url
+
+
+def cpu_seconds(pid: int) -> float:
+    """
+    Tempo de CPU (utilizador + sistema) consumido pelo processo 'pid' (Linux, /proc).
+    """
+    fields = Path(f"/proc/{pid}/stat").read_text().rsplit(")", 1)[1].split()
+    return (int(fields[11]) + int(fields[12])) / os.sysconf("SC_CLK_TCK")
+
+
+class HttpClient:
+    """
+    Cliente HTTP/1.1 com uma ligação persistente (suficiente para JSON e respostas 'chunked').
+    """
+
+    def __init__(self, base_url: str):
+        hostport = base_url.split("://", 1)[1].rstrip("/")
+        self.host, _, port = hostport.partition(":")
+        self.port = int(port or 80)
+        self._reader = None
+        self._writer = None
+
+    async def _connect(self) -> None:
+        self._reader, self._writer = await asyncio.open_connection(self.host, self.port)
+
+    async def request(self, method: str, path: str, body=None, headers: Dict[str, str] | None = None):
+        """
+        Devolve (status, cabeçalhos, corpo em bytes).
+        """
+        if self._writer is None:
+            await self._connect()
+        payload = b"" if body is None else (body if isinstance(body, bytes) else json.dumps(body).encode())
+        head = [f"{method} {path} HTTP/1.1", f"Host: {self.host}", f"Content-Length: {len(payload)}"]
+        if body is not None:
+            head.append("Content-Type: application/json")
+        head += [f"{k}: {v}" for k, v in (headers or {}).items()]
+        self._writer.write(("\r\n".join(head) + "\r\n\r\n").encode() + payload)
+        try:
+            return await self._read_response()
+        except (asyncio.IncompleteReadError, ConnectionError):
+            await self.close()
+            raise
+
+    async def _read_response(self):
+        status_line = await self._reader.readline()
+        if not status_line:
+            raise ConnectionError("ligação fechada pelo servidor")
+        status = int(status_line.split()[1])
+        resp_headers: Dict[str, str] = {}
+        while True:
+            line = await self._reader.readline()
+            if line in (b"\r\n", b"\n", b""):
+                break
+            k, _, v = line.decode("latin-1").partition(":")
+            resp_headers[k.strip().lower()] = v.strip()
+
+        if status in (204, 304):
+            body = b""
+        elif resp_headers.get("transfer-encoding", "").lower() == "chunked":
+            chunks = []
+            while True:
+                size = int((await self._reader.readline()).split(b";")[0], 16)
+                if size == 0:
+                    await self._reader.readline()
+                    break
+                chunks.append(await self._reader.readexactly(size))
+                await self._reader.readline()
+            body = b"".join(chunks)
+        else:
+            body = await self._reader.readexactly(int(resp_headers.get("content-length", "0")))
+
+        if resp_headers.get("connection", "").lower() == "close":
+            await self.close()
+        return status, resp_headers, body
+
+    async def close(self) -> None:
+        if self._writer is not None:
+            self._writer.close()
+            self._writer = None
+            self._reader = None
+
+
+def percentile(sorted_values: List[float], p: float) -> float:
+    if not sorted_values:
+        return float("nan")
+    k = min(len(sorted_values) - 1, max(0, int(round(p / 100.0 * (len(sorted_values) - 1)))))
+    return sorted_values[k]
+
+
+class LatencyStats:
+    """
+    Latências (em segundos) e erros agrupados por nome (ex.: endpoint).
+    """
+
+    def __init__(self):
+        self.samples: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def record(self, name: str, seconds: float, ok: bool = True) -> None:
+        self.samples.setdefault(name, []).append(seconds)
+        if not ok:
+            self.errors[name] = self.errors.get(name, 0) + 1
+
+    def summary(self, elapsed: float) -> List[Dict[str, float]]:
+        rows = []
+        for name, values in self.samples.items():
+            values = sorted(values)
+            rows.append({
+                "name": name,
+                "count": len(values),
+                "errors": self.errors.get(name, 0),
+                "rps": len(values) / elapsed if elapsed else 0.0,
+                "p50_ms": percentile(values, 50) * 1000,
+                "p95_ms": percentile(values, 95) * 1000,
+                "p99_ms": percentile(values, 99) * 1000,
+            })
+        return rows
+
+
+def print_table(title: str, rows: List[Dict[str, float]]) -> None:
+    print(f"\n== {title}")
+    print(f"{'endpoint':<16}{'pedidos':>9}{'erros':>7}{'req/s':>10}{'p50 ms':>9}{'p95 ms':>9}{'p99 ms':>9}")
+    for r in rows:
+        print(
+            f"{r['name']:<16}{r['count']:>9}{r['errors']:>7}{r['rps']:>10.1f}"
+            f"{r['p50_ms']:>9.2f}{r['p95_ms']:>9.2f}{r['p99_ms']:>9.2f}"
+        )
@@ -0,0 +1,113 @@
+"""
+Simulação do limite de concorrência adaptativo (app/resilience.py) com um relógio simulado.
+
+1. Jitter sem carga: chamadas seguidas (uma de cada vez) com RTT de ~2 ms, jitter e picos
+   ocasionais de 10x. O limite não pode descer.
+2. Serviço saturado: depois de um aquecimento com pouca carga, o cliente ocupa todo o limite e o
+   serviço só atende --capacity chamadas em simultâneo (as restantes esperam, e o RTT cresce com a
+   fila). O limite tem de ficar perto de LIMIT_RTT_TOLERANCE x --capacity (mais 25% do dente de serra).
+3. Falhas seguidas: o limite desce, no máximo uma vez por LIMIT_DECREASE_INTERVAL_S.
+
+Termina com código 1 se algum dos cenários falhar.
+
+Uso (a partir de backend/):
+    python -m bench.limiter
+    python -m bench.limiter --capacity 4
+"""
+import argparse
+import random
+import sys
+
+from app.resilience import LIMIT_DECREASE_INTERVAL_S, LIMIT_INITIAL, LIMIT_RTT_TOLERANCE, ConcurrencyLimiter
+
+
+class _Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self) -> float:
+        return self.now
+
+
+def _jitter(rnd: random.Random, base: float) -> float:
+    rtt = base * rnd.lognormvariate(0, 0.3)
+    return rtt * 10 if rnd.random() < 0.02 else rtt
+
+
+def idle_jitter(rnd: random.Random, calls: int) -> float:
+    clock = _Clock()
+    limiter = ConcurrencyLimiter("bench.idle", enabled=True, clock=clock)
+    for _ in range(calls):
+        rtt = _jitter(rnd, 0.002)
+        clock.now += rtt + rnd.uniform(0, 0.05)
+        limiter.in_flight = 1
+        limiter.release(rtt)
+    return limiter.limit
+
+
+def saturated(rnd: random.Random, capacity: int) -> float:
+    clock = _Clock()
+    limiter = ConcurrencyLimiter("bench.saturated", enabled=True, clock=clock)
+    # Aquecimento com pouca carga (o RTT de referência é medido sem fila), depois uma janela saturada.
+    while clock.now < limiter.RTT_WINDOW_S / 2:
+        rtt = _jitter(rnd, 0.002)
+        clock.now += rtt
+        limiter.in_flight = 1
+        limiter.release(rtt)
+    while clock.now < limiter.RTT_WINDOW_S * 1.5:
+        in_flight = max(1, int(limiter.limit))
+        queueing = max(1.0, in_flight / capacity)
+        # Cada chamada em curso termina dentro de um RTT.
+        for _ in range(in_flight):
+            rtt = _jitter(rnd, 0.002) * queueing
+            clock.now += 0.002 * queueing / in_flight
+            limiter.in_flight = in_flight
+            limiter.release(rtt)
+    return limiter.limit
+
+
+def failures(seconds: float) -> tuple:
+    clock = _Clock()
+    limiter = ConcurrencyLimiter("bench.failures", enabled=True, clock=clock)
+    decreases, last = 0, limiter.limit
+    while clock.now < seconds:
+        clock.now += 0.001
+        limiter.in_flight = 1
+        limiter.release(dropped=True)
+        if limiter.limit < last:
+            decreases, last = decreases + 1, limiter.limit
+    return limiter.limit, decreases
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--calls", type=int, default=5000, help="chamadas no cenário sem carga")
+    ap.add_argument("--capacity", type=int, default=8, help="chamadas em simultâneo que o serviço atende")
+    ap.add_argument("--seconds", type=float, default=30.0, help="duração simulada do cenário com falhas")
+    ap.add_argument("--seed", type=int, default=1)
+    args = ap.parse_args()
+    rnd = random.Random(args.seed)
+
+    ok = True
+    limit = idle_jitter(rnd, args.calls)
+    passed = limit >= LIMIT_INITIAL
+    ok &= passed
+    print(f"jitter sem carga: limite {LIMIT_INITIAL:g} -> {limit:.1f} ({'ok' if passed else 'FALHOU: desceu'})")
+
+    limit = saturated(rnd, args.capacity)
+    passed = limit <= LIMIT_RTT_TOLERANCE * args.capacity * 1.25
+    ok &= passed
+    print(f"serviço saturado (capacidade {args.capacity}): limite {LIMIT_INITIAL:g} -> {limit:.1f}"
+          f" ({'ok' if passed else 'FALHOU: não desceu'})")
+
+    limit, decreases = failures(args.seconds)
+    allowed = int(args.seconds / LIMIT_DECREASE_INTERVAL_S) + 1
+    passed = 0 < decreases <= allowed
+    ok &= passed
+    print(f"falhas seguidas: limite {LIMIT_INITIAL:g} -> {limit:.1f} em {decreases} reduções"
+          f" (máximo {allowed}; {'ok' if passed else 'FALHOU'})")
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
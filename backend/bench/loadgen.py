@@ -0,0 +1,94 @@
+"""
+Gerador de carga para o backend REST: cada utilizador virtual repete o fluxo
+registo -> candidatos -> voto -> resultados, contra servidores AR/AV locais (servers.standin).
+
+Reporta débito e latências p50/p95/p99 por endpoint e por transporte.
+
+Uso (a partir de backend/):
+    python -m bench.loadgen --transports grpc,grpcurl --users 50 --duration 20
+    python -m bench.loadgen --url http://127.0.0.1:8000 --users 20   # backend já em execução
+"""
+import argparse
+import asyncio
+import itertools
+import json
+import random
+import time
+
+from .harness import HttpClient, LatencyStats, gateway, print_table, standin
+
+_cc = itertools.count(100_000_000)
+
+
+async def _timed(stats: LatencyStats, name: str, client: HttpClient, method: str, path: str, body=None):
+    t0 = time.perf_counter()
+    try:
+        status, _, payload = await client.request(method, path, body)
+    except (OSError, asyncio.IncompleteReadError):
+        stats.record(name, time.perf_counter() - t0, ok=False)
+        return None
+    stats.record(name, time.perf_counter() - t0, ok=status < 400)
+    if status >= 400 or not payload:
+        return None
+    return json.loads(payload)
+
+
+async def user_flow(base_url: str, stats: LatencyStats, stop_at: float, rnd: random.Random) -> None:
+    client = HttpClient(base_url)
+    try:
+        while time.monotonic() < stop_at:
+            reg = await _timed(stats, "POST /register", client, "POST", "/register",
+                               {"citizen_card_number": str(next(_cc))})
+            cands = await _timed(stats, "GET /candidates", client, "GET", "/candidates")
+            if reg and reg.get("is_eligible") and cands and cands.get("candidates"):
+                choice = rnd.choice(cands["candidates"])
+                await _timed(stats, "POST /vote", client, "POST", "/vote",
+                             {"voting_credential": reg["voting_credential"], "candidate_id": choice["id"]})
+            await _timed(stats, "GET /results", client, "GET", "/results")
+    finally:
+        await client.close()
+
+
+async def run_load(base_url: str, users: int, duration: float, seed: int = 1):
+    stats = LatencyStats()
+    rnd = random.Random(seed)
+    t0 = time.monotonic()
+    stop_at = t0 + duration
+    await asyncio.gather(*(user_flow(base_url, stats, stop_at, random.Random(rnd.random())) for _ in range(users)))
+    return stats, time.monotonic() - t0
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--url", help="usar um backend já em execução (ignora --transports)")
+    ap.add_argument("--transports", default="grpc,grpcurl")
+    ap.add_argument("--users", type=int, default=20, help="utilizadores virtuais em simultâneo")
+    ap.add_argument("--duration", type=float, default=10.0, help="segundos por transporte")
+    ap.add_argument("--latency-ms", type=float, default=5.0, help="latência do stand-in")
+    ap.add_argument("--jitter-ms", type=float, default=2.0)
+    ap.add_argument("--error-rate", type=float, default=0.0)
+    args = ap.parse_args()
+
+    if args.url:
+        stats, elapsed = asyncio.run(run_load(args.url, args.users, args.duration))
+        print_table(f"{args.url} ({args.users} utilizadores, {elapsed:.1f}s)", stats.summary(elapsed))
+        return
+
+    with standin(args.latency_ms, args.jitter_ms, args.error_rate) as target:
+        for transport in args.transports.split(","):
+            transport = transport.strip()
+            try:
+                with gateway(target, transport) as url:
+                    stats, elapsed = asyncio.run(run_load(url, args.users, args.duration))
+            except TimeoutError as e:
+                print(f"\n== transporte {transport}: backend não arrancou ({e})")
+                continue
+            print_table(
+                f"transporte {transport} ({args.users} utilizadores, {elapsed:.1f}s, "
+                f"stand-in {args.latency_ms}±{args.jitter_ms} ms)",
+                stats.summary(elapsed),
+            )
+
+
+if __name__ == "__main__":
+    main()
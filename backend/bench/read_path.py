@@ -0,0 +1,92 @@
+"""
+Débito de /candidates e /results com uma lista grande de candidatos, antes e depois das respostas
+pré-calculadas por snapshot (PRECOMPUTED_RESPONSES).
+
+  antes  -> PRECOMPUTED_RESPONSES=0, sem gzip: o JSON é codificado em cada pedido
+  depois -> PRECOMPUTED_RESPONSES=1: os bytes (e a variante gzip) são calculados uma vez por snapshot
+
+O resultado principal é pedidos por segundo de CPU do backend (um worker uvicorn = um core),
+medido em /proc, para não depender do CPU gasto pelo próprio gerador de carga.
+
+Uso (a partir de backend/):
+    python -m bench.read_path --candidates 10000 --connections 16 --duration 10
+"""
+import argparse
+import asyncio
+import time
+
+from .harness import HttpClient, cpu_seconds, gateway_process, standin
+
+_CASES = [
+    ("GET /candidates", "/candidates", {}),
+    ("GET /candidates gzip", "/candidates", {"Accept-Encoding": "gzip"}),
+    ("GET /results", "/results", {}),
+    ("GET /results gzip", "/results", {"Accept-Encoding": "gzip"}),
+]
+
+_MODES = [
+    ("antes", {"PRECOMPUTED_RESPONSES": "0", "RESPONSE_GZIP_MIN_BYTES": "0"}),
+    ("depois", {"PRECOMPUTED_RESPONSES": "1"}),
+]
+
+
+async def _load(url: str, path: str, headers: dict, connections: int, duration: float):
+    stop = time.monotonic() + duration
+    counts = {"ok": 0, "errors": 0, "bytes": 0}
+
+    async def worker():
+        client = HttpClient(url)
+        try:
+            while time.monotonic() < stop:
+                status, _, body = await client.request("GET", path, headers=headers)
+                counts["ok" if status == 200 else "errors"] += 1
+                counts["bytes"] += len(body)
+        finally:
+            await client.close()
+
+    await asyncio.gather(*(worker() for _ in range(connections)))
+    return counts
+
+
+def run(candidates: int, connections: int, warmup: float, duration: float) -> None:
+    env = {"CANDIDATES_TTL_S": "3600", "RESULTS_REFRESH_S": "1", "LIMITER_ENABLED": "0"}
+    rows = {}
+    with standin(candidates=candidates) as target:
+        for mode, mode_env in _MODES:
+            with gateway_process(target, env={**env, **mode_env}) as (url, proc):
+                for name, path, headers in _CASES:
+                    asyncio.run(_load(url, path, headers, connections, warmup))
+                    cpu0, t0 = cpu_seconds(proc.pid), time.monotonic()
+                    counts = asyncio.run(_load(url, path, headers, connections, duration))
+                    cpu, elapsed = cpu_seconds(proc.pid) - cpu0, time.monotonic() - t0
+                    rows[(name, mode)] = {
+                        "rps": counts["ok"] / elapsed,
+                        "per_cpu": counts["ok"] / max(cpu, 1e-9),
+                        "kib": counts["bytes"] / max(counts["ok"], 1) / 1024,
+                        "errors": counts["errors"],
+                    }
+
+    print(f"\n== {candidates} candidatos, {connections} ligações, {duration:g}s por caso")
+    print(f"{'endpoint':<22}{'modo':<8}{'req/s':>9}{'req/s CPU':>11}{'KiB/resp':>10}{'erros':>7}{'ganho':>8}")
+    for name, _, _ in _CASES:
+        base = rows[(name, "antes")]["per_cpu"]
+        for mode, _ in _MODES:
+            r = rows[(name, mode)]
+            print(
+                f"{name:<22}{mode:<8}{r['rps']:>9.0f}{r['per_cpu']:>11.0f}{r['kib']:>10.1f}{r['errors']:>7}"
+                f"{r['per_cpu'] / base:>7.1f}x"
+            )
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--candidates", type=int, default=10000)
+    ap.add_argument("--connections", type=int, default=16)
+    ap.add_argument("--warmup", type=float, default=1.0)
+    ap.add_argument("--duration", type=float, default=10.0, help="segundos por caso")
+    args = ap.parse_args()
+    run(args.candidates, args.connections, args.warmup, args.duration)
+
+
+if __name__ == "__main__":
+    main()
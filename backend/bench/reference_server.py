@@ -0,0 +1,146 @@
+"""
+Débito do servidor AR/AV de referência (servers.reference) com 1..N processos.
+
+Cada processo cliente abre vários canais gRPC (ligações TCP distintas, repartidas pelo kernel entre
+os processos do servidor) e mantém --concurrency votos em curso; as credenciais são assinadas
+localmente com a mesma chave HMAC do servidor. Em paralelo, um leitor por cliente chama GetResults
+em ciclo e verifica que o total nunca diminui.
+
+No fim de cada corrida, o total de GetResults tem de ser igual ao número de votos aceites.
+
+Uso (a partir de backend/):
+    python -m bench.reference_server --procs 1,2,4 --clients 4 --duration 10
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import time
+
+from .harness import percentile, reference
+
+_VOTE = "/voting.VotingService/Vote"
+_RESULTS = "/voting.VotingService/GetResults"
+
+
+async def _client(target: str, key: bytes, candidates: int, channels: int, concurrency: int,
+                  warmup: float, duration: float):
+    import grpc.aio
+
+    from app import voting_pb2
+    from servers.reference import CredentialSigner
+
+    signer = CredentialSigner(key)
+    opts = [("grpc.use_local_subchannel_pool", 1)]
+    chans = [grpc.aio.insecure_channel(target, options=opts) for _ in range(channels)]
+    votes = [
+        c.unary_unary(_VOTE, request_serializer=voting_pb2.VoteRequest.SerializeToString,
+                      response_deserializer=voting_pb2.VoteResponse.FromString)
+        for c in chans
+    ]
+    results = chans[0].unary_unary(_RESULTS, request_serializer=voting_pb2.GetResultsRequest.SerializeToString,
+                                   response_deserializer=voting_pb2.GetResultsResponse.FromString)
+
+    start = time.monotonic() + warmup
+    stop = start + duration
+    latencies, stats = [], {"ok": 0, "rejected": 0, "errors": 0, "reads": 0, "regressions": 0}
+
+    async def voter(i: int):
+        rpc = votes[i % len(votes)]
+        n = i
+        while time.monotonic() < stop:
+            req = voting_pb2.VoteRequest(voting_credential=signer.issue(), candidate_id=1 + n % candidates)
+            n += 1
+            t0 = time.perf_counter()
+            try:
+                resp = await rpc(req, timeout=10)
+            except grpc.aio.AioRpcError:
+                stats["errors"] += 1
+                continue
+            # Os votos do aquecimento contam para a verificação final, não para o débito.
+            if time.monotonic() >= start:
+                latencies.append(time.perf_counter() - t0)
+            stats["ok" if resp.success else "rejected"] += 1
+
+    async def reader():
+        last = 0
+        while time.monotonic() < stop:
+            resp = await results(voting_pb2.GetResultsRequest(), timeout=10)
+            total = sum(r.votes for r in resp.results)
+            stats["regressions"] += total < last
+            last = total
+            if time.monotonic() >= start:
+                stats["reads"] += 1
+
+    await asyncio.gather(reader(), *(voter(i) for i in range(concurrency)))
+    for c in chans:
+        await c.close()
+    return latencies, stats
+
+
+def _client_proc(args) -> tuple:
+    return asyncio.run(_client(*args))
+
+
+async def _total(target: str) -> int:
+    import grpc.aio
+
+    from app import voting_pb2, voting_pb2_grpc
+
+    async with grpc.aio.insecure_channel(target) as channel:
+        resp = await voting_pb2_grpc.VotingServiceStub(channel).GetResults(voting_pb2.GetResultsRequest())
+    return sum(r.votes for r in resp.results)
+
+
+def run(procs: int, clients: int, channels: int, concurrency: int, candidates: int, warmup: float,
+        duration: float) -> dict:
+    key = os.urandom(32)
+    with reference(procs, candidates, env={"REFERENCE_HMAC_KEY": key.hex()}) as target:
+        ctx = multiprocessing.get_context("spawn")
+        with ctx.Pool(clients) as pool:
+            out = pool.map(
+                _client_proc,
+                [(target, key, candidates, channels, concurrency, warmup, duration)] * clients,
+            )
+        counted = asyncio.run(_total(target))
+
+    latencies = sorted(x for lat, _ in out for x in lat)
+    totals = {k: sum(s[k] for _, s in out) for k in out[0][1]}
+    return {
+        "procs": procs,
+        "votes_s": len(latencies) / duration,
+        "reads_s": totals["reads"] / duration,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "errors": totals["errors"] + totals["rejected"],
+        "consistent": counted == totals["ok"] and totals["regressions"] == 0,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    cores = os.cpu_count() or 1
+    default_procs = ",".join([str(n) for n in (1, 2, 4, 8, 16, 32) if n < cores] + [str(cores)])
+    ap.add_argument("--procs", default=default_procs, help="processos do servidor a testar")
+    ap.add_argument("--clients", type=int, default=cores, help="processos clientes")
+    ap.add_argument("--channels", type=int, default=4, help="canais gRPC por cliente")
+    ap.add_argument("--concurrency", type=int, default=64, help="votos em curso por cliente")
+    ap.add_argument("--candidates", type=int, default=5)
+    ap.add_argument("--warmup", type=float, default=1.0)
+    ap.add_argument("--duration", type=float, default=10.0, help="segundos por configuração")
+    args = ap.parse_args()
+
+    print(f"\n== servers.reference ({args.clients} clientes x {args.concurrency} votos em curso, {cores} cores)")
+    print(f"{'procs':>6}{'votos/s':>11}{'speedup':>9}{'p50 ms':>9}{'p99 ms':>9}{'results/s':>11}{'erros':>7}  consistente")
+    base = None
+    for procs in (int(p) for p in args.procs.split(",")):
+        r = run(procs, args.clients, args.channels, args.concurrency, args.candidates, args.warmup, args.duration)
+        base = base or r["votes_s"]
+        print(
+            f"{r['procs']:>6}{r['votes_s']:>11.0f}{r['votes_s'] / base:>9.2f}{r['p50_ms']:>9.2f}"
+            f"{r['p99_ms']:>9.2f}{r['reads_s']:>11.0f}{r['errors']:>7}  {'sim' if r['consistent'] else 'NÃO'}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,250 @@
+"""
+Reprodução de uma captura de tráfego (CAPTURE_PATH, ver app/capture.py) com a escala de tempo alterada.
+
+Lê um ou mais ficheiros de captura (ex.: um por worker, juntos por instante de início), arranca um
+stand-in AR/AV e o gateway (ou usa --url) e envia cada pedido no seu instante original dividido por
+--speed (1 = tempo real, 100 = cem vezes mais depressa). É uma carga em ciclo aberto: o pedido
+seguinte não espera pelo anterior, e a latência conta a partir do instante previsto, pelo que
+inclui a espera por uma ligação livre quando o gateway não acompanha o ritmo.
+
+Os pedidos são reconstruídos a partir dos metadados, sem os dados pessoais originais:
+- /register: número de cartão sintético derivado do sujeito (o mesmo sujeito dá o mesmo cartão);
+- /vote: credencial sintética derivada do sujeito, pelo que as repetições voltam a dar 409;
+- /votes/batch: lote com o mesmo número de votos, com credenciais novas;
+- /results?since=: a versão pedida passa a ser a última vista nesta reprodução (X-Results-Version);
+  If-None-Match usa o último ETag visto para o mesmo caminho;
+- /results/stream: a ligação fica aberta durante a duração original dividida por --speed (no máximo
+  --stream-hold-max s); a latência reportada é o tempo até aos cabeçalhos.
+/vote/{ticket}, /admin/profile, pedidos OPTIONS/HEAD e rotas desconhecidas não são reproduzidos.
+
+Reporta por rota os percentis da captura e da reprodução e os estados diferentes dos originais.
+A latência original é medida no servidor (middleware) e a da reprodução no cliente (inclui o loopback).
+
+Uso (a partir de backend/):
+    CAPTURE_PATH=/tmp/capture.bin uvicorn app.main:app ...      # gravar
+    python -m bench.replay /tmp/capture.bin --speed 10 --latency-ms 5
+"""
+import argparse
+import asyncio
+import heapq
+import itertools
+import time
+from urllib.parse import parse_qsl, urlencode
+
+from app.capture import FLAG_GZIP, FLAG_IF_NONE_MATCH, FLAG_LAST_EVENT_ID, FLAG_PROTOBUF, METHODS, ROUTES, read_records
+
+from .harness import HttpClient, gateway, percentile, standin
+
+_SKIPPED_ROUTES = frozenset({"", "/vote/{ticket}", "/admin/profile"})
+
+
+def load(paths: list) -> list:
+    """
+    Registos de todos os ficheiros, ordenados pelo instante de início.
+    """
+    return list(heapq.merge(*(sorted(read_records(p)) for p in paths)))
+
+
+class Replayer:
+    def __init__(self, url: str, speed: float, max_connections: int, stream_hold_max: float):
+        self.url = url
+        self.speed = speed
+        self.stream_hold_max = stream_hold_max
+        self._idle: list = []
+        self._slots = asyncio.Semaphore(max_connections)
+        self._version = 0
+        self._etags: dict = {}
+        self.latencies: dict = {}
+        self.original: dict = {}
+        self.mismatches: dict = {}
+        self.errors: dict = {}
+        self.skipped = 0
+        self.lag: list = []
+        self._streams: list = []
+        self._batch_ids = itertools.count()
+
+    def _request(self, record) -> tuple:
+        """
+        (método, caminho, corpo, cabeçalhos) para reproduzir o registo.
+        """
+        _, _, _, method, route_index, _, _, subject, candidate_id, items, flags, _, query = record
+        route = ROUTES[route_index]
+        params = parse_qsl(query.decode("latin-1"), keep_blank_values=True)
+        if route == "/results" and any(k == "since" for k, _ in params):
+            params = [(k, str(self._version) if k == "since" else v) for k, v in params]
+        path = route + ("?" + urlencode(params) if params else "")
+
+        headers = {}
+        if flags & FLAG_PROTOBUF:
+            headers["Accept"] = "application/x-protobuf"
+        if flags & FLAG_GZIP:
+            headers["Accept-Encoding"] = "gzip"
+        if flags & FLAG_IF_NONE_MATCH and path in self._etags:
+            headers["If-None-Match"] = self._etags[path]
+        if flags & FLAG_LAST_EVENT_ID and self._version:
+            headers["Last-Event-ID"] = str(self._version)
+
+        body = None
+        if route == "/register":
+            body = {"citizen_card_number": str(100000000 + subject % 900000000)} if subject else {}
+        elif route == "/vote":
+            body = {"voting_credential": f"RPL-{subject:016x}", "candidate_id": candidate_id} if subject else {}
+        elif route == "/votes/batch":
+            body = [{"voting_credential": f"RPL-B{next(self._batch_ids)}", "candidate_id": 1} for _ in range(items)]
+        return METHODS[method], path, body, headers
+
+    async def _send(self, method: str, path: str, body, headers: dict):
+        await self._slots.acquire()
+        try:
+            while True:
+                reused = bool(self._idle)
+                http = self._idle.pop() if reused else HttpClient(self.url)
+                try:
+                    status, resp_headers, _ = await http.request(method, path, body, headers)
+                    break
+                except (ConnectionError, asyncio.IncompleteReadError):
+                    # Ligação parada mais do que o keep-alive do servidor: tenta numa ligação nova.
+                    await http.close()
+                    if not reused:
+                        raise
+                except BaseException:
+                    await http.close()
+                    raise
+            self._idle.append(http)
+        finally:
+            self._slots.release()
+        return status, resp_headers
+
+    async def _stream(self, path: str, headers: dict, hold: float) -> int:
+        """
+        Abre /results/stream numa ligação própria e devolve o estado depois de ler os cabeçalhos;
+        a ligação é fechada 'hold' segundos depois.
+        """
+        http = HttpClient(self.url)
+        try:
+            await http._connect()
+            head = [f"GET {path} HTTP/1.1", f"Host: {http.host}", "Accept: text/event-stream"]
+            head += [f"{k}: {v}" for k, v in headers.items()]
+            http._writer.write(("\r\n".join(head) + "\r\n\r\n").encode())
+            status_line = await http._reader.readline()
+            if not status_line:
+                raise ConnectionError("ligação fechada pelo servidor")
+            while (await http._reader.readline()) not in (b"\r\n", b"\n", b""):
+                pass
+        except BaseException:
+            await http.close()
+            raise
+        self._streams.append(asyncio.create_task(self._hold(http, hold)))
+        return int(status_line.split()[1])
+
+    @staticmethod
+    async def _hold(http: HttpClient, seconds: float) -> None:
+        try:
+            await asyncio.sleep(seconds)
+        finally:
+            await http.close()
+
+    async def _replay_one(self, record, due: float) -> None:
+        route = ROUTES[record[4]]
+        name = f"{METHODS[record[3]]} {route}"
+        method, path, body, headers = self._request(record)
+        self.lag.append(max(0.0, time.perf_counter() - due))
+        self.original.setdefault(name, []).append(record[1] / 1e6)
+        try:
+            if route == "/results/stream":
+                status = await self._stream(path, headers, min(record[1] / 1e6 / self.speed, self.stream_hold_max))
+            else:
+                status, resp_headers = await self._send(method, path, body, headers)
+                if "x-results-version" in resp_headers:
+                    self._version = max(self._version, int(resp_headers["x-results-version"]))
+                if "etag" in resp_headers:
+                    self._etags[path] = resp_headers["etag"]
+        except (OSError, asyncio.IncompleteReadError, ValueError):
+            self.errors[name] = self.errors.get(name, 0) + 1
+            return
+        self.latencies.setdefault(name, []).append(time.perf_counter() - due)
+        if status != record[2]:
+            self.mismatches[name] = self.mismatches.get(name, 0) + 1
+
+    async def run(self, records: list) -> float:
+        tasks = []
+        ts0 = records[0][0]
+        t0 = time.perf_counter()
+        for record in records:
+            if record[3] >= 2 or ROUTES[record[4]] in _SKIPPED_ROUTES:
+                self.skipped += 1
+                continue
+            due = t0 + (record[0] - ts0) / 1e6 / self.speed
+            delay = due - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.create_task(self._replay_one(record, due)))
+        await asyncio.gather(*tasks)
+        elapsed = time.perf_counter() - t0
+        await asyncio.gather(*self._streams)
+        for http in self._idle:
+            await http.close()
+        return elapsed
+
+
+def _row(values: list) -> str:
+    if not values:
+        return f"{'-':>8}{'-':>8}{'-':>8}"
+    values = sorted(values)
+    return "".join(f"{percentile(values, p) * 1000:>8.2f}" for p in (50, 95, 99))
+
+
+def report(replayer: Replayer, records: list, elapsed: float, speed: float) -> None:
+    span = (records[-1][0] - records[0][0]) / 1e6
+    replayed = sum(len(v) for v in replayer.latencies.values())
+    print(f"\n== {len(records)} pedidos capturados em {span:.1f}s, reproduzidos a {speed:g}x em {elapsed:.1f}s"
+          f" ({replayed / elapsed if elapsed else 0:.0f} req/s); {replayer.skipped} não reproduzidos")
+    print(f"{'':<24}{'':>7}{'captura (ms)':^24}{'reprodução (ms)':^24}")
+    print(f"{'rota':<24}{'pedidos':>7}{'p50':>8}{'p95':>8}{'p99':>8}{'p50':>8}{'p95':>8}{'p99':>8}"
+          f"{'estado≠':>9}{'erros':>7}")
+    for name in sorted(replayer.original):
+        print(f"{name:<24}{len(replayer.original[name]):>7}{_row(replayer.original[name])}"
+              f"{_row(replayer.latencies.get(name, []))}{replayer.mismatches.get(name, 0):>9}"
+              f"{replayer.errors.get(name, 0):>7}")
+    lag = sorted(replayer.lag)
+    print(f"atraso do escalonador: p50 {percentile(lag, 50) * 1000:.2f} ms, p99 {percentile(lag, 99) * 1000:.2f} ms")
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("captures", nargs="+", help="ficheiros de captura (CAPTURE_PATH)")
+    ap.add_argument("--speed", type=float, default=1.0, help="fator de aceleração (1 a 100)")
+    ap.add_argument("--url", help="usar um backend já em execução em vez do stand-in e do gateway locais")
+    ap.add_argument("--latency-ms", type=float, default=5.0, help="latência do stand-in")
+    ap.add_argument("--jitter-ms", type=float, default=2.0)
+    ap.add_argument("--candidates", type=int, default=0,
+                    help="candidatos do stand-in (por omissão, o maior candidate_id da captura, no mínimo 5)")
+    ap.add_argument("--max-connections", type=int, default=256, help="ligações keep-alive em simultâneo")
+    ap.add_argument("--stream-hold-max", type=float, default=30.0, help="segundos máximos por ligação SSE")
+    ap.add_argument("--max-requests", type=int, default=0, help="reproduzir só os primeiros N pedidos")
+    args = ap.parse_args()
+    if not 1 <= args.speed <= 100:
+        ap.error("--speed tem de estar entre 1 e 100")
+
+    records = load(args.captures)
+    if args.max_requests:
+        records = records[:args.max_requests]
+    if not records:
+        ap.error("captura vazia")
+
+    def replay(url: str) -> None:
+        replayer = Replayer(url, args.speed, args.max_connections, args.stream_hold_max)
+        elapsed = asyncio.run(replayer.run(records))
+        report(replayer, records, elapsed, args.speed)
+
+    if args.url:
+        replay(args.url)
+        return
+    candidates = args.candidates or max(5, max(r[8] for r in records))
+    with standin(args.latency_ms, args.jitter_ms, candidates=candidates) as target:
+        with gateway(target, env={"LIMITER_ENABLED": "0"}) as url:
+            replay(url)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+"""
+Boletins com muitos candidatos: resposta completa contra páginas, top-k e pesquisa por prefixo.
+
+1. Ranking (no processo): custo de ordenar os resultados de raiz (rank) e de atualizar o
+   ranking anterior (rerank) quando mudam k candidatos entre dois snapshots.
+2. HTTP: arranca um stand-in com --candidates candidatos e um gateway, aquece as caches e mede
+   latência (mediana) e bytes de GET /results e /candidates completos, de uma página ordenada por
+   votos, do top-k e da pesquisa por prefixo do nome.
+
+Uso (a partir de backend/):
+    python -m bench.results_pages --candidates 100000 --requests 20
+"""
+import argparse
+import asyncio
+import random
+import statistics
+import time
+
+from app.ranking import rank, rerank
+
+from .harness import HttpClient, gateway, standin
+
+
+def _ranking_costs(n: int, changes: list, runs: int) -> list:
+    counts = [random.randrange(1000) for _ in range(n)]
+    t0 = time.perf_counter()
+    ranking = rank(counts)
+    rows = [("rank (de raiz)", (time.perf_counter() - t0) * 1000)]
+    for k in changes:
+        times = []
+        for _ in range(runs):
+            new = counts.copy()
+            for i in random.sample(range(n), min(k, n)):
+                new[i] += 1
+            t0 = time.perf_counter()
+            rerank(ranking, counts, new)
+            times.append((time.perf_counter() - t0) * 1000)
+        rows.append((f"rerank, {k} alterados", statistics.median(times)))
+    return rows
+
+
+async def _measure(url: str, paths: list, requests: int) -> list:
+    http = HttpClient(url)
+    rows = []
+    try:
+        for path in paths:
+            await http.request("GET", path)
+            times, size = [], 0
+            for _ in range(requests):
+                t0 = time.perf_counter()
+                status, _, body = await http.request("GET", path)
+                times.append((time.perf_counter() - t0) * 1000)
+                size = len(body) if status == 200 else -status
+            rows.append((path, statistics.median(times), size))
+    finally:
+        await http.close()
+    return rows
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--candidates", type=int, default=100000)
+    ap.add_argument("--requests", type=int, default=20, help="pedidos por rota (mediana)")
+    ap.add_argument("--runs", type=int, default=5, help="repetições por medição do rerank")
+    ap.add_argument("--changes", default="1,100,10000", help="candidatos alterados por snapshot, separados por vírgulas")
+    args = ap.parse_args()
+
+    print(f"\n== ranking de {args.candidates} candidatos (no processo)")
+    print(f"{'operação':<28}{'ms':>9}")
+    for name, ms in _ranking_costs(args.candidates, [int(k) for k in args.changes.split(",")], args.runs):
+        print(f"{name:<28}{ms:>9.2f}")
+
+    paths = [
+        "/results", "/results?top=10", "/results?order=votes&limit=50",
+        f"/results?order=votes&offset={args.candidates // 2}&limit=50", "/results?offset=0&limit=50",
+        "/candidates", "/candidates?limit=50", "/candidates?q=Candidato%20123&limit=50",
+    ]
+    with standin(candidates=args.candidates) as target:
+        with gateway(target, env={"LIMITER_ENABLED": "0"}) as url:
+            rows = asyncio.run(_measure(url, paths, args.requests))
+
+    print(f"\n== HTTP, {args.candidates} candidatos (mediana de {args.requests} pedidos)")
+    print(f"{'rota':<48}{'ms':>9}{'bytes':>12}")
+    for path, ms, size in rows:
+        print(f"{path:<48}{ms:>9.2f}{size:>12}")
+
+
+if __name__ == "__main__":
+    main()
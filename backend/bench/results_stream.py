@@ -0,0 +1,212 @@
+"""
+Resultados em tempo real para muitos browsers: /results/stream (SSE, um stream WatchResults ao AV)
+contra cada browser a consultar /results?since=<versão> a cada --poll-s segundos.
+
+Os votos são enviados diretamente ao stand-in (gRPC) a --rate votos/s. Para cada voto mede-se o
+tempo até cada cliente ver um total que o inclui (latência voto -> browser). Reporta também as
+chamadas ao AV, o CPU do gateway e, em SSE, quantas versões os clientes lentos (que não leem
+durante a votação) saltaram por coalescência em vez de acumularem uma fila. A coalescência só
+começa quando os buffers TCP da ligação estão cheios (vários MB em loopback): para a ver, usar
+muitos candidatos e votos, ex.: --candidates 50000 --rate 1500 --clients 10.
+
+Uso (a partir de backend/):
+    python -m bench.results_stream --clients 200 --slow 5 --rate 200 --duration 10
+"""
+import argparse
+import asyncio
+import bisect
+import json
+import os
+import random
+import socket
+import time
+import urllib.request
+
+from .harness import HttpClient, cpu_seconds, gateway_process, percentile, standin
+
+
+class _Client:
+    def __init__(self):
+        # (instante, total de votos visto) por ordem de chegada
+        self.seen = []
+        self.votes = {}
+        self.events = 0
+
+    def apply(self, data: dict) -> None:
+        if not data.get("delta"):
+            self.votes = {}
+        for row in data.get("results", []):
+            self.votes[row["id"]] = row["votes"]
+        self.events += 1
+        self.seen.append((time.perf_counter(), sum(self.votes.values())))
+
+
+async def _sse_client(host: str, port: int, client: _Client, paused: asyncio.Event | None = None) -> None:
+    sock = socket.socket()
+    if paused is not None:
+        # Cliente lento: buffer de receção pequeno, para o gateway sentir a ligação saturada.
+        sock.setsockopt(socket.SOL_SOCKET, socket.SO_RCVBUF, 4096)
+    sock.setblocking(False)
+    loop = asyncio.get_running_loop()
+    await loop.sock_connect(sock, (host, port))
+    await loop.sock_sendall(
+        sock, f"GET /results/stream HTTP/1.1\r\nHost: {host}\r\nAccept: text/event-stream\r\n\r\n".encode())
+    if paused is not None:
+        # Nada é lido do socket (nem pelo StreamReader) até ao fim da votação.
+        await paused.wait()
+    reader, writer = await asyncio.open_connection(sock=sock, limit=2 ** 24)
+    try:
+        while (await reader.readline()) not in (b"\r\n", b""):
+            pass
+        while True:
+            line = await reader.readline()
+            if not line:
+                return
+            # Resposta "chunked": cada evento vai num chunk, pelo que as linhas data: chegam inteiras.
+            if line.startswith(b"data: "):
+                client.apply(json.loads(line[6:]))
+    finally:
+        writer.close()
+
+
+async def _poll_client(url: str, client: _Client, interval: float) -> None:
+    http = HttpClient(url)
+    version = None
+    await asyncio.sleep(random.uniform(0, interval))
+    try:
+        while True:
+            path = "/results" if version is None else f"/results?since={version}"
+            status, _, body = await http.request("GET", path)
+            if status == 200:
+                data = json.loads(body)
+                version = data["version"]
+                client.apply(data)
+            await asyncio.sleep(interval)
+    finally:
+        await http.close()
+
+
+async def _vote(target: str, rate: float, duration: float, candidates: int) -> list:
+    """
+    Envia votos ao stand-in a 'rate' votos/s; devolve o instante de envio de cada voto aceite, por ordem.
+    """
+    import grpc
+
+    from app import voting_pb2, voting_pb2_grpc
+
+    sent = []
+    async with grpc.aio.insecure_channel(target) as channel:
+        stub = voting_pb2_grpc.VotingServiceStub(channel)
+
+        async def one(i: int, t: float) -> None:
+            reply = await stub.Vote(voting_pb2.VoteRequest(
+                voting_credential=f"BENCH-{os.getpid()}-{i}", candidate_id=random.randint(1, candidates)))
+            if reply.success:
+                sent.append(t)
+
+        tasks = []
+        t0 = time.perf_counter()
+        for i in range(int(rate * duration)):
+            delay = t0 + i / rate - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            tasks.append(asyncio.ensure_future(one(i, time.perf_counter())))
+        await asyncio.gather(*tasks)
+    return sorted(sent)
+
+
+def _latencies(clients, sent: list, base: int) -> list:
+    """
+    Para cada cliente e cada voto k, tempo até o cliente ver um total >= base + k.
+    """
+    out = []
+    for c in clients:
+        totals = [total for _, total in c.seen]
+        for k, t in enumerate(sent, 1):
+            i = bisect.bisect_left(totals, base + k)
+            if i < len(totals):
+                out.append(max(0.0, c.seen[i][0] - t))
+    return sorted(out)
+
+
+def _metric(url: str, name: str) -> float:
+    text = urllib.request.urlopen(url + "/metrics", timeout=5).read().decode()
+    return sum(float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(name))
+
+
+async def _scenario(mode: str, url: str, target: str, args) -> dict:
+    host, port = url.split("://", 1)[1].split(":")
+    fast = [_Client() for _ in range(args.clients)]
+    slow = [_Client() for _ in range(args.slow if mode == "sse" else 0)]
+    paused = asyncio.Event()
+    if mode == "sse":
+        tasks = [asyncio.ensure_future(_sse_client(host, int(port), c)) for c in fast]
+        tasks += [asyncio.ensure_future(_sse_client(host, int(port), c, paused)) for c in slow]
+    else:
+        tasks = [asyncio.ensure_future(_poll_client(url, c, args.poll_s)) for c in fast]
+
+    # Espera que todos os clientes tenham o estado inicial.
+    while any(not c.seen for c in fast):
+        await asyncio.sleep(0.05)
+    paused_at = time.perf_counter()
+    base = max(total for c in fast for _, total in c.seen)
+    calls0 = _metric(url, 'upstream_request_duration_seconds_count{method="GetResults"}')
+    coalesced0 = _metric(url, "results_stream_coalesced_total")
+
+    sent = await _vote(target, args.rate, args.duration, args.candidates)
+    await asyncio.sleep(args.poll_s + 1.0)
+    cpu = cpu_seconds(args.gateway_pid)
+    paused.set()
+    await asyncio.sleep(1.0)
+    for t in tasks:
+        t.cancel()
+    await asyncio.gather(*tasks, return_exceptions=True)
+
+    lat = _latencies(fast, sent, base)
+    return {
+        "votes": len(sent),
+        "events": sum(c.events for c in fast) / len(fast),
+        "slow_events": sum(c.events for c in slow) / len(slow) if slow else float("nan"),
+        "p50": percentile(lat, 50) * 1000,
+        "p99": percentile(lat, 99) * 1000,
+        "calls": _metric(url, 'upstream_request_duration_seconds_count{method="GetResults"}') - calls0,
+        "coalesced": _metric(url, "results_stream_coalesced_total") - coalesced0,
+        "cpu": cpu,
+        "elapsed": time.perf_counter() - paused_at,
+    }
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--clients", type=int, default=200)
+    ap.add_argument("--slow", type=int, default=5, help="clientes SSE que não leem durante a votação")
+    ap.add_argument("--rate", type=float, default=200.0, help="votos por segundo")
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--candidates", type=int, default=1000)
+    ap.add_argument("--poll-s", type=float, default=1.0, help="intervalo de consulta no modo polling")
+    ap.add_argument("--watch-interval-ms", type=float, default=100.0, help="intervalo mínimo do WatchResults")
+    args = ap.parse_args()
+
+    rows = {}
+    env = {"RESULTS_REFRESH_S": str(args.poll_s), "LIMITER_ENABLED": "0"}
+    for mode in ("polling", "sse"):
+        extra = ["--watch-interval-ms", str(args.watch_interval_ms)]
+        with standin(candidates=args.candidates, extra=extra) as target:
+            with gateway_process(target, env=env) as (url, proc):
+                args.gateway_pid = proc.pid
+                cpu0 = cpu_seconds(proc.pid)
+                rows[mode] = asyncio.run(_scenario(mode, url, target, args))
+                rows[mode]["cpu"] -= cpu0
+
+    print(f"\n== {args.clients} clientes, {args.candidates} candidatos, {args.rate:g} votos/s durante {args.duration:g}s")
+    print(f"{'modo':<9}{'votos':>7}{'eventos/cli':>12}{'lentos':>8}{'p50 ms':>9}{'p99 ms':>9}"
+          f"{'GetResults':>11}{'coalesc.':>10}{'CPU s':>8}")
+    for mode, r in rows.items():
+        print(
+            f"{mode:<9}{r['votes']:>7}{r['events']:>12.1f}{r['slow_events']:>8.1f}{r['p50']:>9.1f}{r['p99']:>9.1f}"
+            f"{r['calls']:>11.0f}{r['coalesced']:>10.0f}{r['cpu']:>8.2f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,116 @@
+"""
+Arranque a frio do gateway: tempo de import de app.main e tempo até ao primeiro pedido servido.
+
+1. Import: --imports processos novos por transporte fazem "import app.main"; reporta a mediana
+   e se o runtime grpc foi carregado (com GRPC_TRANSPORT=grpcurl não deve ser).
+2. Primeiro pedido: para STARTUP_WARMUP=0 e 1, arranca um gateway novo ligado ao stand-in, espera
+   que o balanceador o considere disponível (/health sem aquecimento, /ready com aquecimento) e
+   mede logo a seguir o primeiro GET /candidates, POST /vote e GET /results.
+
+Uso (a partir de backend/):
+    python -m bench.startup --runs 5 --latency-ms 5
+"""
+import argparse
+import asyncio
+import os
+import statistics
+import subprocess
+import sys
+import time
+import urllib.error
+import urllib.request
+
+from .harness import HttpClient, free_port, process, standin
+
+_IMPORT_SNIPPET = (
+    "import sys, time; t = time.perf_counter(); import app.main; "
+    "print((time.perf_counter() - t) * 1000, 'grpc' in sys.modules)"
+)
+
+
+def _import_time(transport: str, runs: int) -> tuple:
+    times, grpc_loaded = [], False
+    env = {**os.environ, "GRPC_TRANSPORT": transport}
+    for _ in range(runs):
+        out = subprocess.run([sys.executable, "-c", _IMPORT_SNIPPET], env=env, capture_output=True, text=True,
+                             check=True).stdout.split()
+        times.append(float(out[0]))
+        grpc_loaded = grpc_loaded or out[1] == "True"
+    return statistics.median(times), grpc_loaded
+
+
+def _wait_ok(url: str, timeout: float = 30.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with urllib.request.urlopen(url, timeout=1) as r:
+                if r.status == 200:
+                    return
+        except (OSError, urllib.error.HTTPError):
+            pass
+        time.sleep(0.005)
+    raise TimeoutError(f"{url} não respondeu 200 em {timeout:g}s")
+
+
+async def _first_requests(url: str, run: int) -> dict:
+    http = HttpClient(url)
+    out = {}
+    try:
+        for name, method, path, body in (
+            ("candidates", "GET", "/candidates", None),
+            ("vote", "POST", "/vote", {"voting_credential": f"COLD-{os.getpid()}-{run}", "candidate_id": 1}),
+            ("results", "GET", "/results", None),
+        ):
+            t0 = time.perf_counter()
+            status, _, _ = await http.request(method, path, body)
+            out[name] = (time.perf_counter() - t0) * 1000 if status == 200 else float("nan")
+    finally:
+        await http.close()
+    return out
+
+
+def _cold_start(target: str, warmup: bool, transport: str, run: int) -> dict:
+    port = free_port()
+    url = f"http://127.0.0.1:{port}"
+    env = {
+        "GRPC_TARGET": target, "GRPC_PLAINTEXT": "1", "GRPC_TRANSPORT": transport,
+        "STARTUP_WARMUP": "1" if warmup else "0", "LIMITER_ENABLED": "0",
+    }
+    args = [sys.executable, "-m", "uvicorn", "app.main:app", "--port", str(port), "--log-level", "warning"]
+    t0 = time.perf_counter()
+    with process(args, env):
+        _wait_ok(url + ("/ready" if warmup else "/health"))
+        row = {"available": (time.perf_counter() - t0) * 1000}
+        row.update(asyncio.run(_first_requests(url, run)))
+    return row
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--runs", type=int, default=5, help="arranques por cenário (mediana)")
+    ap.add_argument("--imports", type=int, default=5, help="processos por transporte na medição do import")
+    ap.add_argument("--latency-ms", type=float, default=5.0, help="latência injetada pelo stand-in por chamada")
+    ap.add_argument("--transport", default="grpc", choices=("grpc", "grpcurl"))
+    args = ap.parse_args()
+
+    print("\n== import app.main (mediana)")
+    print(f"{'transporte':<12}{'ms':>8}{'grpc carregado':>16}")
+    for transport in ("grpc", "grpcurl"):
+        ms, loaded = _import_time(transport, args.imports)
+        print(f"{transport:<12}{ms:>8.0f}{'sim' if loaded else 'não':>16}")
+
+    rows = {}
+    with standin(latency_ms=args.latency_ms) as target:
+        for warmup in (False, True):
+            runs = [_cold_start(target, warmup, args.transport, i) for i in range(args.runs)]
+            rows[warmup] = {k: statistics.median(r[k] for r in runs) for k in runs[0]}
+
+    print(f"\n== primeiro pedido após o arranque ({args.transport}, AV a {args.latency_ms:g} ms; mediana de {args.runs})")
+    print(f"{'aquecimento':<13}{'disponível ms':>14}{'/candidates':>13}{'/vote':>9}{'/results':>10}")
+    for warmup, r in rows.items():
+        print(f"{'sim' if warmup else 'não':<13}{r['available']:>14.0f}{r['candidates']:>13.1f}"
+              f"{r['vote']:>9.1f}{r['results']:>10.1f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Micro-lotes de votos (VOTE_BATCH_MAX / VOTE_BATCH_WINDOW_US) contra o stand-in: um Vote por
+pedido contra lotes BatchVote com várias janelas.
+
+Cada cenário arranca um stand-in e um gateway novos e envia POST /vote com credenciais únicas a
+partir de --concurrency ligações, durante --duration segundos. Reporta votos/s, latência p50/p99,
+tamanho médio dos lotes e CPU por voto no gateway e no stand-in. Com --latency-ms simula-se o
+tempo de rede até ao AV.
+
+Uso (a partir de backend/):
+    python -m bench.vote_batching --concurrency 64 --duration 5 --windows 0,250,500,1000
+"""
+import argparse
+import asyncio
+import os
+import time
+import urllib.request
+
+from .harness import HttpClient, cpu_seconds, gateway_process, percentile, standin_process
+
+
+async def _load(url: str, concurrency: int, duration: float, candidates: int) -> dict:
+    latencies = []
+    errors = 0
+    counter = iter(range(10 ** 9))
+
+    async def worker() -> None:
+        nonlocal errors
+        http = HttpClient(url)
+        try:
+            while time.perf_counter() < stop_at:
+                body = {"voting_credential": f"BATCH-{os.getpid()}-{next(counter)}",
+                        "candidate_id": 1 + len(latencies) % candidates}
+                t0 = time.perf_counter()
+                status, _, _ = await http.request("POST", "/vote", body)
+                if status == 200:
+                    latencies.append(time.perf_counter() - t0)
+                else:
+                    errors += 1
+        finally:
+            await http.close()
+
+    t0 = time.perf_counter()
+    stop_at = t0 + duration
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "votes": len(latencies),
+        "errors": errors,
+        "rate": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+    }
+
+
+def _metric(url: str, name: str) -> float:
+    text = urllib.request.urlopen(url + "/metrics", timeout=5).read().decode()
+    return sum(float(line.rsplit(" ", 1)[1]) for line in text.splitlines() if line.startswith(name))
+
+
+def _scenario(args, env: dict) -> dict:
+    with standin_process(latency_ms=args.latency_ms, candidates=args.candidates) as (target, server):
+        with gateway_process(target, env={"LIMITER_ENABLED": "0", **env}) as (url, gw):
+            gw0, sv0 = cpu_seconds(gw.pid), cpu_seconds(server.pid)
+            row = asyncio.run(_load(url, args.concurrency, args.duration, args.candidates))
+            gw_cpu, sv_cpu = cpu_seconds(gw.pid) - gw0, cpu_seconds(server.pid) - sv0
+            batches = _metric(url, "vote_batch_size_count")
+            row["batch"] = _metric(url, "vote_batch_size_sum") / batches if batches else 1.0
+    votes = max(row["votes"], 1)
+    row["gw_us"] = gw_cpu / votes * 1e6
+    row["sv_us"] = sv_cpu / votes * 1e6
+    return row
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--concurrency", type=int, default=64, help="pedidos /vote em simultâneo")
+    ap.add_argument("--duration", type=float, default=5.0)
+    ap.add_argument("--candidates", type=int, default=5)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="latência injetada pelo stand-in por chamada")
+    ap.add_argument("--batch-max", type=int, default=64, help="VOTE_BATCH_MAX nos cenários com lotes")
+    ap.add_argument("--windows", default="0,250,500,1000", help="valores de VOTE_BATCH_WINDOW_US, separados por vírgulas")
+    args = ap.parse_args()
+
+    scenarios = [("sem lotes", {"VOTE_BATCH_MAX": "0"})]
+    for w in args.windows.split(","):
+        scenarios.append((f"lote {w}µs", {"VOTE_BATCH_MAX": str(args.batch_max), "VOTE_BATCH_WINDOW_US": w.strip()}))
+
+    rows = [(name, _scenario(args, env)) for name, env in scenarios]
+
+    print(f"\n== {args.concurrency} pedidos em simultâneo, {args.duration:g}s, latência do AV {args.latency_ms:g} ms")
+    print(f"{'cenário':<14}{'votos/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'lote':>7}{'CPU gw µs/voto':>16}"
+          f"{'CPU AV µs/voto':>16}{'erros':>7}")
+    for name, r in rows:
+        print(
+            f"{name:<14}{r['rate']:>9.0f}{r['p50']:>9.2f}{r['p99']:>9.2f}{r['batch']:>7.1f}"
+            f"{r['gw_us']:>16.0f}{r['sv_us']:>16.0f}{r['errors']:>7}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,155 @@
+"""
+Modo multi-worker: carga de leitura no AV com N workers, cada um com as suas caches
+(uvicorn --workers N), contra o supervisor com snapshots em memória partilhada (python -m app.supervisor).
+
+Cada cenário arranca um stand-in com --candidates candidatos (que conta as chamadas recebidas por
+método) e o gateway, e faz GET /results?top=50 e /candidates?limit=50 a partir de
+--concurrency ligações durante --duration segundos. Reporta req/s, latência e chamadas
+GetResults/GetCandidates por segundo recebidas pelo stand-in.
+
+Uso (a partir de backend/):
+    python -m bench.workers --workers 1,2,4 --candidates 20000 --duration 10
+"""
+import argparse
+import asyncio
+import multiprocessing
+import os
+import sys
+import tempfile
+import time
+from concurrent import futures
+from contextlib import contextmanager
+
+from .harness import HttpClient, free_port, percentile, process, wait_http, wait_port
+
+# Métodos contados pelo stand-in (posição no array partilhado com o processo do benchmark).
+_COUNTED = ("GetResults", "GetCandidates")
+
+
+def _serve_counted(port: int, candidates: int, latency_ms: float, calls) -> None:
+    """
+    Processo do stand-in: o mesmo AR/AV de servers.standin, com um interceptor que conta as chamadas.
+    """
+    import grpc
+
+    from app import voter_pb2_grpc, voting_pb2_grpc
+    from servers.standin import FaultInjector, StandinRegistrationService, StandinVotingService
+
+    class CallCounter(grpc.ServerInterceptor):
+        def intercept_service(self, continuation, handler_call_details):
+            method = handler_call_details.method.rsplit("/", 1)[-1]
+            if method in _COUNTED:
+                with calls.get_lock():
+                    calls[_COUNTED.index(method)] += 1
+            return continuation(handler_call_details)
+
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=32), interceptors=[CallCounter()])
+    faults = FaultInjector(latency_ms)
+    voter_pb2_grpc.add_VoterRegistrationServiceServicer_to_server(StandinRegistrationService(faults), server)
+    voting_pb2_grpc.add_VotingServiceServicer_to_server(StandinVotingService(faults, candidates), server)
+    server.add_insecure_port(f"127.0.0.1:{port}")
+    server.start()
+    server.wait_for_termination()
+
+
+@contextmanager
+def _counted_standin(candidates: int, latency_ms: float):
+    """
+    Arranca o stand-in num processo à parte; devolve (target, array com as chamadas de _COUNTED).
+    """
+    context = multiprocessing.get_context("spawn")
+    calls = context.Array("q", len(_COUNTED))
+    port = free_port()
+    p = context.Process(target=_serve_counted, args=(port, candidates, latency_ms, calls), daemon=True)
+    p.start()
+    try:
+        wait_port(port)
+        yield f"127.0.0.1:{port}", calls
+    finally:
+        p.terminate()
+        p.join(5)
+
+
+async def _load(url: str, concurrency: int, duration: float) -> dict:
+    latencies = []
+    errors = 0
+    paths = ("/results?top=50", "/candidates?limit=50")
+
+    async def worker(i: int) -> None:
+        nonlocal errors
+        http = HttpClient(url)
+        try:
+            while time.perf_counter() < stop_at:
+                i += 1
+                t0 = time.perf_counter()
+                status, _, _ = await http.request("GET", paths[i % 2])
+                if status == 200:
+                    latencies.append(time.perf_counter() - t0)
+                else:
+                    errors += 1
+        finally:
+            await http.close()
+
+    t0 = time.perf_counter()
+    stop_at = t0 + duration
+    await asyncio.gather(*(worker(i) for i in range(concurrency)))
+    elapsed = time.perf_counter() - t0
+    latencies.sort()
+    return {
+        "rate": len(latencies) / elapsed,
+        "p50": percentile(latencies, 50) * 1000,
+        "p99": percentile(latencies, 99) * 1000,
+        "errors": errors,
+    }
+
+
+def _scenario(args, workers: int, shared: bool) -> dict:
+    with _counted_standin(args.candidates, args.latency_ms) as (target, calls):
+        port = free_port()
+        # RESULTS_WATCH=poll: o líder consulta GetResults como as caches de cada worker (comparação direta);
+        # CANDIDATES_TTL_S=1 para as leituras de candidatos também aparecerem numa medição curta.
+        env = {"GRPC_TARGET": target, "GRPC_PLAINTEXT": "1", "GRPC_TRANSPORT": "grpc", "LIMITER_ENABLED": "0",
+               "RESULTS_WATCH": "poll", "CANDIDATES_TTL_S": "1"}
+        if shared:
+            # O supervisor passa o registo de credenciais a mmap; o ficheiro fica fora da árvore.
+            env["CREDENTIAL_STORE_PATH"] = os.path.join(tempfile.gettempdir(), f"bench-workers-{port}.bin")
+            cmd = [sys.executable, "-m", "app.supervisor", "--workers", str(workers), "--port", str(port),
+                   "--log-level", "warning"]
+        else:
+            cmd = [sys.executable, "-m", "uvicorn", "app.main:app", "--workers", str(workers), "--port", str(port),
+                   "--log-level", "warning"]
+        url = f"http://127.0.0.1:{port}"
+        with process(cmd, env):
+            wait_http(url + "/health", timeout=60)
+            # Aquecimento: todos os workers com caches carregadas antes da medição.
+            asyncio.run(_load(url, args.concurrency, 2.0))
+            before = calls[:]
+            row = asyncio.run(_load(url, args.concurrency, args.duration))
+            row["results"], row["candidates"] = ((n - b) / args.duration for n, b in zip(calls[:], before))
+    return row
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("--workers", default="1,2,4", help="números de workers, separados por vírgulas")
+    ap.add_argument("--candidates", type=int, default=20000)
+    ap.add_argument("--concurrency", type=int, default=32)
+    ap.add_argument("--duration", type=float, default=10.0)
+    ap.add_argument("--latency-ms", type=float, default=0.0, help="latência injetada pelo stand-in por chamada")
+    args = ap.parse_args()
+
+    rows = []
+    for n in (int(w) for w in args.workers.split(",")):
+        for shared in (False, True):
+            rows.append((n, "partilhado" if shared else "por worker", _scenario(args, n, shared)))
+
+    print(f"\n== leituras com {args.candidates} candidatos, {args.concurrency} ligações, {args.duration:g}s")
+    print(f"{'workers':>8}  {'snapshots':<12}{'req/s':>9}{'p50 ms':>9}{'p99 ms':>9}{'GetResults/s':>14}"
+          f"{'GetCandidates/s':>17}{'erros':>7}")
+    for n, mode, r in rows:
+        print(f"{n:>8}  {mode:<12}{r['rate']:>9.0f}{r['p50']:>9.2f}{r['p99']:>9.2f}{r['results']:>14.2f}"
+              f"{r['candidates']:>17.2f}{r['errors']:>7}")
+
+
+if __name__ == "__main__":
+    main()
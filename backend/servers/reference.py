@@ -0,0 +1,356 @@
+"""
+Servidores AR/AV de referência, para correr junto ao gateway em vez do endpoint remoto.
+
+Ao contrário do stand-in (servers.standin), não simula latência nem erros: é uma implementação
+completa dos serviços, pensada para débito elevado.
+
+- Vários processos (--procs, por omissão um por core) escutam no mesmo porto (SO_REUSEPORT);
+  cada processo usa um servidor gRPC com um pool de threads.
+- Contagem de votos num ficheiro mapeado em memória com uma linha de contadores por processo
+  (shard): cada processo só escreve na sua linha, sem locks entre processos.
+- Cada linha tem um contador de sequência (seqlock): GetResults lê todas as linhas sem bloquear
+  os votos e repete a leitura de uma linha se ela mudou entretanto. Em cada linha, o total é
+  sempre igual à soma dos votos por candidato.
+- Credenciais usadas: tabela de digests partilhada (app.credentials.MmapCredentialStore),
+  com consulta e inserção em O(1).
+- Credenciais emitidas pelo AR com HMAC: o AV verifica-as sem estado partilhado com o AR.
+
+Uso (a partir de backend/):
+    python -m servers.reference --port 50051 --procs 4 --candidates 5
+    python -m servers.reference --port 50051 --state-dir ./av-state   # contagens persistentes
+
+O gateway liga-se com:
+    GRPC_TARGET=127.0.0.1:50051 GRPC_PLAINTEXT=1
+"""
+import argparse
+import base64
+import hashlib
+import hmac
+import mmap
+import multiprocessing
+import os
+import re
+import signal
+import struct
+import tempfile
+import threading
+import time
+from concurrent import futures
+from pathlib import Path
+from typing import List, Tuple
+
+import grpc
+
+from app import voter_pb2, voter_pb2_grpc, voting_pb2, voting_pb2_grpc
+from app.credentials import MmapCredentialStore
+
+# Número de cartão de cidadão aceite pelo AR de referência (só dígitos, como no frontend).
+_CARD_RE = re.compile(r"^[0-9]{6,12}$")
+# Intervalo de leitura das contagens nos streams WatchResults.
+WATCH_INTERVAL_S = float(os.getenv("REFERENCE_WATCH_INTERVAL_MS", "100")) / 1000.0
+
+
+class CredentialSigner:
+    """
+    Credenciais "CRED-<base32(nonce | HMAC(nonce))>": aleatórias (sem ligação ao cartão de cidadão)
+    mas verificáveis por qualquer processo que conheça a chave.
+    """
+
+    NONCE_SIZE = 10
+    TAG_SIZE = 10
+
+    def __init__(self, key: bytes):
+        self._key = key
+
+    def _tag(self, nonce: bytes) -> bytes:
+        return hmac.new(self._key, nonce, hashlib.sha256).digest()[: self.TAG_SIZE]
+
+    def issue(self) -> str:
+        nonce = os.urandom(self.NONCE_SIZE)
+        return "CRED-" + base64.b32encode(nonce + self._tag(nonce)).decode().rstrip("=")
+
+    def verify(self, credential: str) -> bool:
+        if not credential.startswith("CRED-") or len(credential) != 5 + 32:
+            return False
+        try:
+            raw = base64.b32decode(credential[5:])
+        except ValueError:
+            return False
+        nonce, tag = raw[: self.NONCE_SIZE], raw[self.NONCE_SIZE:]
+        return hmac.compare_digest(tag, self._tag(nonce))
+
+
+class ShardedTally:
+    """
+    Contadores de votos num ficheiro mapeado em memória, partilhado pelos processos do servidor.
+
+    Cabeçalho: magic (8 B) | shards (8 B) | candidatos (8 B) | reservado (8 B).
+    Uma linha por shard: seq | total | votos[candidato]..., em inteiros de 64 bits, alinhada a 64 B
+    (cada processo escreve numa linha de cache diferente).
+
+    Escrita (só o processo dono da linha, com um lock local): seq ímpar -> contadores -> seq par.
+    Leitura: copia a linha e repete se seq for ímpar ou tiver mudado durante a cópia.
+    """
+
+    MAGIC = b"VSTALLY1"
+    HEADER = struct.Struct("<8sQQQ")
+
+    def __init__(self, path: str, shards: int, candidates: int):
+        self.path = Path(path)
+        self.shards = shards
+        self.candidates = candidates
+        self._row = -(-(2 + candidates) // 8) * 8          # em inteiros de 64 bits (múltiplo de 64 B)
+        self._base = self.HEADER.size // 8
+        size = self.HEADER.size + shards * self._row * 8
+
+        with open(os.open(self.path, os.O_RDWR | os.O_CREAT | getattr(os, "O_BINARY", 0), 0o644), "r+b") as f:
+            f.seek(0, os.SEEK_END)
+            if f.tell() == 0:
+                f.truncate(size)
+                f.seek(0)
+                f.write(self.HEADER.pack(self.MAGIC, shards, candidates, 0))
+                f.flush()
+            self._mm = mmap.mmap(f.fileno(), 0)
+
+        magic, file_shards, file_candidates, _ = self.HEADER.unpack_from(self._mm, 0)
+        if magic != self.MAGIC or (file_shards, file_candidates) != (shards, candidates):
+            self._mm.close()
+            raise ValueError(
+                f"{self.path}: contagens de outra configuração "
+                f"({file_shards} shards, {file_candidates} candidatos); usar outro --state-dir"
+            )
+        self._v = memoryview(self._mm).cast("Q")
+        self._lock = threading.Lock()
+
+    def _offset(self, shard: int) -> int:
+        return self._base + shard * self._row
+
+    def add(self, shard: int, candidate: int) -> None:
+        """
+        Conta um voto no candidato de índice 'candidate' (0..candidates-1), na linha 'shard'.
+        """
+        v, o = self._v, self._offset(shard)
+        with self._lock:
+            v[o] += 1
+            v[o + 2 + candidate] += 1
+            v[o + 1] += 1
+            v[o] += 1
+
+    def _read_row(self, shard: int) -> List[int]:
+        v, o = self._v, self._offset(shard)
+        end = o + 2 + self.candidates
+        while True:
+            seq = v[o]
+            if not seq & 1:
+                row = v[o + 1:end].tolist()
+                if v[o] == seq:
+                    return row
+            # Escrita em curso (possivelmente noutra thread deste processo): ceder o GIL.
+            time.sleep(0)
+
+    def snapshot(self) -> Tuple[int, List[int]]:
+        """
+        (total, votos por candidato), somando linhas lidas de forma consistente.
+        """
+        total, votes = 0, [0] * self.candidates
+        for shard in range(self.shards):
+            row = self._read_row(shard)
+            total += row[0]
+            for i, n in enumerate(row[1:]):
+                votes[i] += n
+        return total, votes
+
+    def close(self) -> None:
+        self._v.release()
+        self._mm.close()
+
+
+class ReferenceRegistrationService(voter_pb2_grpc.VoterRegistrationServiceServicer):
+    """
+    AR: elegível qualquer número de cartão bem formado; emite uma credencial nova por pedido.
+    """
+
+    def __init__(self, signer: CredentialSigner):
+        self.signer = signer
+
+    def IssueVotingCredential(self, request, context):
+        if not _CARD_RE.match(request.citizen_card_number):
+            return voter_pb2.VoterResponse(is_eligible=False, voting_credential="")
+        return voter_pb2.VoterResponse(is_eligible=True, voting_credential=self.signer.issue())
+
+
+class ReferenceVotingService(voting_pb2_grpc.VotingServiceServicer):
+    """
+    AV: candidatos fixos, credenciais verificadas por HMAC e marcadas como usadas antes da contagem.
+    """
+
+    def __init__(self, names: List[str], signer: CredentialSigner, spent: MmapCredentialStore,
+                 tally: ShardedTally, shard: int):
+        self.names = names
+        self.signer = signer
+        self.spent = spent
+        self.tally = tally
+        self.shard = shard
+        # A lista de candidatos não muda: a resposta é construída uma vez.
+        self._candidates = voting_pb2.GetCandidatesResponse(
+            candidates=[voting_pb2.Candidate(id=i, name=n) for i, n in enumerate(names, 1)]
+        )
+
+    def GetCandidates(self, request, context):
+        return self._candidates
+
+    def Vote(self, request, context):
+        return self._vote(request)
+
+    def BatchVote(self, request_iterator, context):
+        return voting_pb2.BatchVoteResponse(results=[self._vote(request) for request in request_iterator])
+
+    def _vote(self, request) -> voting_pb2.VoteResponse:
+        index = request.candidate_id - 1
+        if not 0 <= index < len(self.names):
+            return voting_pb2.VoteResponse(success=False, message="Candidato inválido.")
+        if not self.signer.verify(request.voting_credential):
+            return voting_pb2.VoteResponse(success=False, message="Credencial inválida.")
+        # add() é atómico entre processos: só um pedido com a mesma credencial o vê devolver True.
+        if not self.spent.add(request.voting_credential):
+            return voting_pb2.VoteResponse(success=False, message="Credencial já utilizada.")
+        self.tally.add(self.shard, index)
+        return voting_pb2.VoteResponse(success=True, message="Voto registado com sucesso.")
+
+    def GetResults(self, request, context):
+        _, votes = self.tally.snapshot()
+        return self._results(votes)
+
+    def _results(self, votes: List[int]) -> voting_pb2.GetResultsResponse:
+        return voting_pb2.GetResultsResponse(
+            results=[voting_pb2.CandidateResult(id=i, name=n, votes=votes[i - 1]) for i, n in enumerate(self.names, 1)]
+        )
+
+    def WatchResults(self, request, context):
+        """
+        Estado atual e uma mensagem sempre que o total muda. Os votos chegam a qualquer um dos processos,
+        por isso o stream lê as contagens partilhadas a cada WATCH_INTERVAL_S (sem notificação entre processos).
+        """
+        sent = None
+        while context.is_active():
+            total, votes = self.tally.snapshot()
+            if total != sent:
+                sent = total
+                yield self._results(votes)
+            time.sleep(WATCH_INTERVAL_S)
+
+
+def build_server(host: str, port: int, names: List[str], key: bytes, state_dir: str, shard: int,
+                 shards: int, workers: int = 16, capacity: int = 1_000_000) -> grpc.Server:
+    signer = CredentialSigner(key)
+    spent = MmapCredentialStore(os.path.join(state_dir, "spent.bin"), capacity)
+    tally = ShardedTally(os.path.join(state_dir, "tally.bin"), shards, len(names))
+
+    server = grpc.server(
+        futures.ThreadPoolExecutor(max_workers=workers),
+        options=[("grpc.so_reuseport", 1)],
+    )
+    voter_pb2_grpc.add_VoterRegistrationServiceServicer_to_server(ReferenceRegistrationService(signer), server)
+    voting_pb2_grpc.add_VotingServiceServicer_to_server(
+        ReferenceVotingService(names, signer, spent, tally, shard), server
+    )
+    if not server.add_insecure_port(f"{host}:{port}"):
+        raise RuntimeError(f"Não foi possível escutar em {host}:{port}")
+    return server
+
+
+def _serve(host: str, port: int, names: List[str], key: bytes, state_dir: str, shard: int, shards: int,
+           workers: int, capacity: int) -> None:
+    server = build_server(host, port, names, key, state_dir, shard, shards, workers, capacity)
+    server.start()
+    signal.signal(signal.SIGTERM, lambda *_: server.stop(grace=1))
+    server.wait_for_termination()
+
+
+def _load_key(state_dir: str) -> bytes:
+    """
+    Chave HMAC: REFERENCE_HMAC_KEY (hex), ou guardada em <state-dir>/hmac.key para que as credenciais
+    emitidas continuem válidas após um reinício.
+    """
+    env = os.getenv("REFERENCE_HMAC_KEY", "")
+    if env:
+        return bytes.fromhex(env)
+    path = Path(state_dir) / "hmac.key"
+    if path.exists():
+        return path.read_bytes()
+    key = os.urandom(32)
+    fd = os.open(path, os.O_WRONLY | os.O_CREAT | os.O_EXCL | getattr(os, "O_BINARY", 0), 0o600)
+    with open(fd, "wb") as f:
+        f.write(key)
+    return key
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Servidores AR/AV de referência (multi-processo).")
+    ap.add_argument("--host", default=os.getenv("REFERENCE_HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("REFERENCE_PORT", "50051")))
+    ap.add_argument("--procs", type=int, default=int(os.getenv("REFERENCE_PROCS", str(os.cpu_count() or 1))),
+                    help="processos servidores (shards de contagem)")
+    ap.add_argument("--workers", type=int, default=int(os.getenv("REFERENCE_WORKERS", "16")),
+                    help="threads por processo")
+    ap.add_argument("--candidates", type=int, default=int(os.getenv("REFERENCE_CANDIDATES", "5")))
+    ap.add_argument("--capacity", type=int, default=int(os.getenv("REFERENCE_CAPACITY", "1000000")),
+                    help="número máximo de credenciais usadas")
+    ap.add_argument("--state-dir", default=os.getenv("REFERENCE_STATE_DIR", ""),
+                    help="diretório para contagens, credenciais usadas e chave (por omissão: temporário)")
+    args = ap.parse_args()
+
+    if os.name == "nt" and args.procs > 1:
+        # Sem SO_REUSEPORT no Windows: um único processo.
+        args.procs = 1
+
+    tmp = None
+    state_dir = args.state_dir
+    if not state_dir:
+        tmp = tempfile.TemporaryDirectory(prefix="vs-reference-")
+        state_dir = tmp.name
+    os.makedirs(state_dir, exist_ok=True)
+
+    names = [f"Candidato {i}" for i in range(1, args.candidates + 1)]
+    key = _load_key(state_dir)
+    # Criar os ficheiros antes de arrancar os processos (evita corridas na criação).
+    MmapCredentialStore(os.path.join(state_dir, "spent.bin"), args.capacity).close()
+    ShardedTally(os.path.join(state_dir, "tally.bin"), args.procs, len(names)).close()
+
+    # spawn: o runtime gRPC não suporta fork depois de inicializado.
+    ctx = multiprocessing.get_context("spawn")
+    procs = [
+        ctx.Process(
+            target=_serve,
+            args=(args.host, args.port, names, key, state_dir, shard, args.procs, args.workers, args.capacity),
+            daemon=True,
+        )
+        for shard in range(args.procs)
+    ]
+    for p in procs:
+        p.start()
+    print(
+        f"AR/AV de referência em {args.host}:{args.port} "
+        f"({args.procs} processos x {args.workers} threads, estado em {state_dir})",
+        flush=True,
+    )
+
+    stopping = threading.Event()
+    signal.signal(signal.SIGTERM, lambda *_: stopping.set())
+    try:
+        while not stopping.is_set() and all(p.is_alive() for p in procs):
+            stopping.wait(0.5)
+    except KeyboardInterrupt:
+        pass
+    finally:
+        for p in procs:
+            if p.is_alive():
+                p.terminate()
+        for p in procs:
+            p.join(timeout=5)
+        if tmp is not None:
+            tmp.cleanup()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,181 @@
+"""
+Servidores AR/AV locais (stand-in) para testes de carga sem rede.
+
+Implementam VoterRegistrationServiceServicer e VotingServiceServicer (app/*_pb2_grpc.py) em memória,
+com injeção de latência, jitter e erros. Ambos os serviços ficam no mesmo porto, como no endpoint remoto.
+
+Uso (a partir de backend/):
+    python -m servers.standin --port 50051 --latency-ms 20 --jitter-ms 10 --error-rate 0.01
+
+O gateway liga-se com:
+    GRPC_TARGET=127.0.0.1:50051 GRPC_PLAINTEXT=1
+"""
+import argparse
+import hashlib
+import os
+import random
+import threading
+import time
+from concurrent import futures
+
+import grpc
+
+from app import voter_pb2, voter_pb2_grpc, voting_pb2, voting_pb2_grpc
+
+
+class FaultInjector:
+    """
+    Latência base + jitter uniforme e uma taxa de erros (UNAVAILABLE) aplicados a cada chamada.
+    """
+
+    def __init__(self, latency_ms: float = 0.0, jitter_ms: float = 0.0, error_rate: float = 0.0, seed=None):
+        self.latency_ms = latency_ms
+        self.jitter_ms = jitter_ms
+        self.error_rate = error_rate
+        self._rnd = random.Random(seed)
+
+    def apply(self, context) -> None:
+        delay = self.latency_ms + (self._rnd.uniform(-self.jitter_ms, self.jitter_ms) if self.jitter_ms else 0.0)
+        if delay > 0:
+            time.sleep(delay / 1000.0)
+        if self.error_rate and self._rnd.random() < self.error_rate:
+            context.abort(grpc.StatusCode.UNAVAILABLE, "Erro injetado (stand-in)")
+
+
+class StandinRegistrationService(voter_pb2_grpc.VoterRegistrationServiceServicer):
+    """
+    AR simulado: elegibilidade pseudo-aleatória mas estável por número de cartão.
+    """
+
+    def __init__(self, faults: FaultInjector, eligible_ratio: float = 0.8):
+        self.faults = faults
+        self.eligible_ratio = eligible_ratio
+
+    def IssueVotingCredential(self, request, context):
+        self.faults.apply(context)
+        h = hashlib.sha256(request.citizen_card_number.encode()).digest()
+        if int.from_bytes(h[:2], "big") / 65536 >= self.eligible_ratio:
+            return voter_pb2.VoterResponse(is_eligible=False, voting_credential="")
+        # Credencial única por emissão (como o AR real, não associada ao número do cartão).
+        return voter_pb2.VoterResponse(is_eligible=True, voting_credential=f"CRED-{os.urandom(8).hex().upper()}")
+
+
+class StandinVotingService(voting_pb2_grpc.VotingServiceServicer):
+    """
+    AV simulado: lista fixa de candidatos, contagem em memória, uma utilização por credencial.
+    """
+
+    def __init__(self, faults: FaultInjector, candidates: int = 5, watch_interval_ms: float = 100.0):
+        self.faults = faults
+        self.watch_interval_s = watch_interval_ms / 1000.0
+        self._names = {i: f"Candidato {i}" for i in range(1, candidates + 1)}
+        self._votes = {i: 0 for i in self._names}
+        self._used = set()
+        self._lock = threading.Lock()
+        # Notifica os streams WatchResults a cada voto aceite.
+        self._changed = threading.Condition(self._lock)
+        self._version = 0
+
+    def GetCandidates(self, request, context):
+        self.faults.apply(context)
+        return voting_pb2.GetCandidatesResponse(
+            candidates=[voting_pb2.Candidate(id=i, name=n) for i, n in self._names.items()]
+        )
+
+    def _vote(self, request) -> voting_pb2.VoteResponse:
+        # Chamado com self._lock adquirido.
+        if request.candidate_id not in self._votes:
+            return voting_pb2.VoteResponse(success=False, message="Candidato inválido.")
+        if request.voting_credential in self._used:
+            return voting_pb2.VoteResponse(success=False, message="Credencial já utilizada.")
+        self._used.add(request.voting_credential)
+        self._votes[request.candidate_id] += 1
+        return voting_pb2.VoteResponse(success=True, message="Voto registado com sucesso.")
+
+    def Vote(self, request, context):
+        self.faults.apply(context)
+        with self._lock:
+            reply = self._vote(request)
+            if reply.success:
+                self._version += 1
+                self._changed.notify_all()
+        return reply
+
+    def BatchVote(self, request_iterator, context):
+        """
+        Lote de votos numa só chamada: latência/erros injetados uma vez por lote, como numa chamada Vote.
+        """
+        self.faults.apply(context)
+        requests = list(request_iterator)
+        with self._lock:
+            results = [self._vote(request) for request in requests]
+            if any(r.success for r in results):
+                self._version += 1
+                self._changed.notify_all()
+        return voting_pb2.BatchVoteResponse(results=results)
+
+    def GetResults(self, request, context):
+        self.faults.apply(context)
+        with self._lock:
+            votes = dict(self._votes)
+        return self._results(votes)
+
+    def _results(self, votes) -> voting_pb2.GetResultsResponse:
+        return voting_pb2.GetResultsResponse(
+            results=[voting_pb2.CandidateResult(id=i, name=n, votes=votes[i]) for i, n in self._names.items()]
+        )
+
+    def WatchResults(self, request, context):
+        """
+        Estado atual e depois uma mensagem por mudança, no máximo uma a cada watch_interval_s
+        (os votos que chegam nesse intervalo seguem juntos na mensagem seguinte).
+        """
+        self.faults.apply(context)
+        sent = None
+        while context.is_active():
+            with self._changed:
+                if self._version == sent:
+                    self._changed.wait(timeout=1.0)
+                version, votes = self._version, dict(self._votes)
+            if version != sent:
+                sent = version
+                yield self._results(votes)
+                time.sleep(self.watch_interval_s)
+
+
+def build_server(port: int, faults: FaultInjector, candidates: int = 5, workers: int = 32,
+                 host: str = "127.0.0.1", watch_interval_ms: float = 100.0) -> grpc.Server:
+    server = grpc.server(futures.ThreadPoolExecutor(max_workers=workers))
+    voter_pb2_grpc.add_VoterRegistrationServiceServicer_to_server(StandinRegistrationService(faults), server)
+    voting_pb2_grpc.add_VotingServiceServicer_to_server(
+        StandinVotingService(faults, candidates, watch_interval_ms), server)
+    server.add_insecure_port(f"{host}:{port}")
+    return server
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description="Servidores AR/AV locais para testes de carga.")
+    ap.add_argument("--host", default=os.getenv("STANDIN_HOST", "127.0.0.1"))
+    ap.add_argument("--port", type=int, default=int(os.getenv("STANDIN_PORT", "50051")))
+    ap.add_argument("--latency-ms", type=float, default=float(os.getenv("STANDIN_LATENCY_MS", "0")))
+    ap.add_argument("--jitter-ms", type=float, default=float(os.getenv("STANDIN_JITTER_MS", "0")))
+    ap.add_argument("--error-rate", type=float, default=float(os.getenv("STANDIN_ERROR_RATE", "0")))
+    ap.add_argument("--candidates", type=int, default=int(os.getenv("STANDIN_CANDIDATES", "5")))
+    ap.add_argument("--workers", type=int, default=int(os.getenv("STANDIN_WORKERS", "32")))
+    ap.add_argument("--watch-interval-ms", type=float, default=float(os.getenv("STANDIN_WATCH_INTERVAL_MS", "100")),
+                    help="intervalo mínimo entre mensagens de WatchResults")
+    args = ap.parse_args()
+
+    faults = FaultInjector(args.latency_ms, args.jitter_ms, args.error_rate)
+    server = build_server(args.port, faults, args.candidates, args.workers, args.host, args.watch_interval_ms)
+    server.start()
+    print(
+        f"stand-in AR/AV em {args.host}:{args.port} "
+        f"(latência {args.latency_ms}±{args.jitter_ms} ms, erros {args.error_rate:.1%})",
+        flush=True,
+    )
+    server.wait_for_termination()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,189 @@
+"""
+Recontagem offline a partir do registo de auditoria (app/audit.py) e comparação com /results.
+
+O ficheiro é mapeado em memória e processado por blocos: contagem por candidato dos votos aceites,
+registos por estado e credenciais (digests) aceites mais de uma vez. Com NumPy (requirements.txt)
+a contagem é vetorizada; sem NumPy usa um ciclo Python, correto mas lento.
+
+Uso (a partir de backend/):
+    python -m tools.recount vote_audit.bin
+    python -m tools.recount vote_audit.bin --results http://127.0.0.1:8000/results
+    python -m tools.recount vote_audit.bin --results results.json
+
+Código de saída: 0 se a recontagem coincide com /results (quando indicado) e não há duplicados; 1 caso contrário.
+Nota: /results conta todos os votos do AV, incluindo os submetidos por outras instâncias do backend.
+"""
+import argparse
+import collections
+import json
+import mmap
+import sys
+import time
+import urllib.request
+from typing import Dict
+
+from app.audit import ACCEPTED, ERROR, HEADER, MAGIC, RECORD, REJECTED, VERSION
+
+# Registos por bloco (32 bytes cada): limita a memória temporária a algumas centenas de MB.
+CHUNK_RECORDS = 1 << 22
+
+
+def _records(path: str) -> int:
+    with open(path, "rb") as f:
+        magic, version, record_size = HEADER.unpack(f.read(HEADER.size))
+        size = f.seek(0, 2)
+    if magic != MAGIC or version != VERSION or record_size != RECORD.size:
+        raise SystemExit(f"{path} não é um registo de auditoria compatível")
+    return (size - HEADER.size) // RECORD.size
+
+
+def recount_numpy(path: str, n: int) -> dict:
+    import numpy as np
+
+    dtype = np.dtype([
+        ("ts", "<u8"), ("d0", "<u8"), ("d1", "<u8"), ("candidate", "<i4"), ("status", "u1"), ("_", "V3"),
+    ])
+    records = np.memmap(path, dtype=dtype, mode="r", offset=HEADER.size, shape=(n,))
+    tally = np.zeros(0, dtype=np.int64)
+    # Ids negativos (o AV recusa-os; só por precaução): contados à parte, bincount não os aceita.
+    negative = collections.Counter()
+    statuses = np.zeros(3, dtype=np.int64)
+    keys = np.empty(n, dtype=np.uint64)
+    k = 0
+
+    for start in range(0, n, CHUNK_RECORDS):
+        chunk = records[start:start + CHUNK_RECORDS]
+        status = chunk["status"]
+        statuses += np.bincount(status, minlength=3)[:3]
+        accepted = status == ACCEPTED
+        candidates = chunk["candidate"][accepted]
+        if len(candidates) and candidates.min() < 0:
+            ids, n_ids = np.unique(candidates[candidates < 0], return_counts=True)
+            negative.update(dict(zip(ids.tolist(), n_ids.tolist())))
+            candidates = candidates[candidates >= 0]
+        counts = np.bincount(candidates)
+        if len(counts) > len(tally):
+            tally = np.pad(tally, (0, len(counts) - len(tally)))
+        tally[:len(counts)] += counts
+        head = chunk["d0"][accepted]
+        keys[k:k + len(head)] = head
+        k += len(head)
+
+    # Duplicados: primeiro pelos 8 bytes iniciais do digest (ordenação de uint64) e, só para os
+    # candidatos encontrados, confirmação com o digest completo numa segunda passagem.
+    keys = keys[:k]
+    keys.sort()
+    suspects = np.unique(keys[1:][keys[1:] == keys[:-1]])
+    del keys
+    digests = collections.Counter()
+    if len(suspects):
+        # Filtro por bitmap dos bits baixos (um acesso por registo); searchsorted só nos que passam.
+        mask = np.uint64((1 << 24) - 1)
+        bitmap = np.zeros(1 << 24, dtype=bool)
+        bitmap[suspects & mask] = True
+        for start in range(0, n, CHUNK_RECORDS):
+            chunk = records[start:start + CHUNK_RECORDS]
+            chunk = chunk[bitmap[chunk["d0"] & mask] & (chunk["status"] == ACCEPTED)]
+            d0 = chunk["d0"]
+            chunk = chunk[suspects[np.minimum(np.searchsorted(suspects, d0), len(suspects) - 1)] == d0]
+            digests.update(zip(chunk["d0"].tolist(), chunk["d1"].tolist()))
+
+    return {
+        "tally": {**negative, **{cid: int(v) for cid, v in enumerate(tally.tolist()) if v}},
+        "statuses": statuses.tolist(),
+        "duplicates": {k: c for k, c in digests.items() if c > 1},
+    }
+
+
+def recount_python(path: str, n: int) -> dict:
+    tally: Dict[int, int] = collections.Counter()
+    statuses = [0, 0, 0]
+    seen, duplicates = set(), collections.Counter()
+    with open(path, "rb") as f, mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ) as mm:
+        for start in range(0, n, CHUNK_RECORDS):
+            lo = HEADER.size + start * RECORD.size
+            hi = HEADER.size + min(n, start + CHUNK_RECORDS) * RECORD.size
+            for _, digest, candidate, status in RECORD.iter_unpack(mm[lo:hi]):
+                statuses[status] += 1
+                if status != ACCEPTED:
+                    continue
+                tally[candidate] += 1
+                if digest in seen:
+                    duplicates[digest] += 1
+                else:
+                    seen.add(digest)
+    return {
+        "tally": dict(tally),
+        "statuses": statuses,
+        "duplicates": {k: c + 1 for k, c in duplicates.items()},
+    }
+
+
+def load_results(source: str) -> Dict[int, dict]:
+    """
+    Resultados de /results (URL) ou de um ficheiro com o mesmo JSON; chave: id do candidato.
+    """
+    if source.startswith(("http://", "https://")):
+        req = urllib.request.Request(source, headers={"Accept": "application/json"})
+        with urllib.request.urlopen(req, timeout=30) as resp:
+            data = json.load(resp)
+    else:
+        with open(source, encoding="utf-8") as f:
+            data = json.load(f)
+    rows = data.get("results", data) if isinstance(data, dict) else data
+    return {int(r["id"]): r for r in rows}
+
+
+def main() -> None:
+    ap = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    ap.add_argument("log", help="ficheiro do registo de auditoria (AUDIT_LOG_PATH)")
+    ap.add_argument("--results", help="URL de /results ou ficheiro JSON com a resposta")
+    ap.add_argument("--python", action="store_true", help="não usar NumPy")
+    args = ap.parse_args()
+
+    n = _records(args.log)
+    recount = recount_python
+    if not args.python:
+        try:
+            import numpy  # noqa: F401
+
+            recount = recount_numpy
+        except ImportError:
+            print("NumPy não instalado: a usar a recontagem em Python (lenta).", file=sys.stderr)
+
+    t0 = time.perf_counter()
+    out = recount(args.log, n)
+    elapsed = time.perf_counter() - t0
+    statuses = out["statuses"]
+    print(
+        f"{n} registos em {elapsed:.2f}s ({n / max(elapsed, 1e-9) / 1e6:.1f} M/s): "
+        f"{statuses[ACCEPTED]} aceites, {statuses[REJECTED]} recusados, {statuses[ERROR]} sem resposta"
+    )
+
+    ok = True
+    duplicates = out["duplicates"]
+    if duplicates:
+        ok = False
+        extra = sum(c - 1 for c in duplicates.values())
+        print(f"ATENÇÃO: {len(duplicates)} credenciais aceites mais de uma vez ({extra} votos a mais)")
+
+    tally = out["tally"]
+    if args.results:
+        results = load_results(args.results)
+        print(f"\n{'id':>6}  {'nome':<24}{'registo':>10}{'/results':>10}{'dif':>8}")
+        for cid in sorted(set(tally) | set(results)):
+            row = results.get(cid, {})
+            mine, theirs = tally.get(cid, 0), int(row.get("votes", 0))
+            ok &= mine == theirs
+            print(f"{cid:>6}  {str(row.get('name', '?'))[:24]:<24}{mine:>10}{theirs:>10}{theirs - mine:>+8}")
+        print("\nRecontagem coincide com /results." if ok else "\nRecontagem DIFERE de /results.")
+    else:
+        print(f"\n{'id':>6}{'votos':>10}")
+        for cid in sorted(tally):
+            print(f"{cid:>6}{tally[cid]:>10}")
+
+    sys.exit(0 if ok else 1)
+
+
+if __name__ == "__main__":
+    main()
@@ -16,6 +16,7 @@ const els = {
   btnClear: document.getElementById("btn-clear"),
   regMsg: document.getElementById("reg-msg"),
 
+  candidateQ: document.getElementById("candidate-q"),
   candidate: document.getElementById("candidate"),
   cred: document.getElementById("cred"),
   btnLoadCandidates: document.getElementById("btn-load-candidates"),
@@ -26,14 +27,32 @@ const els = {
   resMsg: document.getElementById("res-msg"),
   resTable: document.getElementById("res-table"),
   resTbody: document.getElementById("res-tbody"),
+  resPager: document.getElementById("res-pager"),
+  btnResPrev: document.getElementById("btn-res-prev"),
+  btnResNext: document.getElementById("btn-res-next"),
 };
 
+// Linhas por página (candidatos e resultados): com milhares de candidatos só se pede a página visível
+const PAGE_SIZE = 50;
+
 const state = {
   credential: null,
   hasVoted: false,
   candidates: [],
+  // Página de resultados visível (id -> linha, por votos), versão do snapshot (?since=) e total
+  results: new Map(),
+  resultsVersion: null,
+  resultsOffset: 0,
+  resultsTotal: 0,
+  registering: false,
 };
 
+// Pesquisa de candidatos pendente (espera que o utilizador pare de escrever)
+let candidateSearchTimer = null;
+
+// Ligação SSE a /results/stream (resultados em tempo real), aberta depois da primeira consulta
+let resultsStream = null;
+
 function setMsg(el, kind, text) {
   el.classList.remove("ok", "warn", "err");
   if (kind) el.classList.add(kind);
@@ -71,6 +90,7 @@ function syncUI() {
 
   els.cred.value = state.credential || "";
   els.btnLoadCandidates.disabled = !state.credential;
+  els.candidateQ.disabled = !state.credential;
   els.candidate.disabled = !state.credential;
 
   const canVote =
@@ -89,7 +109,9 @@ function syncUI() {
 
 async function apiGet(path) {
   const url = `${BACKEND_URL}${path}`;
-  const res = await fetch(url, { method: "GET" });
+  // "no-cache": o browser revalida a cópia guardada (If-None-Match) e recebe 304 se nada mudou.
+  const res = await fetch(url, { method: "GET", cache: "no-cache" });
+  if (res.status === 304) return null; // nada mudou desde a versão pedida
   const data = await res.json().catch(() => ({}));
   if (!res.ok) {
     const msg = data.detail ? String(data.detail) : `Erro HTTP ${res.status}`;
@@ -124,6 +146,8 @@ async function doRegister() {
     return;
   }
 
+  if (state.registering) return; // pedido já em curso (duplo clique)
+  state.registering = true;
   setMsg(els.regMsg, null, "A emitir credencial...");
   try {
     const r = await apiPost("/register", { citizen_card_number: cc });
@@ -143,6 +167,7 @@ async function doRegister() {
   } catch (e) {
     setMsg(els.regMsg, "err", `Falha no registo: ${e.message}`);
   } finally {
+    state.registering = false;
     syncUI();
   }
 }
@@ -150,8 +175,11 @@ async function doRegister() {
 async function loadCandidates() {
   setMsg(els.voteMsg, null, "A carregar candidatos...");
   try {
-    const r = await apiGet("/candidates");
+    // Só a primeira página (ou os nomes começados pelo texto pesquisado)
+    const q = els.candidateQ.value.trim();
+    const r = await apiGet(`/candidates?limit=${PAGE_SIZE}${q ? `&q=${encodeURIComponent(q)}` : ""}`);
     const list = Array.isArray(r.candidates) ? r.candidates : [];
+    const total = r.total ?? list.length;
     state.candidates = list;
 
     // preencher select
@@ -168,7 +196,8 @@ async function loadCandidates() {
       els.candidate.appendChild(opt);
     }
 
-    setMsg(els.voteMsg, "ok", `Candidatos carregados: ${list.length}.`);
+    const more = total > list.length ? ` de ${total}; pesquise pelo nome para ver outros` : "";
+    setMsg(els.voteMsg, "ok", `Candidatos carregados: ${list.length}${more}.`);
   } catch (e) {
     setMsg(els.voteMsg, "err", `Falha ao obter candidatos: ${e.message}`);
   } finally {
@@ -176,6 +205,14 @@ async function loadCandidates() {
   }
 }
 
+async function waitVoteTicket(ticket) {
+  for (let delay = 250; ; delay = Math.min(delay * 2, 4000)) {
+    const r = await apiGet(`/vote/${encodeURIComponent(ticket)}`);
+    if (r && (r.status === "done" || r.status === "failed")) return r;
+    await new Promise((resolve) => setTimeout(resolve, delay));
+  }
+}
+
 async function doVote() {
   if (!state.credential) {
     setMsg(els.voteMsg, "warn", "Sem credencial. Faça primeiro o registo.");
@@ -193,10 +230,15 @@ async function doVote() {
 
   setMsg(els.voteMsg, null, "A submeter voto...");
   try {
-    const r = await apiPost("/vote", {
+    let r = await apiPost("/vote", {
       voting_credential: state.credential,
       candidate_id: candidateId,
     });
+    if (r.ticket) {
+      // Backend em modo fila (202): consultar o estado do voto até o AV responder.
+      setMsg(els.voteMsg, null, "Voto em fila; a aguardar confirmação...");
+      r = await waitVoteTicket(r.ticket);
+    }
 
     if (r.success === true) {
       state.hasVoted = true;
@@ -213,33 +255,85 @@ async function doVote() {
 }
 
 function renderResults(rows) {
-  els.resTbody.innerHTML = "";
-  for (const r of rows) {
-    const tr = document.createElement("tr");
-
-    const tdId = document.createElement("td");
-    tdId.textContent = String(r.id ?? "");
-    const tdName = document.createElement("td");
-    tdName.textContent = String(r.name ?? "");
-    const tdVotes = document.createElement("td");
-    tdVotes.textContent = String(r.votes ?? "");
-
-    tr.appendChild(tdId);
-    tr.appendChild(tdName);
-    tr.appendChild(tdVotes);
-    els.resTbody.appendChild(tr);
+  // Reaproveita as linhas já existentes: só muda o texto das células que mudaram
+  const trs = els.resTbody.rows;
+  rows.forEach((r, i) => {
+    let tr = trs[i];
+    if (!tr) {
+      tr = els.resTbody.insertRow();
+      for (let c = 0; c < 4; c++) tr.insertCell();
+    }
+    const values = [state.resultsOffset + i + 1, r.id ?? "", r.name ?? "", r.votes ?? ""];
+    values.forEach((v, c) => {
+      const text = String(v);
+      if (tr.cells[c].textContent !== text) tr.cells[c].textContent = text;
+    });
+  });
+  while (trs.length > rows.length) els.resTbody.deleteRow(-1);
+}
+
+function resultsQuery() {
+  return `order=votes&offset=${state.resultsOffset}&limit=${PAGE_SIZE}`;
+}
+
+function applyResults(r) {
+  // Resposta completa (ou página) substitui; resposta delta só traz os candidatos cujos votos mudaram
+  if (!r.delta) state.results = new Map();
+  for (const row of (Array.isArray(r.results) ? r.results : [])) {
+    state.results.set(row.id, row);
+  }
+  state.resultsVersion = r.version ?? null;
+  if (r.total !== undefined) state.resultsTotal = r.total;
+}
+
+function showResults(text) {
+  const rows = Array.from(state.results.values());
+  renderResults(rows);
+
+  els.resTable.style.display = rows.length ? "table" : "none";
+  els.resPager.style.display = state.resultsTotal > PAGE_SIZE ? "flex" : "none";
+  els.btnResPrev.disabled = state.resultsOffset === 0;
+  els.btnResNext.disabled = state.resultsOffset + PAGE_SIZE >= state.resultsTotal;
+  const first = rows.length ? state.resultsOffset + 1 : 0;
+  setMsg(els.resMsg, "ok",
+    `${text}: ${first}–${state.resultsOffset + rows.length} de ${state.resultsTotal} candidatos (por votos).`);
+}
+
+function watchResults() {
+  // Atualizações enviadas pelo backend (Server-Sent Events) só para a página visível; sem EventSource fica o botão.
+  if (resultsStream || !window.EventSource) return;
+  resultsStream = new EventSource(`${BACKEND_URL}/results/stream?${resultsQuery()}`);
+  resultsStream.addEventListener("results", (ev) => {
+    const r = JSON.parse(ev.data);
+    // Ignora versões mais antigas do que a já obtida por /results
+    if (state.resultsVersion !== null && r.version <= state.resultsVersion) return;
+    applyResults(r);
+    showResults("Resultados em tempo real");
+  });
+  resultsStream.addEventListener("error", () => {
+    // O browser volta a ligar sozinho (com Last-Event-ID); só desiste se o backend recusar o stream.
+    if (resultsStream && resultsStream.readyState === EventSource.CLOSED) {
+      resultsStream = null;
+    }
+  });
+}
+
+function stopResultsStream() {
+  if (resultsStream) {
+    resultsStream.close();
+    resultsStream = null;
   }
 }
 
 async function loadResults() {
   setMsg(els.resMsg, null, "A obter resultados...");
   try {
-    const r = await apiGet("/results");
-    const rows = Array.isArray(r.results) ? r.results : [];
-    renderResults(rows);
+    const since = state.resultsVersion !== null ? `&since=${state.resultsVersion}` : "";
+    const r = await apiGet(`/results?${resultsQuery()}${since}`);
 
-    els.resTable.style.display = rows.length ? "table" : "none";
-    setMsg(els.resMsg, "ok", `Resultados carregados: ${rows.length} candidatos.`);
+    if (r) applyResults(r);
+    showResults("Resultados carregados");
+    watchResults();
   } catch (e) {
     els.resTable.style.display = "none";
     setMsg(els.resMsg, "err", `Falha ao obter resultados: ${e.message}`);
@@ -248,17 +342,37 @@ async function loadResults() {
   }
 }
 
+function showResultsPage(offset) {
+  // Outra página: novo pedido e novo stream (a versão conhecida é da página anterior)
+  state.resultsOffset = Math.max(0, offset);
+  state.resultsVersion = null;
+  stopResultsStream();
+  loadResults();
+}
+
+function searchCandidates() {
+  clearTimeout(candidateSearchTimer);
+  candidateSearchTimer = setTimeout(loadCandidates, 250);
+}
+
 function clearSession() {
   sessionStorage.removeItem("vs_credential");
   sessionStorage.removeItem("vs_hasVoted");
   state.credential = null;
   state.hasVoted = false;
   state.candidates = [];
+  stopResultsStream();
+  state.results = new Map();
+  state.resultsVersion = null;
+  state.resultsOffset = 0;
+  state.resultsTotal = 0;
+  els.candidateQ.value = "";
   els.candidate.innerHTML = `<option value="">(carregar candidatos)</option>`;
   setMsg(els.regMsg, null, "Sessão limpa. Pode iniciar novo registo.");
   setMsg(els.voteMsg, null, "Sem ações de votação.");
   setMsg(els.resMsg, null, "Sem resultados carregados.");
   els.resTable.style.display = "none";
+  els.resPager.style.display = "none";
   syncUI();
 }
 
@@ -267,6 +381,9 @@ els.btnRegister.addEventListener("click", doRegister);
 els.btnLoadCandidates.addEventListener("click", loadCandidates);
 els.btnVote.addEventListener("click", doVote);
 els.btnResults.addEventListener("click", loadResults);
+els.btnResPrev.addEventListener("click", () => showResultsPage(state.resultsOffset - PAGE_SIZE));
+els.btnResNext.addEventListener("click", () => showResultsPage(state.resultsOffset + PAGE_SIZE));
+els.candidateQ.addEventListener("input", searchCandidates);
 els.btnClear.addEventListener("click", clearSession);
 
 els.candidate.addEventListener("change", () => syncUI());
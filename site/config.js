@@ -35,14 +35,20 @@
     host === "127.0.0.1" ||
     host === "localhost";
 
+  // Servido pelo próprio backend (SERVE_SITE=1): a API está na mesma origem da página.
+  const meta = document.querySelector('meta[name="backend-url"]');
+  const sameOrigin = !!meta && meta.content === "same-origin";
+
   window.APP_CONFIG = {
     // Local: backend a correr com uvicorn
-    BACKEND_URL: isLocal ? "http://127.0.0.1:8000" : "https://andremaciel.pt",
+    BACKEND_URL: sameOrigin
+      ? window.location.origin
+      : (isLocal ? "http://127.0.0.1:8000" : "https://andremaciel.pt"),
 
     // Usado pelo frontend para mostrar a nota online (link “humano”)
     GITHUB_REPO_URL: "https://github.com/AndreMacielSousa/VotingSystem-App",
 
     // Flag para o UI mostrar um aviso explícito no ambiente online
-    IS_ONLINE_DEMO: !isLocal
+    IS_ONLINE_DEMO: !isLocal && !sameOrigin
   };
 })();